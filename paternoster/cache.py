@@ -0,0 +1,100 @@
+# helpers for caches kept on disk between invocations of a script.
+#
+# Cached data is read by the unprivileged part of a script as well, so it must
+# never come from the user running it: entries are only written by root and
+# only trusted, if both the entry and the directory containing it are owned by
+# root and not writable by anyone else. Everything else is treated as a miss.
+from __future__ import absolute_import
+
+import errno
+import os
+import stat
+import tempfile
+
+CACHE_DIR = '/var/cache/paternoster'
+
+
+def _is_trusted(st):
+    return st.st_uid == 0 and not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+def can_write():
+    return os.geteuid() == 0
+
+
+def get_dir(name):
+    """
+    Return the path of the cache directory *name* or `None`, if it cannot
+    be trusted. The directory is created, if the current process is root.
+
+    """
+    path = os.path.join(CACHE_DIR, name)
+
+    if can_write():
+        try:
+            os.makedirs(path, 0o755)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                return None
+
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return None
+
+    if not stat.S_ISDIR(st.st_mode) or not _is_trusted(st):
+        return None
+    return path
+
+
+def open_entry(directory, name):
+    """ return the cache entry *name* opened for reading (binary) or `None` on a miss """
+    flags = os.O_RDONLY | getattr(os, 'O_NOFOLLOW', 0)
+    try:
+        fd = os.open(os.path.join(directory, name), flags)
+    except OSError:
+        return None
+
+    f = os.fdopen(fd, 'rb')
+    st = os.fstat(f.fileno())
+    if not stat.S_ISREG(st.st_mode) or not _is_trusted(st):
+        f.close()
+        return None
+    return f
+
+
+def read(directory, name):
+    """ return the content of the cache entry *name* or `None` on a miss """
+    f = open_entry(directory, name)
+    if f is None:
+        return None
+
+    with f:
+        return f.read()
+
+
+def write(directory, name, data, mode=0o644):
+    """
+    Atomically replace the cache entry *name* with *data*, if the current
+    process is root. Entries, which might contain data only root may read,
+    must use a *mode* of 0o600.
+
+    """
+    if not can_write():
+        return False
+
+    tmppath = None
+    try:
+        fd, tmppath = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmppath, mode)
+        os.rename(tmppath, os.path.join(directory, name))
+    except EnvironmentError:
+        if tmppath is not None:
+            try:
+                os.unlink(tmppath)
+            except OSError:
+                pass
+        return False
+    return True
@@ -0,0 +1,122 @@
+# talks to paternoster-daemon (see daemon.py) on behalf of a script, which
+# has its "daemon_socket" option set. The daemon identifies the calling user
+# through the socket itself, so no sudo is needed to run the playbook.
+from __future__ import absolute_import
+from __future__ import print_function
+
+import json
+import os
+import socket
+import struct
+import sys
+
+# every message is prefixed with its length. Requests are a single JSON
+# message, responses a stream of frames, each tagged with its channel.
+_LENGTH = struct.Struct('!I')
+_FRAME = struct.Struct('!cI')
+_STATUS = struct.Struct('!i')
+
+STDOUT = b'o'
+STDERR = b'e'
+EXIT = b'x'
+
+# seconds to wait for the daemon to accept a request, the playbook itself
+# may take as long as it needs.
+CONNECT_TIMEOUT = 10
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def send_message(sock, data):
+    payload = json.dumps(data).encode('utf-8')
+    sock.sendall(_LENGTH.pack(len(payload)) + payload)
+
+
+def recv_message(sock, maxsize=1024 * 1024):
+    header = _recv_exactly(sock, _LENGTH.size)
+    if header is None:
+        return None
+    size, = _LENGTH.unpack(header)
+    if size > maxsize:
+        raise ValueError('message too big')
+    payload = _recv_exactly(sock, size)
+    if payload is None:
+        return None
+    return json.loads(payload.decode('utf-8'))
+
+
+def send_frame(sock, channel, data):
+    sock.sendall(_FRAME.pack(channel, len(data)) + data)
+
+
+def send_status(sock, status):
+    send_frame(sock, EXIT, _STATUS.pack(status))
+
+
+def recv_frame(sock):
+    header = _recv_exactly(sock, _FRAME.size)
+    if header is None:
+        return (None, None)
+    channel, size = _FRAME.unpack(header)
+    data = _recv_exactly(sock, size) if size else b''
+    if data is None:
+        return (None, None)
+    return (channel, data)
+
+
+def _binary(stream):
+    return getattr(stream, 'buffer', stream)
+
+
+def submit(socket_path, argv):
+    """
+    Run the current script (`sys.argv[0]`) with the arguments *argv* through
+    the daemon listening on *socket_path*.
+
+    The output of the playbook is written to stdout and stderr as it arrives.
+    Returns the exit code of the run or `None`, if the daemon cannot be
+    reached (e.g. it is not running or the socket may not be used).
+
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(CONNECT_TIMEOUT)
+    try:
+        try:
+            sock.connect(socket_path)
+        except socket.error:
+            return None
+
+        send_message(sock, {
+            'script': os.path.realpath(sys.argv[0]),
+            'argv': list(argv),
+        })
+        sock.settimeout(None)
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+        streams = {
+            STDOUT: _binary(sys.stdout),
+            STDERR: _binary(sys.stderr),
+        }
+
+        while True:
+            channel, data = recv_frame(sock)
+            if channel == EXIT:
+                return _STATUS.unpack(data)[0]
+            elif channel in streams:
+                streams[channel].write(data)
+                streams[channel].flush()
+            else:
+                print('lost connection to paternoster-daemon', file=sys.stderr)
+                return 1
+    finally:
+        sock.close()
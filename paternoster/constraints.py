@@ -0,0 +1,161 @@
+# the rules between parameters (depends_on, mutually_exclusive and
+# required_one_of) are compiled into bitmasks over the parameter indexes.
+# Checking the arguments then takes a single pass over the parameters to find
+# out which ones were given, followed by a few bit operations per rule.
+#
+# Rules, which can never be satisfied, are rejected right away, so mistakes
+# in a script show up when it is loaded, not when a user happens to hit them.
+from __future__ import absolute_import
+
+
+def _several(mask):
+    """ return whether more than one bit is set in *mask* """
+    return bool(mask & (mask - 1))
+
+
+def _args(names):
+    return ', '.join('--' + name for name in names)
+
+
+class Constraints(object):
+    def __init__(self, spec, mutually_exclusive=None, required_one_of=None):
+        self._names = []
+        self._bits = {}
+        self._attrs = []
+        for param in spec.parameters:
+            name = param['name']
+            if name in self._bits:
+                continue
+            self._bits[name] = 1 << len(self._names)
+            self._names.append(name)
+            self._attrs.append((name.replace('-', '_'), self._bits[name]))
+
+        self._spec = spec
+        self._dependencies = []
+        self._mutually_exclusive = []
+        self._required_one_of = []
+
+        depends_on = {}
+        required = 0
+        for param in spec.parameters:
+            if 'depends_on' in param:
+                name = param['name']
+                dependency = self._resolve(param['depends_on'], 'depends_on of --' + name)
+                depends_on[name] = dependency
+                self._dependencies.append((self._bits[name], self._bits[dependency], name, dependency))
+            if param.get('required', False) or param.get('positional', False):
+                required |= self._bits[param['name']]
+
+        for group in mutually_exclusive or []:
+            self._mutually_exclusive.append(self._compile_group(group, 'mutually_exclusive'))
+
+        for group in required_one_of or []:
+            mask, members = self._compile_group(group, 'required_one_of')
+            if not mask:
+                raise ValueError('required_one_of contains an empty group')
+            if not _several(mask):
+                # a group with a single parameter simply makes it required.
+                required |= mask
+            self._required_one_of.append((mask, members))
+
+        self._check_satisfiable(depends_on, required)
+
+    def _resolve(self, name, where):
+        try:
+            return self._spec.find(name)['name']
+        except KeyError:
+            raise ValueError('unknown parameter {} in {}'.format(name, where))
+
+    def _compile_group(self, group, where):
+        """ return the mask of the parameters in *group* and a list of their bits and names """
+        mask = 0
+        members = []
+        for name in group:
+            name = self._resolve(name, where)
+            mask |= self._bits[name]
+            members.append((self._bits[name], name))
+        return mask, members
+
+    def _names_of(self, mask):
+        return [name for name in self._names if mask & self._bits[name]]
+
+    def _closures(self, depends_on):
+        """ return a mask of each parameter and everything it (indirectly) depends on """
+        closures = {}
+        for name in self._names:
+            chain = []
+            current = name
+            mask = 0
+            while current is not None:
+                if current in closures:
+                    mask = closures[current]
+                    break
+                if current in chain:
+                    cycle = chain[chain.index(current):] + [current]
+                    raise ValueError('cyclic dependency: ' + ' -> '.join('--' + n for n in cycle))
+                chain.append(current)
+                current = depends_on.get(current)
+
+            for current in reversed(chain):
+                mask |= self._bits[current]
+                closures[current] = mask
+        return closures
+
+    def _conflict(self, mask):
+        """ return the mutually exclusive parameters, which are all part of *mask* """
+        for group, _ in self._mutually_exclusive:
+            if _several(mask & group):
+                return mask & group
+        return 0
+
+    def _check_satisfiable(self, depends_on, required):
+        closures = self._closures(depends_on)
+
+        # required parameters have to be given, and so do their dependencies.
+        forced = 0
+        for name in self._names_of(required):
+            forced |= closures[name]
+
+        conflict = self._conflict(forced)
+        if conflict:
+            raise ValueError('arguments {} are mutually exclusive, but all of them are required'.format(
+                _args(self._names_of(conflict)),
+            ))
+
+        for name in self._names:
+            if not _several(closures[name] | forced):
+                continue
+            conflict = self._conflict(closures[name] | forced)
+            if conflict:
+                raise ValueError('argument --{} can never be given, because {} are mutually exclusive'.format(
+                    name, _args(self._names_of(conflict)),
+                ))
+
+    def given(self, args):
+        """ return a mask of all parameters given in *args* """
+        mask = 0
+        for attr, bit in self._attrs:
+            if getattr(args, attr):
+                mask |= bit
+        return mask
+
+    def check(self, args):
+        """ return a list of all rules violated by *args* """
+        given = self.given(args)
+        errors = []
+
+        for bit, dependency, name, dependency_name in self._dependencies:
+            if given & bit and not given & dependency:
+                errors.append('argument --{} requires --{} to be present.'.format(name, dependency_name))
+
+        for group, members in self._mutually_exclusive:
+            if _several(given & group):
+                errors.append('arguments {} are mutually exclusive.'.format(
+                    _args(name for bit, name in members if given & bit),
+                ))
+
+        for group, members in self._required_one_of:
+            if not given & group:
+                errors.append('at least one of {} is needed.'.format(_args(name for _, name in members)))
+
+        return errors
@@ -0,0 +1,334 @@
+# paternoster-daemon keeps ansible and the configuration of a set of scripts
+# loaded, so they can be run without paying for sudo, a new interpreter and
+# the ansible imports on every invocation. Scripts hand their (already
+# validated) arguments over a unix socket, if their "daemon_socket" option
+# is set. See client.py for the other side.
+#
+# The calling user is identified using SO_PEERCRED, which is filled in by
+# the kernel. Just like the sudoers rule of a script, the daemon only serves
+# the users and groups it is told to allow (and root), everyone else is
+# turned away before anything is read or run. Everything sent by the client is
+# validated again, just like arguments given to a script started by sudo. Each request is handled by
+# a forked process, so ansible always starts with a clean state. Requests
+# are accepted by a pool of pre-forked workers (see forkserver.py).
+from __future__ import absolute_import
+from __future__ import print_function
+
+import argparse
+import errno
+import grp
+import io
+import os
+import pwd
+import re
+import select
+import socket
+import struct
+import sys
+import traceback
+
+import six
+
+from . import client
+from . import shebang
+from . import types
+from .forkserver import ForkServer
+from .root import USERNAME_REGEX
+from .runners.ansiblerunner import AnsibleRunner
+
+DEFAULT_SOCKET = '/run/paternoster.sock'
+DEFAULT_WORKERS = 4
+# seconds a client may take to send its request, so idle connections do not
+# keep a worker busy.
+REQUEST_TIMEOUT = 10
+
+# modules every request needs, the runner imports its own (see preload).
+PRELOAD_MODULES = ('yaml', 'tldextract', 'paternoster.types')
+
+_PEERCRED = struct.Struct('3i')
+
+
+def _peer_credentials(conn):
+    """ return the uid and gid of the process connected through *conn* """
+    creds = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, _PEERCRED.size)
+    pid, uid, gid = _PEERCRED.unpack(creds)
+    return uid, gid
+
+
+def _reopen_stdio():
+    """ re-create sys.stdout/stderr on top of fd 1 and 2, line buffered """
+    if six.PY2:
+        sys.stdout = os.fdopen(1, 'w', 1)
+        sys.stderr = os.fdopen(2, 'w', 0)
+    else:
+        sys.stdout = io.open(1, 'w', buffering=1, encoding='utf-8', closefd=False)
+        sys.stderr = io.open(2, 'w', buffering=1, encoding='utf-8', closefd=False)
+
+
+def _relay(conn, channels):
+    """ forward everything read from the fds in *channels* to *conn*, until all of them are closed """
+    connected = True
+    while channels:
+        readable, _, _ = select.select(list(channels), [], [])
+        for fd in readable:
+            data = os.read(fd, 65536)
+            if not data:
+                os.close(fd)
+                del channels[fd]
+            elif connected:
+                try:
+                    client.send_frame(conn, channels[fd], data)
+                except socket.error:
+                    # the client went away, but the playbook has to finish
+                    # nevertheless. Keep draining its output.
+                    connected = False
+    return connected
+
+
+class ScriptError(Exception):
+    pass
+
+
+class Daemon(object):
+    def __init__(self, socket_path, scripts, runner_class=AnsibleRunner, allow=()):
+        self._socket_path = socket_path
+        self._runner_class = runner_class
+        self._scripts = {}
+        self._listener = None
+        # the users and groups (given as %name, like in sudoers) which may
+        # run the scripts, by uid and gid
+        self._allowed_users = set()
+        self._allowed_groups = set()
+
+        for name in allow:
+            if name.startswith('%'):
+                self._allowed_groups.add(self._get_group(name[1:]).gr_gid)
+            else:
+                self._allowed_users.add(self._get_user(name).pw_uid)
+
+        for path in scripts:
+            self._load_script(os.path.realpath(path))
+
+    @staticmethod
+    def _get_user(name):
+        try:
+            return pwd.getpwnam(name)
+        except KeyError:
+            raise ValueError('unknown user: "{}"'.format(name))
+
+    @staticmethod
+    def _get_group(name):
+        try:
+            return grp.getgrnam(name)
+        except KeyError:
+            raise ValueError('unknown group: "{}"'.format(name))
+
+    def is_allowed(self, uid, gid):
+        """ return whether the user *uid*, running with the group *gid*, may run scripts through the daemon """
+        if uid == 0 or uid in self._allowed_users:
+            return True
+        if gid in self._allowed_groups:
+            return True
+
+        try:
+            user = pwd.getpwuid(uid)
+        except KeyError:
+            return False
+        if user.pw_gid in self._allowed_groups:
+            return True
+        for gr_gid in self._allowed_groups:
+            try:
+                if user.pw_name in grp.getgrgid(gr_gid).gr_mem:
+                    return True
+            except KeyError:
+                pass
+        return False
+
+    @staticmethod
+    def _stat(path):
+        st = os.stat(path)
+        return (st.st_dev, st.st_ino, st.st_mtime, st.st_size)
+
+    def _load_script(self, path):
+        stat = self._stat(path)
+        config = shebang.load_config(path)
+
+        if not config.get('become_user'):
+            # the daemon would run the script with its own privileges
+            # instead of the ones of the calling user.
+            raise ValueError('{} does not set become_user and cannot be served by the daemon'.format(path))
+
+        # parse the playbook once, instead of in every forked request.
+        load_plays = getattr(self._runner_class, 'load_plays', None)
+        plays = load_plays(path) if load_plays else None
+
+        paternoster = shebang.create_paternoster(path, config, plays=plays, runner_class=self._runner_class)
+        self._scripts[path] = (stat, paternoster)
+        return paternoster
+
+    def _get_script(self, path):
+        """ return the Paternoster instance for *path*, reloading it if the script has changed """
+        if path not in self._scripts:
+            raise ScriptError('{} is not served by this daemon'.format(path))
+
+        stat, paternoster = self._scripts[path]
+        if stat != self._stat(path):
+            paternoster = self._load_script(path)
+        return paternoster
+
+    def _listen(self):
+        try:
+            os.unlink(self._socket_path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self._socket_path)
+        # any user may connect, the allowed users are checked per request.
+        os.chmod(self._socket_path, 0o666)
+        listener.listen(socket.SOMAXCONN)
+        return listener
+
+    def preload(self):
+        """ import everything needed to run a playbook, so forked requests do not have to """
+        preload = getattr(self._runner_class, 'preload', None)
+        if preload:
+            preload()
+
+        # load the public suffix list once, instead of in every request
+        # validating a domain.
+        types.preload_suffixes()
+
+    def serve_forever(self, workers=DEFAULT_WORKERS, max_requests=None):
+        self.preload()
+        self._listener = self._listen()
+        ForkServer(
+            self._listener, self.handle,
+            workers=workers, max_requests=max_requests, preload=PRELOAD_MODULES,
+        ).serve_forever()
+
+    def handle(self, conn):
+        """ process a single request sent through *conn* """
+        try:
+            conn.settimeout(REQUEST_TIMEOUT)
+            uid, gid = _peer_credentials(conn)
+            if not self.is_allowed(uid, gid):
+                raise ScriptError('you are not allowed to run scripts through paternoster-daemon')
+            request = client.recv_message(conn)
+            if request is None:
+                return
+            # the playbook may run for a long time without any output.
+            conn.settimeout(None)
+            client.send_status(conn, self._run(conn, request, uid))
+        except (ScriptError, ValueError, KeyError, AssertionError, EnvironmentError) as e:
+            # a script may have been removed or broken since it was loaded,
+            # the worker has to survive that (and clients going away).
+            try:
+                client.send_frame(conn, client.STDERR, (str(e) + '\n').encode('utf-8'))
+                client.send_status(conn, 1)
+            except socket.error:
+                pass
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _parse_request(request):
+        """ return the path of the script and the arguments sent by the client """
+        if not isinstance(request, dict):
+            raise ScriptError('invalid request')
+        path = request.get('script')
+        argv = request.get('argv')
+        if (
+            not isinstance(path, six.string_types)
+            or not isinstance(argv, list)
+            or not all(isinstance(arg, six.string_types) for arg in argv)
+        ):
+            raise ScriptError('invalid request')
+        return path, argv
+
+    def _run(self, conn, request, uid):
+        path, argv = self._parse_request(request)
+        paternoster = self._get_script(path)
+
+        user = pwd.getpwuid(uid).pw_name
+        if not re.match(USERNAME_REGEX, user):
+            raise ScriptError('invalid username: "{}"'.format(user))
+
+        out_r, out_w = os.pipe()
+        err_r, err_w = os.pipe()
+
+        pid = os.fork()
+        if pid == 0:
+            conn.close()
+            if self._listener:
+                self._listener.close()
+            os.close(out_r)
+            os.close(err_r)
+            os._exit(self._execute(paternoster, path, argv, user, out_w, err_w))
+
+        os.close(out_w)
+        os.close(err_w)
+        _relay(conn, {out_r: client.STDOUT, err_r: client.STDERR})
+
+        _, status = os.waitpid(pid, 0)
+        return os.WEXITSTATUS(status) if os.WIFEXITED(status) else 1
+
+    def _execute(self, paternoster, path, argv, user, out_fd, err_fd):
+        """ run the playbook in a forked child, with its output going to *out_fd* and *err_fd* """
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.dup2(out_fd, 1)
+        os.dup2(err_fd, 2)
+        os.close(devnull)
+        os.close(out_fd)
+        os.close(err_fd)
+        _reopen_stdio()
+
+        sys.argv = [path]
+        try:
+            status = paternoster.serve(argv, user)
+        except SystemExit as e:
+            status = e.code if isinstance(e.code, int) else 1
+        except Exception:
+            traceback.print_exc()
+            status = 1
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+        return status
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Serve paternoster scripts over a unix socket.',
+    )
+    parser.add_argument(
+        '-s', '--socket', default=DEFAULT_SOCKET,
+        help='path of the unix socket to listen on (default: %(default)s)',
+    )
+    parser.add_argument(
+        '-w', '--workers', type=int, default=DEFAULT_WORKERS,
+        help='number of requests to handle at the same time (default: %(default)s)',
+    )
+    parser.add_argument(
+        '-m', '--max-requests', type=int, default=None,
+        help='replace each worker process after this many requests (default: never)',
+    )
+    parser.add_argument(
+        '-a', '--allow', action='append', default=[], metavar='USER',
+        help='user (or %%group) allowed to run the scripts, can be given more than once (default: root only)',
+    )
+    parser.add_argument(
+        'scripts', nargs='+', metavar='script',
+        help='paternoster scripts, which may be run through the daemon',
+    )
+    args = parser.parse_args()
+
+    try:
+        daemon = Daemon(args.socket, args.scripts, allow=args.allow)
+    except (ValueError, AssertionError, EnvironmentError) as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+
+    daemon.serve_forever(workers=args.workers, max_requests=args.max_requests)
@@ -0,0 +1,100 @@
+# a pre-forking server: the master process imports everything expensive
+# once and then forks a fixed number of workers, which share these imports
+# (copy-on-write) and accept connections from a common listening socket.
+# Workers are replaced after a configurable number of requests, so state
+# piling up within them does not live forever.
+#
+# It needs a long-running master process, so it is only used by
+# paternoster-daemon (see daemon.py). Scripts run through sudo start a new
+# interpreter for every run and do not benefit from it.
+from __future__ import absolute_import
+
+import errno
+import gc
+import importlib
+import os
+import signal
+import socket
+
+
+class ForkServer(object):
+    def __init__(self, listener, handler, workers=4, max_requests=None, preload=()):
+        if workers < 1:
+            raise ValueError('at least one worker is needed')
+        if max_requests is not None and max_requests < 1:
+            raise ValueError('max_requests must be positive')
+
+        self._listener = listener
+        self._handler = handler
+        self._size = workers
+        self._max_requests = max_requests
+        self._preload = preload
+        self._workers = set()
+        self._stopping = False
+
+    def preload(self):
+        for module in self._preload:
+            importlib.import_module(module)
+
+        # objects created so far are shared by all workers. Keep the garbage
+        # collector from touching (and thereby copying) them.
+        if hasattr(gc, 'freeze'):  # Python 3.7+
+            gc.collect()
+            gc.freeze()
+
+    def _spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            try:
+                self._work()
+            finally:
+                os._exit(0)
+        self._workers.add(pid)
+
+    def _work(self):
+        served = 0
+        while self._max_requests is None or served < self._max_requests:
+            try:
+                conn, _ = self._listener.accept()
+            except socket.error as e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+
+            try:
+                self._handler(conn)
+            finally:
+                conn.close()
+            served += 1
+
+    def _terminate(self, signum, frame):
+        # the exception is swallowed, if the signal arrives while os.fork()
+        # runs its at-fork hooks. The flag is checked after every fork.
+        self._stopping = True
+        raise SystemExit(0)
+
+    def serve_forever(self):
+        self.preload()
+        signal.signal(signal.SIGTERM, self._terminate)
+
+        try:
+            while not self._stopping:
+                while len(self._workers) < self._size and not self._stopping:
+                    self._spawn()
+                if self._stopping:
+                    break
+
+                try:
+                    pid, _ = os.wait()
+                except OSError as e:
+                    if e.errno == errno.EINTR:
+                        continue
+                    raise
+                self._workers.discard(pid)
+        finally:
+            for pid in self._workers:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except OSError:
+                    pass
@@ -0,0 +1,112 @@
+# hands the arguments, which were validated (and prompted for) by the
+# unprivileged process, over to the privileged one started by sudo.
+#
+# The arguments are passed through an inherited file descriptor instead
+# of the command line, so prompted values like passwords never show up in
+# the process list and are not prompted for twice. That is all the handoff
+# saves: the privileged process does not trust anything it reads here, the
+# arguments are parsed and validated again, just like the ones given on the
+# command line.
+#
+# The checksum is computed by the unprivileged process, which could just as
+# well write anything else. It is not a security boundary, it only catches
+# handoffs, which are truncated or were left behind by a different script.
+#
+# sudo is told about the handoff through HANDOFF_OPTION, which becomes the
+# first argument of the privileged process. Without it (e.g. root running the
+# script directly), the descriptor is none of paternoster's business and left
+# alone.
+from __future__ import absolute_import
+
+import hashlib
+import hmac
+import json
+import os
+import stat
+import sys
+import tempfile
+
+HANDOFF_FD = 3
+HANDOFF_OPTION = '--paternoster-handoff'
+
+
+def _script_id():
+    path = os.path.realpath(sys.argv[0])
+    st = os.stat(path)
+    return [path, st.st_dev, st.st_ino, st.st_mtime, st.st_size]
+
+
+def _digest(payload):
+    return hashlib.sha256(payload).hexdigest().encode('ascii')
+
+
+def prepare(argv):
+    """
+    Write *argv* to `HANDOFF_FD`, so it can be read by :func:`receive` after
+    the current process has been replaced using `exec`.
+
+    """
+    payload = json.dumps({'script': _script_id(), 'argv': list(argv)}).encode('utf-8')
+
+    fd, path = tempfile.mkstemp(prefix='paternoster-handoff-')
+    try:
+        os.unlink(path)
+        os.write(fd, _digest(payload) + b'\n' + payload)
+        os.lseek(fd, 0, os.SEEK_SET)
+        if fd != HANDOFF_FD:
+            os.dup2(fd, HANDOFF_FD)
+    finally:
+        if fd != HANDOFF_FD:
+            os.close(fd)
+
+    if hasattr(os, 'set_inheritable'):  # Python 3
+        os.set_inheritable(HANDOFF_FD, True)
+
+    return HANDOFF_FD
+
+
+def receive():
+    """
+    Return the argv written by :func:`prepare` or `None`, if no handoff
+    was passed to this process by sudo (see :func:`paternoster.root.become_user`).
+    `HANDOFF_OPTION` is removed from `sys.argv`.
+
+    The argv still has to be parsed and validated, as it comes from the
+    unprivileged process.
+
+    Raises:
+        ValueError: if the handoff is missing, corrupted or was prepared for another script.
+
+    """
+    if sys.argv[1:2] != [HANDOFF_OPTION] or 'SUDO_USER' not in os.environ:
+        return None
+    del sys.argv[1]
+
+    try:
+        st = os.fstat(HANDOFF_FD)
+    except OSError:
+        raise ValueError('argument handoff is missing')
+
+    if not stat.S_ISREG(st.st_mode):
+        raise ValueError('argument handoff is missing')
+
+    chunks = []
+    try:
+        os.lseek(HANDOFF_FD, 0, os.SEEK_SET)
+        while True:
+            chunk = os.read(HANDOFF_FD, 65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        os.close(HANDOFF_FD)
+
+    digest, _, payload = b''.join(chunks).partition(b'\n')
+    if not hmac.compare_digest(digest, _digest(payload)):
+        raise ValueError('argument handoff is corrupted')
+
+    data = json.loads(payload.decode('utf-8'))
+    if data.get('script') != _script_id():
+        raise ValueError('argument handoff belongs to a different script')
+
+    return data['argv']
@@ -0,0 +1,347 @@
+# a regular expression engine, which matches in linear time. It is used by
+# restricted_str(linear=True), so a badly written pattern in a script cannot
+# make python's backtracking engine spin on crafted user input.
+#
+# Patterns are parsed into a small syntax tree and compiled into a Thompson
+# NFA. Matching simulates all NFA states at once, one character at a time, so
+# it takes at most O(len(value) * len(pattern)) steps. Sets of NFA states are
+# turned into DFA states lazily, so most steps only cost a dictionary lookup.
+# The number of cached DFA states is bounded, the cache is simply flushed once
+# it is full.
+#
+# Only the regular subset of python's syntax is supported: literals, escapes,
+# ".", character classes, groups, alternatives and greedy or lazy quantifiers.
+# Everything else (backreferences, lookarounds, anchors within the pattern,
+# inline flags, possessive quantifiers, ...) is rejected when the pattern is
+# compiled. Character classes and escapes are tested using python's re module
+# (on a single character), so they have exactly the same meaning as usual.
+from __future__ import absolute_import
+
+import re
+
+MAX_REPEAT = 1000
+MAX_STATES = 10000
+MAX_DFA_STATES = 1000
+
+_CHAR, _CLASS, _SPLIT, _MATCH = range(4)
+
+_BRACES = re.compile(r'\{(\d*)(,(\d*))?\}')
+_CLASS_ESCAPES = 'dDwWsS'
+_ANCHOR_ESCAPES = 'AZbBz'
+_HEX_ESCAPES = {'x': 2, 'u': 4, 'U': 8}
+
+
+class _Parser(object):
+    """
+    Parses a pattern into a tree of tuples: ('char', c), ('class', compiled),
+    ('cat', [nodes]), ('alt', [nodes]) and ('repeat', node, min, max), where
+    max is `None` for unbounded repetitions.
+
+    """
+
+    def __init__(self, pattern):
+        self._pattern = pattern
+        self._pos = 0
+
+    def _error(self, message, pos=None):
+        return ValueError('{} at position {} of the regex'.format(message, self._pos if pos is None else pos))
+
+    def _peek(self):
+        return self._pattern[self._pos] if self._pos < len(self._pattern) else None
+
+    def _next(self):
+        char = self._peek()
+        self._pos += 1
+        return char
+
+    def parse(self):
+        node = self._alternatives()
+        if self._pos < len(self._pattern):
+            raise self._error('unbalanced parenthesis')
+        return node
+
+    def _alternatives(self):
+        alternatives = [self._sequence()]
+        while self._peek() == '|':
+            self._pos += 1
+            alternatives.append(self._sequence())
+        return alternatives[0] if len(alternatives) == 1 else ('alt', alternatives)
+
+    def _sequence(self):
+        items = []
+        while self._peek() not in (None, '|', ')'):
+            items.append(self._quantified(self._atom()))
+        return ('cat', items)
+
+    def _quantified(self, atom):
+        bounds = self._quantifier()
+        if bounds is None:
+            return atom
+
+        if self._peek() == '?':
+            # lazy quantifiers accept the same values as greedy ones
+            self._pos += 1
+        elif self._peek() == '+':
+            raise self._error('possessive quantifiers are not supported')
+        if self._quantifier_follows():
+            raise self._error('multiple repeat')
+
+        minimum, maximum = bounds
+        if max(minimum, maximum or 0) > MAX_REPEAT:
+            raise self._error('repetitions are limited to {}'.format(MAX_REPEAT))
+        return ('repeat', atom, minimum, maximum)
+
+    def _quantifier(self):
+        """ consume a quantifier and return its bounds, or `None` if there is none """
+        char = self._peek()
+        if char == '*':
+            self._pos += 1
+            return 0, None
+        if char == '+':
+            self._pos += 1
+            return 1, None
+        if char == '?':
+            self._pos += 1
+            return 0, 1
+        if char != '{':
+            return None
+
+        # just like in python, braces which do not form a quantifier are literals
+        match = _BRACES.match(self._pattern, self._pos)
+        if not match or match.group(0) == '{}':
+            return None
+
+        minimum = int(match.group(1) or 0)
+        if match.group(2) is None:
+            maximum = minimum
+        else:
+            maximum = int(match.group(3)) if match.group(3) else None
+        if maximum is not None and maximum < minimum:
+            raise self._error('min repeat greater than max repeat')
+
+        self._pos = match.end()
+        return minimum, maximum
+
+    def _quantifier_follows(self):
+        start = self._pos
+        try:
+            return self._quantifier() is not None
+        finally:
+            self._pos = start
+
+    def _atom(self):
+        if self._quantifier_follows():
+            raise self._error('nothing to repeat')
+
+        char = self._next()
+        if char == '(':
+            return self._group()
+        if char == '[':
+            return self._class()
+        if char == '.':
+            return ('class', _compile_single('.'))
+        if char in ('^', '$'):
+            raise self._error('anchors are only supported at the start and end', self._pos - 1)
+        if char == '\\':
+            return self._escape()
+        return ('char', char)
+
+    def _group(self):
+        if self._peek() == '?':
+            if self._pattern.startswith('?:', self._pos):
+                self._pos += 2
+            elif self._pattern.startswith('?P<', self._pos):
+                end = self._pattern.find('>', self._pos)
+                if end < 0:
+                    raise self._error('missing >, unterminated name')
+                self._pos = end + 1
+            else:
+                raise self._error('only plain, non-capturing and named groups are supported', self._pos - 1)
+
+        node = self._alternatives()
+        if self._next() != ')':
+            raise self._error('missing ), unterminated subpattern')
+        return node
+
+    def _class(self):
+        start = self._pos - 1
+        if self._peek() == '^':
+            self._pos += 1
+        if self._peek() == ']':
+            # a leading bracket is part of the class
+            self._pos += 1
+
+        while True:
+            char = self._next()
+            if char is None:
+                raise self._error('unterminated character set', start)
+            if char == '\\':
+                self._pos += 1
+            elif char == ']':
+                break
+
+        return ('class', _compile_single(self._pattern[start:self._pos]))
+
+    def _escape(self):
+        start = self._pos - 1
+        char = self._next()
+
+        if char is None:
+            raise self._error('bad escape (end of pattern)', start)
+        if char in _ANCHOR_ESCAPES:
+            raise self._error('anchors are only supported at the start and end', start)
+        if char.isdigit():
+            raise self._error('backreferences and octal escapes are not supported', start)
+        if not char.isalnum():
+            return ('char', char)
+
+        if char in _HEX_ESCAPES:
+            self._pos += _HEX_ESCAPES[char]
+        elif char not in _CLASS_ESCAPES and char not in 'afnrtv':
+            raise self._error('unsupported escape \\' + char, start)
+        return ('class', _compile_single(self._pattern[start:self._pos]))
+
+
+def _compile_single(source):
+    """ compile *source* (mostly a single character class) using python's re """
+    try:
+        return re.compile(source)
+    except re.error as e:
+        raise ValueError('invalid regex: {}'.format(e))
+
+
+class _Compiler(object):
+    """
+    Turns a syntax tree into NFA states. Each state is a list of its kind,
+    its argument (the character or compiled class to test for) and the
+    states following it. The tree is compiled back to front, so every node
+    already knows the state following it.
+
+    """
+
+    def __init__(self):
+        self.states = []
+
+    def _add(self, kind, arg, outs):
+        if len(self.states) >= MAX_STATES:
+            raise ValueError('regex is too complex for linear matching')
+        self.states.append([kind, arg, outs])
+        return len(self.states) - 1
+
+    def compile(self, node, following):
+        kind = node[0]
+
+        if kind == 'char':
+            return self._add(_CHAR, node[1], [following])
+        if kind == 'class':
+            return self._add(_CLASS, node[1], [following])
+        if kind == 'cat':
+            for item in reversed(node[1]):
+                following = self.compile(item, following)
+            return following
+        if kind == 'alt':
+            return self._add(_SPLIT, None, [self.compile(item, following) for item in node[1]])
+
+        _, item, minimum, maximum = node
+        if maximum is None:
+            # a loop: try the item again or continue after it
+            loop = self._add(_SPLIT, None, [])
+            self.states[loop][2] = [self.compile(item, loop), following]
+            following = loop
+        else:
+            # x{0,2} becomes (x(x)?)?
+            rest = following
+            for _ in range(maximum - minimum):
+                rest = self._add(_SPLIT, None, [self.compile(item, rest), following])
+            following = rest
+
+        for _ in range(minimum):
+            following = self.compile(item, following)
+        return following
+
+
+class _DFAState(object):
+    __slots__ = ('nfa_states', 'next', 'accepting')
+
+    def __init__(self, nfa_states, accepting):
+        self.nfa_states = nfa_states
+        self.next = {}
+        self.accepting = accepting
+
+
+class LinearRegex(object):
+    """ a compiled pattern, which can only be matched against whole values """
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        # everything python does not accept is rejected as well, so patterns
+        # mean the same with both engines.
+        _compile_single(pattern)
+        tree = _Parser(pattern).parse()
+
+        compiler = _Compiler()
+        match = compiler._add(_MATCH, None, [])
+        start = compiler.compile(tree, match)
+
+        self._states = compiler.states
+        self._match = match
+        self._closures = [self._closure(i) for i in range(len(self._states))]
+
+        self._dfa = {}
+        self._start = self._dfa_state(self._closures[start])
+
+    def _closure(self, state):
+        """ return all character and match states reachable from *state* without consuming input """
+        reachable = set()
+        seen = set()
+        stack = [state]
+        while stack:
+            current = stack.pop()
+            if current in seen:
+                continue
+            seen.add(current)
+            kind, _, outs = self._states[current]
+            if kind == _SPLIT:
+                stack.extend(outs)
+            else:
+                reachable.add(current)
+        return frozenset(reachable)
+
+    def _dfa_state(self, nfa_states):
+        state = self._dfa.get(nfa_states)
+        if state is None:
+            if len(self._dfa) >= MAX_DFA_STATES:
+                # states, which are in use, stay valid, they are just not
+                # cached any more.
+                self._dfa = {}
+            state = _DFAState(nfa_states, self._match in nfa_states)
+            self._dfa[nfa_states] = state
+        return state
+
+    def _step(self, state, char):
+        following = set()
+        for current in state.nfa_states:
+            kind, arg, outs = self._states[current]
+            if kind == _CHAR:
+                if arg == char:
+                    following |= self._closures[outs[0]]
+            elif kind == _CLASS:
+                if arg.match(char):
+                    following |= self._closures[outs[0]]
+
+        nxt = self._dfa_state(frozenset(following))
+        if len(state.next) < MAX_DFA_STATES:
+            state.next[char] = nxt
+        return nxt
+
+    def match(self, value):
+        """ return whether *value* as a whole matches the pattern """
+        state = self._start
+        for char in value:
+            nxt = state.next.get(char)
+            if nxt is None:
+                nxt = self._step(state, char)
+            state = nxt
+            if not state.nfa_states:
+                return False
+        return state.accepting
@@ -0,0 +1,305 @@
+# the parameters of a script are turned into an argparse parser and a few
+# lookup tables once, when the script is loaded. Validating arguments then
+# only needs dictionary lookups, instead of searching the parameter list for
+# every parameter, dependency and group.
+from __future__ import absolute_import
+
+import argparse
+import inspect
+import io
+import os.path
+import sys
+
+import six
+
+from . import typeregistry
+from .constraints import Constraints
+
+# keys of a parameter, which are handled by paternoster itself. Everything
+# else is passed to argparse.
+PATERNOSTER_KEYS = (
+    'depends_on', 'positional', 'short', 'name', 'prompt', 'prompt_options', 'dest', 'multiple', 'max_count',
+)
+
+# parameters with `multiple` take at most this many values by default. The
+# values can also be read from a file (or stdin), given as --<name>-from.
+DEFAULT_MAX_COUNT = 1000
+STREAM_SUFFIX = '-from'
+
+
+def _check_type(argParams):
+    """ assert that given argument uses restricted_str in place of str/unicode, else raise ValueError """
+    action_whitelist = ('store_true', 'store_false', 'store_const', 'append_const', 'count')
+    action = argParams.get('action', 'store')
+
+    has_choices = ('choices' in argParams)
+    is_whitelist_action = (action in action_whitelist)
+
+    if is_whitelist_action:  # the passed value is hardcoded by the dev
+        return
+    if has_choices:  # there is a whitelist of valid values
+        return
+
+    argtype = argParams.get('type', str)
+    has_type = ('type' in argParams)
+    is_raw_string = (inspect.isclass(argtype) and issubclass(argtype, six.string_types))
+
+    if not has_type:
+        raise ValueError('a type must be specified for each user-supplied argument')
+    if is_raw_string:
+        raise ValueError('restricted_str instead of str or unicode must be used for all string arguments')
+
+
+def _convert_type(argParams):
+    param_type = argParams.pop('type', None)
+    param_type_params = argParams.pop('type_params', {})
+
+    if isinstance(param_type, six.string_types):
+        # unknown types are reported right away, when the script is loaded
+        argParams['type'] = typeregistry.registry.get(param_type, param_type_params)
+    elif param_type:
+        argParams['type'] = param_type
+
+
+def _is_prompt(param):
+    return param.get('prompt') and isinstance(param.get('prompt'), (bool, six.string_types))
+
+
+def _read_values(parser, option, source, type_func, values, max_count):
+    """
+    Validate the values in the file *source* (`-` for stdin) one line at a
+    time and append them to *values*. Returns the lines which were read.
+
+    """
+    if source == '-':
+        f = sys.stdin
+    else:
+        try:
+            f = io.open(source, encoding='utf-8')
+        except (EnvironmentError, ValueError) as e:
+            parser.error("argument {}: can't open '{}': {}".format(option, source, e))
+
+    lines = []
+    try:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            if len(values) >= max_count:
+                parser.error('argument {}: at most {} values are allowed'.format(option, max_count))
+            try:
+                values.append(type_func(line) if type_func else line)
+            except (argparse.ArgumentTypeError, TypeError, ValueError) as e:
+                parser.error('argument {}: line {}: {}'.format(option, lineno, e))
+            lines.append(line)
+    finally:
+        if f is not sys.stdin:
+            f.close()
+    return lines
+
+
+class ParameterSpec(object):
+    def __init__(self, parameters, description=None, mutually_exclusive=None, required_one_of=None):
+        self.parameters = parameters
+        self._params = {}
+        self._attrs = {}
+
+        # parameters with a special meaning, collected once
+        self.prompt_params = []
+        self.dest_params = []
+        self.multiple_params = []
+
+        self._parser = self._build_parser(description)
+        self.constraints = Constraints(self, mutually_exclusive, required_one_of)
+
+    def _add_param(self, param):
+        name = param['name']
+
+        # the first parameter using a name wins, both long and short ones.
+        self._params.setdefault(name, param)
+        if 'short' in param:
+            self._params.setdefault(param['short'], param)
+        self._attrs[name] = name.replace('-', '_')
+
+        if _is_prompt(param):
+            self.prompt_params.append(param)
+        if param.get('dest'):
+            self.dest_params.append((name, param['dest']))
+
+    def _build_parser(self, description):
+        parser = argparse.ArgumentParser(
+            add_help=False,
+            description=description,
+        )
+        requiredArgs = parser.add_argument_group('required arguments')
+        optionalArgs = parser.add_argument_group('optional arguments')
+
+        optionalArgs.add_argument(
+            '-h', '--help', action='help', default=argparse.SUPPRESS,
+            help='show this help message and exit'
+        )
+
+        for param in self.parameters:
+            # dest is removed here as well, so the actual argument names are
+            # preserved. See Paternoster._apply_dest.
+            argParams = {k: v for k, v in param.items() if k not in PATERNOSTER_KEYS}
+
+            _convert_type(argParams)
+            _check_type(argParams)
+
+            if 'name' not in param:
+                raise Exception('Parameter without name given: {}'.format(param))
+
+            if param.get('positional', False):
+                paramName = [param['name']]
+            else:
+                if 'short' in param:
+                    paramName = ['-' + param['short'], '--' + param['name']]
+                else:
+                    paramName = ['--' + param['name']]
+
+            if param.get('multiple', False):
+                self._add_multiple(param, paramName, argParams, requiredArgs, optionalArgs)
+            elif param.get('required', False) or param.get('positional', False):
+                if param.get('prompt'):
+                    parser.error((
+                        "'--{}' is required and can't be combined with prompt"
+                    ).format(
+                        param['name'],
+                    ))
+                requiredArgs.add_argument(*paramName, **argParams)
+            else:
+                optionalArgs.add_argument(*paramName, **argParams)
+
+            self._add_param(param)
+
+        optionalArgs.add_argument(
+            '-v', '--verbose', action='count', default=0,
+            help='run with a lot of debugging output'
+        )
+
+        return parser
+
+    def _add_multiple(self, param, paramName, argParams, requiredArgs, optionalArgs):
+        name = param['name']
+        if param.get('positional', False) or param.get('prompt'):
+            raise ValueError("'--{}' takes multiple values and can't be positional or prompted".format(name))
+
+        max_count = param.get('max_count', DEFAULT_MAX_COUNT)
+        if not isinstance(max_count, int) or max_count < 1:
+            raise ValueError("max_count of '--{}' must be a positive integer".format(name))
+
+        # required is checked once the values from --<name>-from are known
+        required = argParams.pop('required', False)
+        argParams['action'] = 'append'
+        argParams.setdefault('default', [])
+        group = requiredArgs if required else optionalArgs
+        group.add_argument(*paramName, **argParams)
+
+        attr = name.replace('-', '_')
+        stream_attr = '_stream_' + attr
+        group.add_argument(
+            '--' + name + STREAM_SUFFIX, dest=stream_attr, metavar='FILE',
+            help="read values for --{} from FILE, one per line ('-' for stdin)".format(name),
+        )
+        self.multiple_params.append((name, attr, stream_attr, argParams.get('type'), max_count, required))
+
+    def read_streams(self, parser, args, argv, allow_files=True):
+        """
+        Add the values of multiple-parameters read from files (or stdin) to
+        *args* and check their count. The values are appended to *argv*,
+        so parsing it again does not read the files another time.
+
+        """
+        for name, attr, stream_attr, type_func, max_count, required in self.multiple_params:
+            option = '--' + name + STREAM_SUFFIX
+            source = getattr(args, stream_attr)
+            delattr(args, stream_attr)
+            # the default list is shared between all parses
+            values = list(getattr(args, attr))
+            setattr(args, attr, values)
+
+            if len(values) > max_count:
+                parser.error('argument --{}: at most {} values are allowed'.format(name, max_count))
+
+            if source:
+                if source != '-' and not allow_files:
+                    parser.error("argument {}: only '-' (stdin) can be used for this script".format(option))
+                lines = _read_values(parser, option, source, type_func, values, max_count)
+                argv.append(option + '=')
+                argv.extend('--{}={}'.format(name, line) for line in lines)
+
+            if required and not values:
+                parser.error('argument --{} is required'.format(name))
+
+    def assume_streams(self, args):
+        """
+        Count the multiple-parameters in *args*, whose values are to be read
+        from --<name>-from, as given without reading anything. The files may
+        only be readable by the user the script switches to.
+
+        """
+        for name, attr, stream_attr, type_func, max_count, required in self.multiple_params:
+            if getattr(args, stream_attr) and not getattr(args, attr):
+                setattr(args, attr, [None])
+
+    def record_argv(self, record):
+        """
+        Return the command line equivalent to *record*, a dictionary mapping
+        parameter names to values (see Paternoster.run_batch). `true` stands
+        for a flag, `false` and `null` leave a parameter out and lists repeat it.
+
+        """
+        if not isinstance(record, dict):
+            raise ValueError('a record must be an object mapping parameter names to values')
+
+        options = []
+        positionals = []
+        for key, value in sorted(record.items()):
+            if key == 'verbose' and isinstance(value, int) and not isinstance(value, bool):
+                options.extend(['--verbose'] * value)
+                continue
+
+            param = self._params.get(key)
+            if param is None or param['name'] != key:
+                raise ValueError('unknown parameter: {}'.format(key))
+            if value is None or value is False:
+                continue
+
+            values = value if isinstance(value, list) else [value]
+            for v in values:
+                if isinstance(v, (dict, list)) or v is None:
+                    raise ValueError('invalid value for parameter {}'.format(key))
+                if param.get('positional', False):
+                    positionals.append((self.parameters.index(param), six.text_type(v)))
+                elif v is True:
+                    options.append('--' + key)
+                else:
+                    options.append(u'--{}={}'.format(key, v))
+
+        if positionals:
+            # values starting with a dash must not be taken for options
+            options.append('--')
+            options.extend(v for _, v in sorted(positionals))
+        return options
+
+    @property
+    def parser(self):
+        # the parser is built, before the script knows its final name in some
+        # cases (e.g. paternoster-daemon). Use the current one, like argparse would.
+        self._parser.prog = os.path.basename(sys.argv[0])
+        return self._parser
+
+    def find(self, fname):
+        """ look for a parameter by either its short- or long-name """
+        try:
+            return self._params[fname]
+        except KeyError:
+            raise KeyError('Parameter {0} could not be found'.format(fname))
+
+    def has_param(self, fname):
+        return fname in self._params
+
+    def get_value(self, args, fname):
+        """ get the value of a parameter, named by either its short- or long-name """
+        return getattr(args, self._attrs[self.find(fname)['name']])
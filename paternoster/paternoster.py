@@ -1,18 +1,48 @@
 from __future__ import absolute_import
 from __future__ import print_function
 
-import argparse
 import getpass
-import inspect
+import io
+import json
 import os.path
 import sys
 
 import six
 
+from . import client
+from . import handoff
+from . import types
+from .parameters import ParameterSpec
 from .root import become_user
 from .root import check_user
+from .root import switch_user
 from .runners.ansiblerunner import AnsibleRunner
 
+BATCH_OPTION = '--batch'
+
+
+def _runner_value(value):
+    if six.PY2 and isinstance(value, str):
+        return value.decode('utf-8')
+    elif isinstance(value, types.Record):
+        # playbooks get plain dicts, which ansible knows how to handle
+        return value.as_dict()
+    return value
+
+
+def _batch_source(argv):
+    """ return FILE, if *argv* is `--batch FILE` (or `--batch=FILE`) and `None` otherwise """
+    if len(argv) == 2 and argv[0] == BATCH_OPTION:
+        return argv[1]
+    if len(argv) == 1 and argv[0].startswith(BATCH_OPTION + '='):
+        return argv[0][len(BATCH_OPTION) + 1:]
+    return None
+
+
+def _print_status(status):
+    print(json.dumps(status, sort_keys=True))
+    sys.stdout.flush()
+
 
 class Paternoster:
     def __init__(self,
@@ -23,6 +53,9 @@ class Paternoster:
                  become_user=None, check_user=None,
                  success_msg=None,
                  description=None,
+                 validate_early=False,
+                 handoff=False,
+                 daemon_socket=None,
                  runner_class=AnsibleRunner,
                  ):
         if parameters is None:
@@ -35,118 +68,34 @@ class Paternoster:
         self._check_user = check_user
         self._success_msg = success_msg
         self._description = description
+        self._validate_early = validate_early
+        self._handoff = handoff
+        self._daemon_socket = daemon_socket
         self._sudo_user = None
         self._runner = runner_class(**runner_parameters)
+        self._spec = ParameterSpec(
+            self._parameters, self._description,
+            mutually_exclusive=self._mutually_exclusive,
+            required_one_of=self._required_one_of,
+        )
 
     def _find_param(self, fname):
         """ look for a parameter by either its short- or long-name """
-        for param in self._parameters:
-            if param['name'] == fname or param.get('short', None) == fname:
-                return param
-
-        raise KeyError('Parameter {0} could not be found'.format(fname))
+        return self._spec.find(fname)
 
     def _get_param_val(self, args, fname):
         """ get the value of a parameter, named by either its short- or long-name """
-        param = self._find_param(fname)
-        name = param['name'].replace('-', '_')
-        return getattr(args, name)
-
-    def _check_type(self, argParams):
-        """ assert that given argument uses restricted_str in place of str/unicode, else raise ValueError """
-        action_whitelist = ('store_true', 'store_false', 'store_const', 'append_const', 'count')
-        action = argParams.get('action', 'store')
-
-        has_choices = ('choices' in argParams)
-        is_whitelist_action = (action in action_whitelist)
-
-        if is_whitelist_action:  # the passed value is hardcoded by the dev
-            return
-        if has_choices:  # there is a whitelist of valid values
-            return
-
-        argtype = argParams.get('type', str)
-        has_type = ('type' in argParams)
-        is_raw_string = (inspect.isclass(argtype) and issubclass(argtype, six.string_types))
-
-        if not has_type:
-            raise ValueError('a type must be specified for each user-supplied argument')
-        if is_raw_string:
-            raise ValueError('restricted_str instead of str or unicode must be used for all string arguments')
-
-    def _convert_type(sefl, argParams):
-        param_type = argParams.pop('type', None)
-        param_type_params = argParams.pop('type_params', {})
-
-        if isinstance(param_type, str):
-            if param_type == 'int':
-                argParams['type'] = int
-            elif param_type == 'str':
-                argParams['type'] = str
-            elif param_type.startswith('paternoster.types.'):
-                type_clazz = getattr(sys.modules['paternoster.types'], param_type.rpartition('.')[2])
-                argParams['type'] = type_clazz(**param_type_params)
-            else:
-                raise Exception('unknown type ' + param_type)
-        elif param_type:
-            argParams['type'] = param_type
+        return self._spec.get_value(args, fname)
 
     def _build_argparser(self):
-        parser = argparse.ArgumentParser(
-            add_help=False,
-            description=self._description,
-        )
-        requiredArgs = parser.add_argument_group('required arguments')
-        optionalArgs = parser.add_argument_group('optional arguments')
-
-        optionalArgs.add_argument(
-            '-h', '--help', action='help', default=argparse.SUPPRESS,
-            help='show this help message and exit'
-        )
-
-        for param in self._parameters:
-            argParams = param.copy()
-            argParams.pop('depends_on', None)
-            argParams.pop('positional', None)
-            argParams.pop('short', None)
-            argParams.pop('name', None)
-            argParams.pop('prompt', None)
-            argParams.pop('prompt_options', None)
-
-            # remove dest here so the actual argument names are preserved
-            argParams.pop('dest', None)
+        return self._spec.parser
 
-            self._convert_type(argParams)
-            self._check_type(argParams)
-
-            if 'name' not in param:
-                raise Exception('Parameter without name given: {}'.format(param))
-
-            if param.get('positional', False):
-                paramName = [param['name']]
-            else:
-                if 'short' in param:
-                    paramName = ['-' + param['short'], '--' + param['name']]
-                else:
-                    paramName = ['--' + param['name']]
-
-            if param.get('required', False) or param.get('positional', False):
-                if param.get('prompt'):
-                    parser.error((
-                        "'--{}' is required and can't be combined with prompt"
-                    ).format(
-                        param['name'],
-                    ))
-                requiredArgs.add_argument(*paramName, **argParams)
-            else:
-                optionalArgs.add_argument(*paramName, **argParams)
-
-        optionalArgs.add_argument(
-            '-v', '--verbose', action='count', default=0,
-            help='run with a lot of debugging output'
-        )
-
-        return parser
+    def _missing_prompt_params(self, args):
+        """ return the parameter dictionaries of arguments, which the user still has to be prompted for """
+        return [
+            param for param in self._spec.prompt_params
+            if self._get_param_val(args, param['name']) is None
+        ]
 
     def _prompt_for_missing(self, argv, parser, args):
         """
@@ -154,25 +103,17 @@ class Paternoster:
 
         Prompts the user for arguments (`self._parameters`), that are missing
         from *args* (don't exist or are set to `None`). But only if they have
-        the `prompt` key set to `True` or a non empty string.
+        the `prompt` key set to `True` or a non empty string. The answers are
+        appended to the *argv* list.
 
         """
-        # get parameter dictionaries for missing arguments
-        missing_params = (
-            param for param in self._parameters
-            if param.get('prompt')
-            and isinstance(param.get('prompt'), (bool, six.string_types))
-            and self._get_param_val(args, param['name']) is None
-        )
-
         # prompt for missing args
         prompt_data = {
-            param['name']: self.get_input(param) for param in missing_params
+            param['name']: self.get_input(param) for param in self._missing_prompt_params(args)
         }
 
-        # add prompt_data to new argv and return newly parsed arguments
+        # add prompt_data to argv and return newly parsed arguments
         if prompt_data:
-            argv = list(argv) if argv else sys.argv[1:]
             for name, value in prompt_data.items():
                 argv.append('--{}'.format(name))
                 argv.append(value)
@@ -182,50 +123,13 @@ class Paternoster:
         else:
             return args
 
-    def _argument_given(self, args, name):
-        param = self._find_param(name)
-        return self._get_param_val(args, param['name'])
-
-    def _check_arg_dependencies(self, parser, args):
-        for param in self._parameters:
-            param_given = self._argument_given(args, param['name'])
-            dependency_given = ('depends_on' not in param) or self._argument_given(args, param['depends_on'])
-
-            if param_given and not dependency_given:
-                parser.error(
-                    'argument --{} requires --{} to be present.'.format(param['name'], param['depends_on'])
-                )
-
-    def _check_arg_mutually_exclusive(self, parser, args):
-        for group in self._mutually_exclusive:
-            given_args = ['--' + a for a in group if self._argument_given(args, a)]
-
-            if len(given_args) > 1:
-                parser.error(
-                    'arguments {} are mutually exclusive.'.format(', '.join(given_args))
-                )
-
-    def _check_arg_required_one_of(self, parser, args):
-        for group in self._required_one_of:
-            given_args = [True for a in group if self._argument_given(args, a)]
-
-            if len(given_args) == 0:
-                parser.error(
-                    'at least one of {} is needed.'.format(', '.join('--' + x for x in group))
-                )
-
     def _apply_dest(self, args):
         """
         The dest attribute is removed earlier so the actual argument names are preserved for dependency checking.
         This renames all the arguments to their "dest" name, or leaves them as-is, if non is given.
         """
 
-        for param in self._parameters:
-            if not param.get('dest'):
-                continue
-
-            name = param['name']
-            dest = param['dest']
+        for name, dest in self._spec.dest_params:
             value = self._get_param_val(args, name)
 
             if value is not None or not hasattr(args, dest):
@@ -239,32 +143,191 @@ class Paternoster:
             print('This script can only be used by the user ' + self._check_user, file=sys.stderr)
             sys.exit(1)
 
-    def become_user(self):
+    def become_user(self, keep_fd=None):
         if not self._become_user:
             return
 
         try:
-            self._sudo_user = become_user(self._become_user)
+            self._sudo_user = become_user(self._become_user, keep_fd)
         except ValueError as e:
             print(e, file=sys.stderr)
             sys.exit(1)
 
+    def _receive_handoff(self):
+        try:
+            return handoff.receive()
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            sys.exit(3)
+
+    def _get_batch_source(self):
+        if self._spec.has_param('batch'):
+            # the script uses --batch itself
+            return None
+        return _batch_source(sys.argv[1:])
+
     def auto(self):
         self.check_user()
-        self.become_user()
-        self.parse_args()
+        batch = self._get_batch_source()
+        if batch is not None:
+            self.become_user()
+            sys.exit(self.run_batch(batch))
+
+        argv = None
+        keep_fd = None
+        if self._become_user and not check_user(self._become_user):
+            if self._daemon_socket or self._handoff:
+                # prompted values are sent along with the other arguments,
+                # so the user can be asked right away.
+                self.parse_args()
+            elif self._validate_early:
+                # reject invalid arguments before paying for sudo and a second
+                # interpreter. The privileged process validates them again.
+                self._precheck_args()
+
+            if self._daemon_socket:
+                status = client.submit(self._daemon_socket, self._argv)
+                if status is not None:
+                    sys.exit(status)
+                # the daemon is not running, fall back to sudo.
+            if self._handoff:
+                keep_fd = handoff.prepare(self._argv)
+        elif self._become_user and self._handoff:
+            argv = self._receive_handoff()
+        self.become_user(keep_fd)
+        self.parse_args(argv)
         status = self.execute()
         sys.exit(0 if status else 1)
 
-    def parse_args(self, argv=None):
+    def serve(self, argv, caller):
+        """
+        Validate *argv* and execute the playbook on behalf of the user *caller*.
+
+        This is used in place of :meth:`auto`, if the caller has already been
+        identified by other means than sudo (e.g. by paternoster-daemon).
+        Returns the exit code of the script.
+
+        """
+        if self._check_user and caller != self._check_user:
+            print('This script can only be used by the user ' + self._check_user, file=sys.stderr)
+            return 1
+        switch_user(self._become_user)
+        self._sudo_user = caller
+        self.parse_args(argv, prompt=False)
+        return 0 if self.execute() else 1
+
+    def _run_record(self, line):
+        """ validate and execute a single record of a batch, return its status and an error message """
+        try:
+            argv = self._spec.record_argv(json.loads(line))
+        except ValueError as e:
+            return 'invalid', str(e)
+
+        # parse_args reports errors on stderr and exits, just like it does
+        # for a single run. The message becomes part of the status instead.
+        errors = six.StringIO()
+        stderr, sys.stderr = sys.stderr, errors
+        try:
+            self.parse_args(argv, prompt=False)
+        except SystemExit:
+            lines = errors.getvalue().strip().splitlines()
+            return 'invalid', lines[-1] if lines else None
+        finally:
+            sys.stderr = stderr
+
+        try:
+            status = self.execute()
+        except Exception as e:
+            return 'failed', str(e)
+        return ('ok' if status else 'failed'), None
+
+    def run_batch(self, source):
+        """
+        Run the playbook once for every record in the file *source* ('-' for
+        stdin). Each line holds one record, a JSON object mapping parameter
+        names to values, which is validated just like the command line of a
+        single run. Ansible, the parsed playbook and the files it uses are
+        loaded once for the whole batch.
+
+        A status line (JSON) is printed for every record, followed by a
+        summary. Returns the exit code of the batch: 0 if all records
+        succeeded, 1 if any of them failed or was invalid.
+
+        """
+        if source != '-' and not self._may_read_files():
+            print("argument {}: only '-' (stdin) can be used for this script".format(BATCH_OPTION), file=sys.stderr)
+            return 3
+
+        try:
+            f = sys.stdin if source == '-' else io.open(source, encoding='utf-8')
+        except EnvironmentError as e:
+            print('argument {}: {}'.format(BATCH_OPTION, e), file=sys.stderr)
+            return 3
+
+        counts = {'ok': 0, 'failed': 0, 'invalid': 0}
+        try:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                status, error = self._run_record(line)
+                counts[status] += 1
+                result = {'record': number, 'status': status}
+                if error:
+                    result['error'] = error
+                _print_status(result)
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+        counts['records'] = sum(counts.values())
+        _print_status(counts)
+        return 0 if counts['ok'] == counts['records'] else 1
+
+    def _may_read_files(self):
+        """ return whether files named by the user may be opened, i.e. the script runs as the user """
+        return self._sudo_user is None and 'SUDO_USER' not in os.environ
+
+    def _check_args(self, parser, args):
+        # all violated rules are reported at once
+        errors = self._spec.constraints.check(args)
+        if errors:
+            parser.error(' '.join(errors))
+
+    def _precheck_args(self):
+        """
+        Validate the arguments given on the command line without prompting
+        for missing ones. If there are prompts pending, the checks which might
+        depend on the prompted values are skipped. Values to be read from
+        --<name>-from are not read yet, but count as given.
+
+        """
+        parser = self._build_argparser()
+        try:
+            args = parser.parse_args(sys.argv[1:])
+            self._spec.assume_streams(args)
+            if not self._missing_prompt_params(args):
+                self._check_args(parser, args)
+        except ValueError as exc:
+            print(exc, file=sys.stderr)
+            sys.exit(3)
+
+    def parse_args(self, argv=None, prompt=True):
+        """
+        Parse and validate *argv* (defaults to `sys.argv`).
+
+        If *prompt* is `False`, the user is not asked for missing arguments.
+
+        """
+        argv = list(argv) if argv is not None else sys.argv[1:]
         parser = self._build_argparser()
         try:
             args = parser.parse_args(argv)
-            args = self._prompt_for_missing(argv, parser, args)
-            self._check_arg_dependencies(parser, args)
-            self._check_arg_mutually_exclusive(parser, args)
-            self._check_arg_required_one_of(parser, args)
+            if prompt:
+                args = self._prompt_for_missing(argv, parser, args)
+            self._spec.read_streams(parser, args, argv, allow_files=self._may_read_files())
+            self._check_args(parser, args)
             self._apply_dest(args)
+            self._argv = argv
             self._parsed_args = args
         except ValueError as exc:
             print(exc, file=sys.stderr)
@@ -278,8 +341,10 @@ class Paternoster:
 
         for name in vars(self._parsed_args):
             value = getattr(self._parsed_args, name)
-            if six.PY2 and isinstance(value, str):
-                value = value.decode('utf-8')
+            if isinstance(value, list):
+                value = [_runner_value(v) for v in value]
+            else:
+                value = _runner_value(value)
             yield ('param_' + name, value)
 
     def execute(self):
@@ -3,8 +3,13 @@ import pwd
 import re
 import sys
 
+from .handoff import HANDOFF_OPTION
 
-def become_user(user):
+# the username of the calling user is passed on to playbooks as sudo_user
+USERNAME_REGEX = '^[a-z][a-z0-9]{0,20}$'
+
+
+def become_user(user, keep_fd=None):
     if os.geteuid() != pwd.getpwnam(user).pw_uid:
         # flush output buffers. Otherwise the output before the
         # become_root()-call might be never shown to the user
@@ -15,12 +20,20 @@ def become_user(user):
         realme = os.path.realpath(sys.argv[0])
 
         # -n disables password prompt, when sudo isn't configured properly
-        os.execv('/usr/bin/sudo', ['/usr/bin/sudo', '-u', user, '-n', '--', realme] + sys.argv[1:])
+        sudo = ['/usr/bin/sudo', '-u', user, '-n']
+        argv = sys.argv[1:]
+        if keep_fd is not None:
+            # sudo closes all descriptors except stdin/out/err by default.
+            # This requires "closefrom_override" to be set in the sudoers-config.
+            sudo += ['-C', str(keep_fd + 1)]
+            # the privileged process only reads the descriptor, if told to.
+            argv = [HANDOFF_OPTION] + argv
+        os.execv('/usr/bin/sudo', sudo + ['--', realme] + argv)
     else:
         sudouser = os.environ.get('SUDO_USER', None)
         # $SUDO_USER is set directly by sudo, so users should not be alble
         # to trick here. Better be safe, than sorry, though.
-        if sudouser and re.match('^[a-z][a-z0-9]{0,20}$', sudouser):
+        if sudouser and re.match(USERNAME_REGEX, sudouser):
             return sudouser
         else:
             raise ValueError('invalid username: "{}"'.format(sudouser))
@@ -28,3 +41,18 @@ def become_user(user):
 
 def check_user(user):
     return os.geteuid() == pwd.getpwnam(user).pw_uid
+
+
+def switch_user(user):
+    """ permanently change the uid and gids of the current (root) process to those of *user* """
+    pw = pwd.getpwnam(user)
+    if os.geteuid() == pw.pw_uid:
+        return
+
+    os.initgroups(user, pw.pw_gid)
+    os.setgid(pw.pw_gid)
+    os.setuid(pw.pw_uid)
+
+    # mimic the environment sudo would set up for the target user
+    os.environ['HOME'] = pw.pw_dir
+    os.environ['USER'] = os.environ['LOGNAME'] = user
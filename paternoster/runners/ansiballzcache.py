@@ -0,0 +1,270 @@
+# a cache of the AnsiballZ payloads ansible builds for its modules, kept in
+# /var/cache/paternoster between runs. Before ansible runs a python module in a
+# process of its own, it collects all module_utils the module imports (parsing
+# each of them) and zips them up with the module. Ansible only keeps the result
+# for the current run, in its local temporary directory. Once enabled, a payload
+# built before is put there, before ansible looks for it.
+#
+# Entries are named by a hash of the module's path and source, the compression
+# and the python interpreter it runs with, as well as the ansible version. Each
+# entry records the module_utils files it contains and their hashes, and is
+# only used as long as ansible's own files still have exactly this content.
+# Payloads are only cached, if all module_utils come from ansible itself (no
+# module_utils directories next to the playbook, no collections), so a cached
+# payload is always the one ansible would have built.
+#
+# Payloads contain nothing but code shipped with ansible, the arguments of a
+# task are not part of them. The cache keeps at most MAX_ENTRIES entries, the
+# ones used least recently are removed first. The payloads reused and built
+# are counted in shared memory, as they are built in ansible's worker processes.
+from __future__ import absolute_import
+
+import base64
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import tempfile
+import zipfile
+
+import ansible
+import ansible.constants
+import ansible.release
+from ansible.executor import module_common
+
+from .. import cache
+
+ANSIBALLZ_CACHE = 'ansiballz'
+# bump the version, whenever the format of the entries changes.
+ANSIBALLZ_CACHE_VERSION = 1
+MAX_ENTRIES = 128
+# about 120 KiB are usual
+MAX_ENTRY_SIZE = 1024 * 1024
+
+_ANSIBLE_DIR = os.path.dirname(os.path.abspath(ansible.__file__))
+_MODULE_UTILS = 'ansible/module_utils/'
+# written by ansible itself instead of being read from a file
+_GENERATED = frozenset(['ansible/__init__.py', 'ansible/module_utils/__init__.py'])
+
+_cache = None
+
+
+class Uncacheable(ValueError):
+    pass
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _read_file(relpath):
+    try:
+        with open(os.path.join(_ANSIBLE_DIR, relpath), 'rb') as f:
+            return f.read()
+    except (IOError, OSError):
+        return None
+
+
+def _module_utils_files(zipdata):
+    """ return the hashes of the files from ansible's module_utils contained in the payload *zipdata* """
+    files = {}
+    with zipfile.ZipFile(io.BytesIO(base64.b64decode(zipdata))) as zf:
+        for name in zf.namelist():
+            if not name.startswith('ansible/'):
+                raise Uncacheable('{} is not part of ansible'.format(name))
+            if name in _GENERATED or not name.startswith(_MODULE_UTILS):
+                # the module itself and the packages containing it
+                continue
+            relpath = name[len('ansible/'):]
+            data = zf.read(name)
+            if _read_file(relpath) != data:
+                raise Uncacheable('{} is not the one shipped with ansible'.format(name))
+            files[relpath] = _sha256(data)
+    return files
+
+
+def _only_ansible_module_utils():
+    """ return whether ansible takes all module_utils from its own package """
+    own = os.path.realpath(os.path.join(_ANSIBLE_DIR, 'module_utils'))
+    return all(
+        os.path.realpath(path) == own or not os.path.isdir(path)
+        for path in module_common.module_utils_loader._get_paths(subdirs=False)
+    )
+
+
+class AnsiballZCache(object):
+    def __init__(self, directory):
+        self._directory = directory
+        # reused and built payloads, shared with the worker processes forked by ansible
+        self._stats = multiprocessing.Array('l', 2)
+
+    @classmethod
+    def open(cls):
+        """ return the cache or `None`, if its directory cannot be trusted """
+        directory = cache.get_dir(ANSIBALLZ_CACHE)
+        return cls(directory) if directory is not None else None
+
+    @property
+    def hits(self):
+        return self._stats[0]
+
+    @property
+    def misses(self):
+        return self._stats[1]
+
+    def reset_stats(self):
+        with self._stats.get_lock():
+            self._stats[0] = self._stats[1] = 0
+
+    def count(self, hit):
+        with self._stats.get_lock():
+            self._stats[0 if hit else 1] += 1
+
+    @staticmethod
+    def key(module_path, b_module_data, compression, interpreter):
+        return _sha256(json.dumps([
+            ANSIBALLZ_CACHE_VERSION, ansible.release.__version__,
+            os.path.abspath(module_path), _sha256(b_module_data), compression, interpreter,
+        ]).encode('utf-8'))
+
+    def load(self, key):
+        """ return the payload stored for *key* or `None` """
+        data = cache.read(self._directory, key)
+        if data is None:
+            return None
+
+        header, _, zipdata = data.partition(b'\n')
+        try:
+            header = json.loads(header.decode('utf-8'))
+            if header.get('key') != key or header.get('sha256') != _sha256(zipdata):
+                return None
+            files = header['files']
+            for relpath, digest in files.items():
+                content = _read_file(relpath)
+                if content is None or _sha256(content) != digest:
+                    return None
+        except (ValueError, KeyError, AttributeError, TypeError):
+            return None
+
+        if cache.can_write():
+            # the least recently used entries are removed first
+            try:
+                os.utime(os.path.join(self._directory, key), None)
+            except OSError:
+                pass
+        return zipdata
+
+    def store(self, key, zipdata):
+        """ store the payload *zipdata* built for *key* """
+        if len(zipdata) > MAX_ENTRY_SIZE or not cache.can_write():
+            return False
+        try:
+            files = _module_utils_files(zipdata)
+        except (Uncacheable, zipfile.BadZipfile, ValueError, TypeError):
+            return False
+
+        header = json.dumps({'key': key, 'sha256': _sha256(zipdata), 'files': files}).encode('utf-8')
+        if not cache.write(self._directory, key, header + b'\n' + zipdata):
+            return False
+        self._prune()
+        return True
+
+    def _prune(self):
+        entries = []
+        for name in os.listdir(self._directory):
+            if name.startswith('.'):
+                continue
+            try:
+                entries.append((os.stat(os.path.join(self._directory, name)).st_mtime, name))
+            except OSError:
+                pass
+
+        entries.sort()
+        for _, name in entries[:max(0, len(entries) - MAX_ENTRIES)]:
+            try:
+                os.unlink(os.path.join(self._directory, name))
+            except OSError:
+                pass
+
+
+def _run_local_path(module_name, module_compression):
+    # where ansible keeps the payloads of the current run, see _find_module_utils
+    name = '%s-%s' % (module_name, module_compression)
+    return os.path.join(ansible.constants.DEFAULT_LOCAL_TMP, 'ansiballz_cache', name)
+
+
+def _seed(path, zipdata):
+    """ put *zipdata* where ansible looks for the payload built before, atomically, returns whether it worked """
+    directory = os.path.dirname(path)
+    tmppath = None
+    try:
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        fd, tmppath = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(zipdata)
+        os.rename(tmppath, path)
+    except EnvironmentError:
+        if tmppath is not None:
+            try:
+                os.unlink(tmppath)
+            except OSError:
+                pass
+        return False
+    return True
+
+
+_find_module_utils_uncached = module_common._find_module_utils
+
+
+def _find_module_utils(module_name, b_module_data, module_path, module_args, task_vars, templar, module_compression,
+                       *args, **kwargs):
+    """ module_common._find_module_utils, using the enabled cache """
+    path = _run_local_path(module_name, module_compression)
+    if _cache is None or os.path.exists(path) or not _only_ansible_module_utils():
+        return _find_module_utils_uncached(
+            module_name, b_module_data, module_path, module_args, task_vars, templar, module_compression,
+            *args, **kwargs
+        )
+
+    interpreter = (task_vars or {}).get('ansible_python_interpreter')
+    key = _cache.key(module_path, b_module_data, module_compression, interpreter)
+    zipdata = _cache.load(key)
+    if zipdata is not None and not _seed(path, zipdata):
+        # ansible builds the payload itself, which is stored as usual
+        zipdata = None
+
+    result = _find_module_utils_uncached(
+        module_name, b_module_data, module_path, module_args, task_vars, templar, module_compression,
+        *args, **kwargs
+    )
+
+    if zipdata is not None:
+        _cache.count(hit=True)
+    elif os.path.exists(path):
+        # not every module is a python module, which gets a payload
+        _cache.count(hit=False)
+        with open(path, 'rb') as f:
+            _cache.store(key, f.read())
+    return result
+
+
+def enable():
+    """ use the cache for all modules run by ansible from now on, returns the cache or `None` """
+    global _cache
+    if _cache is None:
+        _cache = AnsiballZCache.open()
+        if _cache is not None:
+            module_common._find_module_utils = _find_module_utils
+    return _cache
+
+
+def disable():
+    global _cache
+    _cache = None
+    module_common._find_module_utils = _find_module_utils_uncached
+
+
+def get_cache():
+    return _cache
@@ -0,0 +1,372 @@
+# importing this module loads the ansible python API, which is slow. It is
+# therefore only imported by AnsibleRunner, once a playbook is about to be
+# loaded or executed.
+from __future__ import print_function
+
+import os
+import sys
+from distutils.version import LooseVersion
+
+# Ansible loads the ansible.cfg in the following order. Ansible will process the
+# list below and use the first file found, all others are ignored.
+# see: https://docs.ansible.com/ansible/latest/reference_appendices/config.html#the-configuration-file
+#
+#  1. Path given in $ANSIBLE_CONFIG
+#  2. ansible.cfg file in the current directory
+#  3. .ansible.cfg file in the home directory
+#  4. /etc/ansible/ansible.cfg
+#
+# Since the current directory is controlled by the user and we don't want them
+# to be able to load their own config and thus their own ansible modules, we
+# need to counter them by setting the env-variable.
+os.environ['ANSIBLE_CONFIG'] = '/etc/ansible/ansible.cfg'
+
+# by default ansible uses "$HOME/.ansible/tmp" as the directory to drop
+# its module files. For some reason $HOME is not resolved when using the
+# python API directly resuling in a new directory called '$HOME' within
+# the paternoster source. This forces the modules to be dropped in /tmp.
+os.environ['ANSIBLE_REMOTE_TEMP'] = '/tmp'
+os.environ['ANSIBLE_LOCAL_TEMP'] = '/tmp'
+
+# Verbosity within ansbible is controlled by the Display-class. Each and
+# every ansible-file creates their own instance of this class, like this:
+#
+#  try:
+#     from __main__ import display
+#   except ImportError:
+#     from ansible.utils.display import Display
+#     display = Display()
+#
+# This means that the verbosity-parameter of display _always_ default to
+# zero. There is no sane way to overwrite this. Within a normal ansible
+# setup __main__ corresponds to the current executable (e.g. "ansible-playbook"),
+# which creates a Display instance based on the cli parameters (-v, -vv, ...).
+#
+# This has to happen before anything from ansible is imported!
+import __main__
+from ansible.utils.display import Display
+
+__main__.display = Display()
+
+import ansible.constants
+from ansible.executor.playbook_executor import PlaybookExecutor
+from ansible.parsing.dataloader import DataLoader
+from ansible.plugins.callback import CallbackBase
+
+import ansible.release
+
+from . import templatecache
+from .yamlcache import YAMLCache
+
+ANSIBLE_VERSION = LooseVersion(ansible.release.__version__)
+
+if ANSIBLE_VERSION >= LooseVersion('2.10.0'):
+    from . import ansiballzcache
+    from . import inlinestrategy
+    from . import inprocess
+else:
+    ansiballzcache = inlinestrategy = inprocess = None
+
+if ANSIBLE_VERSION < LooseVersion('2.4.0'):
+    from ansible.inventory import Inventory
+    from ansible.vars import VariableManager
+else:
+    from ansible.inventory.manager import InventoryManager
+    from ansible.vars.manager import VariableManager
+
+if ANSIBLE_VERSION < LooseVersion('2.8.0'):
+    from collections import namedtuple
+    Options = namedtuple(
+        'Options',
+        [
+            'connection', 'module_path', 'forks', 'become', 'become_method',
+            'become_user', 'check', 'listhosts', 'listtasks', 'listtags',
+            'syntax', 'diff'
+        ]
+    )
+else:
+    from ansible import context
+    from ansible.module_utils.common.collections import ImmutableDict
+
+
+class MinimalAnsibleCallback(CallbackBase):
+    """ filters out all ansible messages except for playbook fails and debug-module-calls. """
+
+    def v2_runner_on_failed(self, result, ignore_errors=False):
+        msg = result._result.get('msg')
+        task_ignores_errors = getattr(result, '_task_fields', {}).get('ignore_errors', False)
+        if (
+            not ignore_errors and not task_ignores_errors
+            and msg is not None and msg != 'All items completed'
+        ):
+            print(msg, file=sys.stderr)
+
+    def v2_runner_item_on_ok(self, result):
+        self.v2_runner_on_ok(result)
+
+    def v2_runner_item_on_failed(self, result):
+        self.v2_runner_on_failed(result)
+
+    def _get_action_args(self, result):
+        if ANSIBLE_VERSION < LooseVersion('2.3'):
+            result = result._result
+            if 'invocation' in result:
+                action = result['invocation'].get('module_name', None)
+                args = result['invocation'].get('module_args', None)
+            else:
+                action = None
+                args = {}
+
+            isloop = False
+        else:
+            action = result._task_fields.get('action', None)
+            args = result._task_fields.get('args', {})
+            isloop = 'results' in result._result
+
+        return (action, args, isloop)
+
+    def v2_runner_on_ok(self, result):
+        action, args, isloop = self._get_action_args(result)
+
+        if isloop:
+            # ansible 2.2+ calls runner_on_ok after all items have passed
+            # older versions don't.
+            return
+
+        if action == 'debug':
+            if 'var' in args:
+                print(result._result[args['var']])
+            if 'msg' in args:
+                print(result._result['msg'])
+
+
+class CachingDataLoader(DataLoader):
+    """
+    A DataLoader, which keeps the files it parses in the YAML cache (see
+    yamlcache.py) between runs, as long as the cache can be trusted. The
+    hits and misses of the cache are counted in `yaml_cache`.
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(CachingDataLoader, self).__init__(*args, **kwargs)
+        self.yaml_cache = YAMLCache.open()
+        self._vaulted = set()
+
+    def _get_file_contents(self, file_name):
+        data, show_content = super(CachingDataLoader, self)._get_file_contents(file_name)
+        if not show_content:
+            # decrypted vault files are never written to disk
+            self._vaulted.add(file_name)
+        return data, show_content
+
+    def load_from_file(self, file_name, cache=True, unsafe=False, **kwargs):
+        # json_only was added in ansible 2.8
+        path = self.path_dwim(file_name)
+        if self.yaml_cache is None or not cache or kwargs.get('json_only') or path in self._FILE_CACHE:
+            return super(CachingDataLoader, self).load_from_file(file_name, cache, unsafe, **kwargs)
+
+        key, encoded = self.yaml_cache.load(path)
+        if encoded is not None:
+            try:
+                data = self.yaml_cache.decode(encoded, path)
+            except ValueError:
+                data = None
+            if data is not None:
+                self._FILE_CACHE[path] = data
+                # the caller gets a copy, just like from DataLoader. Decoding
+                # the entry again is a lot faster than copy.deepcopy.
+                return data if unsafe else self.yaml_cache.decode(encoded, path)
+
+        result = super(CachingDataLoader, self).load_from_file(file_name, cache, unsafe, **kwargs)
+        if path not in self._vaulted:
+            self.yaml_cache.store(path, key, self._FILE_CACHE.get(path))
+        return result
+
+
+def get_data_loader(yaml_cache=False):
+    """ return a new DataLoader, keeping the files it parses in the YAML cache if *yaml_cache* is set """
+    return CachingDataLoader() if yaml_cache else DataLoader()
+
+
+def enable_template_cache():
+    """ cache the templates compiled from now on, see templatecache.py """
+    return templatecache.enable()
+
+
+def enable_ansiballz_cache():
+    """ cache the payloads built for modules from now on (ansible 2.10 or later), see ansiballzcache.py """
+    return ansiballzcache.enable() if ansiballzcache is not None else None
+
+
+def set_in_process_modules(modules):
+    """
+    Run the given ansible *modules* (`True` for the default ones) in-process
+    from now on, see inprocess.py. All modules run in a process of their own
+    with ansible before 2.10.
+
+    """
+    if inprocess is None:
+        if modules:
+            __main__.display.warning('running modules in-process requires ansible 2.10 or later')
+    elif not modules:
+        inprocess.disable()
+    else:
+        inprocess.enable(inprocess.IN_PROCESS_MODULES if modules is True else modules)
+
+
+def set_inline_tasks(enabled):
+    """
+    Run the tasks on localhost in the process running the playbook from now
+    on, instead of a worker process per task, see inlinestrategy.py. Requires
+    ansible 2.10 or later.
+
+    """
+    if inlinestrategy is None:
+        if enabled:
+            __main__.display.warning('running tasks inline requires ansible 2.10 or later')
+    elif not enabled:
+        inlinestrategy.disable()
+    elif not inlinestrategy.is_enabled():
+        inlinestrategy.enable()
+
+
+def display_stats(loader):
+    """ show the hits and misses of the caches used by *loader* and how modules and tasks ran since the last call """
+    yaml_cache = getattr(loader, 'yaml_cache', None)
+    if yaml_cache is not None:
+        __main__.display.v('parsed YAML cache: {} hits, {} misses'.format(yaml_cache.hits, yaml_cache.misses))
+        yaml_cache.reset_stats()
+
+    template_cache = templatecache.get_cache()
+    if template_cache is not None:
+        __main__.display.v('template cache: {} compilations skipped, {} templates compiled'.format(
+            template_cache.hits, template_cache.misses,
+        ))
+        template_cache.reset_stats()
+
+    ansiballz_cache = ansiballzcache.get_cache() if ansiballzcache is not None else None
+    if ansiballz_cache is not None:
+        __main__.display.v('AnsiballZ cache: {} payloads reused, {} built'.format(
+            ansiballz_cache.hits, ansiballz_cache.misses,
+        ))
+        ansiballz_cache.reset_stats()
+
+    module_stats = inprocess.get_stats() if inprocess is not None else None
+    if module_stats is not None:
+        __main__.display.v('modules: {} run in-process, {} in a process of their own'.format(*module_stats))
+
+    task_stats = inlinestrategy.get_stats() if inlinestrategy is not None else None
+    if task_stats is not None:
+        __main__.display.v('tasks: {} run inline, {} in a worker process'.format(*task_stats))
+
+
+def _is_paternoster_play(play):
+    return isinstance(play, dict) and play.get('hosts') == 'paternoster'
+
+
+def load_plays(playbook, loader=None):
+    """ parse *playbook* just like ansible would, leaving out the paternoster play """
+    if loader is None:
+        loader = DataLoader()
+
+    plays = loader.load_from_file(playbook)
+    if isinstance(plays, list) and plays and _is_paternoster_play(plays[0]):
+        plays = plays[1:]
+    return plays
+
+
+def get_playbook_executor(playbook, variables, verbosity, plays=None, loader=None):
+    # -v given to us enables ansibles non-debug output.
+    # So -vv should become ansibles -v.
+    __main__.display.verbosity = max(0, verbosity - 1)
+
+    if loader is None:
+        loader = DataLoader()
+
+    # the playbook is read through the loader, which keeps a cache of all
+    # files parsed so far. Seeding it with the plays (minus the paternoster
+    # play, which matches no hosts anyway) means the playbook is not parsed
+    # again, if it has been loaded ahead of time.
+    if plays is None:
+        plays = load_plays(playbook, loader)
+    loader._FILE_CACHE[loader.path_dwim(playbook)] = plays
+
+    if ANSIBLE_VERSION < LooseVersion('2.4.0'):
+        variable_manager = VariableManager()
+        inventory = Inventory(loader=loader, variable_manager=variable_manager, host_list='localhost,')
+        variable_manager.set_inventory(inventory)
+    else:
+        inventory = InventoryManager(loader=loader, sources='localhost,')
+        variable_manager = VariableManager(loader=loader, inventory=inventory)
+
+    if ANSIBLE_VERSION < LooseVersion('2.9.0'):
+        localhost = inventory.localhost
+    else:
+        localhost = inventory.localhost.get_name()
+
+    # force ansible to use the current python executable. Otherwise
+    # it can end up choosing a python3 one (named python) or a different
+    # python 2 version
+    variable_manager.set_host_variable(localhost, 'ansible_python_interpreter', sys.executable)
+
+    for name, value in variables:
+        variable_manager.set_host_variable(localhost, name, value)
+
+    if ANSIBLE_VERSION < LooseVersion('2.8.0'):
+        cli_options = Options(
+            become=None,
+            become_method=None,
+            become_user=None,
+            check=False,
+            connection='local',
+            diff=False,
+            forks=1,
+            listhosts=False,
+            listtags=False,
+            listtasks=False,
+            module_path=None,
+            syntax=False,
+        )
+    else:
+        cli_options = ImmutableDict(
+            become=None,
+            become_method=None,
+            become_user=None,
+            check=False,
+            connection='local',
+            diff=False,
+            forks=1,
+            listhosts=False,
+            listtags=False,
+            listtasks=False,
+            module_path=None,
+            syntax=False,
+            start_at_task=None,
+        )
+
+    if ANSIBLE_VERSION < LooseVersion('2.8.0'):
+        pexec = PlaybookExecutor(
+            playbooks=[playbook],
+            inventory=inventory,
+            variable_manager=variable_manager,
+            loader=loader,
+            options=cli_options,
+            passwords={},
+        )
+    else:
+        context.CLIARGS = cli_options
+        pexec = PlaybookExecutor(
+            [playbook], inventory, variable_manager, loader, {}
+        )
+
+    ansible.constants.RETRY_FILES_ENABLED = False
+
+    if not verbosity:
+        # ansible doesn't provide a proper API to overwrite this,
+        # if you're using PlaybookExecutor instead of initializing
+        # the TaskQueueManager (_tqm) yourself, like in the offical
+        # example.
+        pexec._tqm._stdout_callback = MinimalAnsibleCallback()
+
+    return pexec
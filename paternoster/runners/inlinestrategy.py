@@ -0,0 +1,152 @@
+# running tasks inline, in the process running the playbook. Ansible forks a
+# worker process for every task, even with forks=1, which sends the results
+# back through a queue, pickling them on the way. Paternoster's plays only
+# target localhost, where this buys nothing but isolation.
+#
+# Once enabled, plays using the linear strategy (ansible's default) use the
+# StrategyModule below instead. It runs the TaskExecutor for tasks on
+# localhost right away, just like a worker process would, and hands the
+# results directly to the strategy. Everything else, including all callbacks,
+# works just like upstream. It differs from upstream in these ways:
+#
+# - the TaskExecutor gets a copy of the task, as it changes the task while
+#   running it. Anything else a task changes about the process (like the
+#   environment or the working directory changed by an action plugin) is not
+#   undone afterwards.
+# - an error, which would crash a worker process, ends the whole run.
+# - tasks of plays on other hosts (e.g. added with add_host) still run in a
+#   worker process of their own, tasks delegated from localhost do not.
+# - modules are never run in-process (see inprocess.py), they always get a
+#   process of their own.
+# - the throttle keyword is ignored, tasks run one after another anyway.
+from __future__ import absolute_import
+
+import sys
+import traceback
+
+import ansible.constants
+from ansible.errors import AnsibleConnectionFailure
+from ansible.executor import action_write_locks
+from ansible.executor import task_queue_manager
+from ansible.executor.task_executor import TaskExecutor
+from ansible.executor.task_result import TaskResult
+from ansible.module_utils._text import to_text
+from ansible.plugins import loader as plugin_loader
+from ansible.plugins.strategy.linear import StrategyModule as LinearStrategyModule
+
+try:
+    from multiprocessing import Lock
+except ImportError:  # python 2
+    from threading import Lock
+
+LINEAR_STRATEGIES = ('linear', 'ansible.builtin.linear')
+
+_enabled = False
+# tasks run inline and in a worker process since the stats were last reset,
+# all in the process running the playbook
+_stats = [0, 0]
+
+
+class _ResultQueue(object):
+    """ passes the results sent by a TaskExecutor on to the strategy, instead of the results thread """
+
+    def __init__(self, strategy):
+        self._strategy = strategy
+
+    def put(self, result, block=True, timeout=None):
+        strategy = self._strategy
+        with strategy._results_lock:
+            # see results_thread_main in ansible.plugins.strategy
+            if 'listen' in result._task_fields:
+                strategy._handler_results.append(result)
+            else:
+                strategy._results.append(result)
+
+
+def _execute(host, task, task_vars, play_context, loader, final_q):
+    """ run *task* like WorkerProcess does, returns the TaskResult """
+    tempfiles = set(loader._tempfiles)
+    try:
+        result = TaskExecutor(host, task, task_vars, play_context, sys.stdin, loader, plugin_loader, final_q).run()
+    except AnsibleConnectionFailure:
+        result = dict(unreachable=True)
+    except Exception:
+        result = dict(failed=True, exception=to_text(traceback.format_exc()), stdout='')
+    finally:
+        # the files a worker process leaves behind are removed, when it exits
+        for path in loader._tempfiles - tempfiles:
+            loader.cleanup_tmp_file(path)
+    return TaskResult(host.name, task._uuid, result, task_fields=task.dump_attrs())
+
+
+class StrategyModule(LinearStrategyModule):
+    """ the linear strategy, running the tasks on localhost inline """
+
+    def _queue_task(self, host, task, task_vars, play_context):
+        if host.name not in ansible.constants.LOCALHOST:
+            _stats[1] += 1
+            return super(StrategyModule, self)._queue_task(host, task, task_vars, play_context)
+
+        if task.action not in action_write_locks.action_write_locks:
+            action_write_locks.action_write_locks[task.action] = Lock()
+
+        self._queued_task_cache[(host.name, task._uuid)] = {
+            'host': host,
+            'task': task,
+            'task_vars': task_vars,
+            'play_context': play_context,
+        }
+        if task.__class__.__name__ == 'Handler':
+            self._pending_handler_results += 1
+        else:
+            self._pending_results += 1
+
+        _stats[0] += 1
+        self._tqm.send_callback('v2_runner_on_start', host, task)
+        final_q = _ResultQueue(self)
+        final_q.put(_execute(host, task.copy(exclude_tasks=True), task_vars, play_context, self._loader, final_q))
+
+
+class _StrategyLoader(object):
+    """ ansible's strategy_loader, returning the inline strategy instead of the linear one """
+
+    def __init__(self, loader):
+        self._loader = loader
+
+    def get(self, name, *args, **kwargs):
+        if name in LINEAR_STRATEGIES:
+            return StrategyModule(*args, **kwargs)
+        return self._loader.get(name, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+_strategy_loader = task_queue_manager.strategy_loader
+
+
+def is_enabled():
+    return _enabled
+
+
+def get_stats():
+    """ return the number of tasks run inline and in a worker process since the last call, or `None` """
+    if not _enabled:
+        return None
+    stats = tuple(_stats)
+    _stats[:] = [0, 0]
+    return stats
+
+
+def enable():
+    """ run the tasks of plays using the linear strategy inline from now on """
+    global _enabled
+    _enabled = True
+    task_queue_manager.strategy_loader = _StrategyLoader(_strategy_loader)
+
+
+def disable():
+    global _enabled
+    _enabled = False
+    _stats[:] = [0, 0]
+    task_queue_manager.strategy_loader = _strategy_loader
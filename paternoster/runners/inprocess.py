@@ -0,0 +1,218 @@
+# running ansible modules inside the worker process executing the task.
+# Normally, ansible packs every module with its module_utils into a zip
+# (AnsiballZ), writes it to a temporary directory and starts a new python
+# interpreter running it, once for every task. Paternoster always runs its
+# plays on localhost, using the local connection, so for small modules this
+# is most of the time spent on a task.
+#
+# Once enabled, modules on the allow-list are imported once, in the process
+# running the playbook, and their main() is called in ansible's worker
+# process instead. The module reads its arguments from the same JSON
+# document and prints its result just like it would in a process of its
+# own, which is then parsed and cleaned up like any other module result.
+# Callbacks therefore see the same result dicts.
+#
+# Modules only run in-process, if ansible would have run exactly the same
+# file (one of its own modules, not one overridden through a library path
+# or collection), using the local connection, without become, async or an
+# environment set by the task. Everything else runs the usual way. Only
+# modules written in python, which neither fork nor replace the process
+# they are running in, are suitable. Each task runs in a worker process of
+# its own, so changes the module makes to the process (like its working
+# directory) do not outlive the task. Tasks run by the process running the
+# playbook itself (see inlinestrategy.py) therefore always run their modules
+# the usual way.
+from __future__ import absolute_import
+
+import importlib
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import sys
+import tempfile
+
+import __main__
+import ansible.constants
+from ansible.module_utils import basic
+from ansible.module_utils._text import to_bytes
+from ansible.module_utils.common.json import AnsibleJSONEncoder
+from ansible.module_utils.six import string_types
+from ansible.plugins.action import ActionBase
+from ansible.vars.clean import remove_internal_keys
+from ansible.utils.unsafe_proxy import wrap_var
+import six
+
+try:
+    from collections.abc import Sequence
+except ImportError:  # python 2
+    from collections import Sequence
+
+# modules written in python only, that neither fork nor daemonize.
+IN_PROCESS_MODULES = frozenset([
+    'blockinfile', 'command', 'copy', 'file', 'find', 'lineinfile', 'ping',
+    'replace', 'slurp', 'stat', 'tempfile',
+])
+BUILTIN_PREFIXES = ('ansible.builtin.', 'ansible.legacy.')
+
+_MODULE_NAME = re.compile(r'^[a-z_][a-z0-9_]*$')
+
+_modules = None
+# the process running the playbook, which enabled running modules in-process
+_parent_pid = None
+# modules run in-process and in a process of their own, shared with the worker
+# processes forked by ansible
+_stats = None
+
+
+def _module_source(module):
+    return os.path.realpath(os.path.splitext(module.__file__)[0] + '.py')
+
+
+def _find_module(action, module_name, wrap_async):
+    """ return the imported module to run *module_name* with, or `None` """
+    if (
+        wrap_async or action._task.async_val or action._play_context.become
+        or getattr(action._connection, 'transport', None) != 'local'
+    ):
+        return None
+
+    name = module_name
+    for prefix in BUILTIN_PREFIXES:
+        if name.startswith(prefix):
+            name = name[len(prefix):]
+    module = _modules.get(name)
+    if module is None:
+        return None
+
+    # the module could be shadowed by another one with the same name
+    context = action._shared_loader_obj.module_loader.find_plugin_with_context(
+        module_name, '.py', collection_list=action._task.collections,
+    )
+    if not context.resolved or os.path.realpath(context.plugin_resolved_path) != _module_source(module):
+        return None
+    if action._compute_environment_string():
+        return None
+    return module
+
+
+def _exit_code(e):
+    if e.code is None:
+        return 0
+    return e.code if isinstance(e.code, six.integer_types) else 1
+
+
+def _run(module, module_args):
+    """ run *module* just like a module process would, returns its exit code, stdout and stderr """
+    module_args = dict(module_args)
+    tmpdir = module_args['_ansible_tmpdir'] = tempfile.mkdtemp(prefix='ansible-moduletmp-')
+    stdout, stderr = six.StringIO(), six.StringIO()
+    basic._ANSIBLE_ARGS = to_bytes(json.dumps(
+        {'ANSIBLE_MODULE_ARGS': module_args}, cls=AnsibleJSONEncoder, vault_to_text=True,
+    ))
+
+    real_stdout, real_stderr, real_excepthook = sys.stdout, sys.stderr, sys.excepthook
+    sys.stdout, sys.stderr = stdout, stderr
+    try:
+        module.main()
+        rc = 0
+    except SystemExit as e:
+        rc = _exit_code(e)
+    except Exception:
+        # what the interpreter does with an uncaught exception. Some modules
+        # install their own hook, which reports the error as a result.
+        rc = 1
+        try:
+            sys.excepthook(*sys.exc_info())
+        except SystemExit as e:
+            rc = _exit_code(e)
+    finally:
+        sys.stdout, sys.stderr, sys.excepthook = real_stdout, real_stderr, real_excepthook
+        basic._ANSIBLE_ARGS = None
+        if not ansible.constants.DEFAULT_KEEP_REMOTE_FILES:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    return {'rc': rc, 'stdout': stdout.getvalue(), 'stderr': stderr.getvalue()}
+
+
+def _execute_module(self, module_name=None, module_args=None, tmp=None, task_vars=None, persist_files=False,
+                    delete_remote_tmp=None, wrap_async=False):
+    """ ActionBase._execute_module, running the allowed modules in-process """
+    if module_name is None:
+        module_name = self._task.action
+    module = None
+    if _modules is not None and os.getpid() != _parent_pid:
+        module = _find_module(self, module_name, wrap_async)
+    if module is None:
+        if _stats is not None:
+            _count(1)
+        return _spawn_module(
+            self, module_name, module_args, tmp, task_vars, persist_files, delete_remote_tmp, wrap_async,
+        )
+
+    if module_args is None:
+        module_args = self._task.args
+    self._update_module_args(module_name, module_args, task_vars if task_vars is not None else {})
+    __main__.display.vvv('Running module {} in-process'.format(_module_source(module)))
+    _count(0)
+
+    # the same as ActionBase._execute_module does with the result of a module process
+    data = self._parse_returned_data(_run(module, module_args))
+    data.pop('_ansible_suppress_tmpdir_delete', None)
+    if 'results' in data and (not isinstance(data['results'], Sequence) or isinstance(data['results'], string_types)):
+        data['ansible_module_results'] = data.pop('results')
+        __main__.display.warning("Found internal 'results' key in module return, renamed to 'ansible_module_results'.")
+    remove_internal_keys(data)
+    for stream in ('stdout', 'stderr'):
+        if stream in data and stream + '_lines' not in data:
+            data[stream + '_lines'] = (data[stream] or u'').splitlines()
+    return wrap_var(data)
+
+
+_spawn_module = ActionBase._execute_module
+
+
+def _count(index):
+    with _stats.get_lock():
+        _stats[index] += 1
+
+
+def get_stats():
+    """ return the number of modules run in-process and the usual way since the last call, or `None` """
+    if _stats is None:
+        return None
+    with _stats.get_lock():
+        stats = tuple(_stats)
+        _stats[0] = _stats[1] = 0
+    return stats
+
+
+def enable(modules=IN_PROCESS_MODULES):
+    """ run the ansible *modules* given by name in-process from now on """
+    global _modules, _parent_pid, _stats
+
+    _modules = {}
+    for name in modules:
+        module = None
+        if _MODULE_NAME.match(name):
+            try:
+                module = importlib.import_module('ansible.modules.' + name)
+            except ImportError:
+                pass
+        if module is None:
+            raise ValueError('unknown ansible module {}'.format(name))
+        if not callable(getattr(module, 'main', None)):
+            raise ValueError('ansible module {} cannot run in-process'.format(name))
+        _modules[name] = module
+
+    _parent_pid = os.getpid()
+    if _stats is None:
+        _stats = multiprocessing.Array('l', 2)
+    ActionBase._execute_module = _execute_module
+
+
+def disable():
+    global _modules, _parent_pid, _stats
+    _modules = _parent_pid = _stats = None
+    ActionBase._execute_module = _spawn_module
@@ -0,0 +1,283 @@
+# a cache of compiled Jinja2 templates, kept in /var/cache/paternoster
+# between runs. Ansible compiles every template and expression it renders
+# from scratch (through Environment.from_string, which bypasses Jinja2's own
+# bytecode caches), in every process and on every run. Once enabled, the
+# environments ansible creates look up the compiled code here first.
+#
+# Entries are keyed by a hash of the template source and of all settings of
+# the environment, which change the generated code (delimiters, extensions,
+# finalize, ...), as well as the versions of python, Jinja2 and ansible. The
+# generated code also depends on the filters and tests used by the template
+# (how they are called), so each entry records them and is only used, if they
+# are still the same. Jinja2 calls filters and tests with constant arguments
+# only when compiling and puts the result into the code, even without its
+# optimizer. Templates doing so are never cached, as not every filter returns
+# the same every time (e.g. strftime or password_hash).
+#
+# Entries follow the rules of cache.py and are only readable by root. Each
+# key maps to one of a fixed number of slots, so a new entry evicts the one
+# using its slot, without having to scan the directory. The cache therefore
+# never grows beyond SLOTS * MAX_ENTRY_SIZE (256 MiB), larger entries are not
+# stored. Most entries are just a few KiB, though.
+# The compilations skipped and done are counted in shared memory, so
+# templates compiled in ansible's worker processes are counted as well.
+from __future__ import absolute_import
+
+import hashlib
+import marshal
+import multiprocessing
+
+import ansible.release
+import ansible.template
+import jinja2
+from jinja2 import nodes
+import six
+
+from .. import cache
+
+TEMPLATE_CACHE = 'jinja2'
+# bump the version, whenever the format of the entries changes.
+TEMPLATE_CACHE_VERSION = 1
+SLOTS = 4096
+MAX_ENTRY_SIZE = 64 * 1024
+# compiled templates kept in memory by each process, on top of the files.
+MEMORY_ENTRIES = 256
+MAX_SIGNATURES = 4096
+
+_MAGIC = b'PNJ2BC01'
+
+try:
+    from importlib.util import MAGIC_NUMBER as _PYTHON_MAGIC
+except ImportError:  # python 2
+    import imp
+    _PYTHON_MAGIC = imp.get_magic()
+
+# the ways a filter or test can ask for the context, environment, ... in
+# Jinja2 3.x and 2.x
+_PASS_ATTRIBUTES = (
+    'jinja_pass_arg',
+    'contextfilter', 'evalcontextfilter', 'environmentfilter',
+    'contextfunction', 'evalcontextfunction', 'environmentfunction',
+)
+_ENVIRONMENT_SETTINGS = (
+    'block_start_string', 'block_end_string',
+    'variable_start_string', 'variable_end_string',
+    'comment_start_string', 'comment_end_string',
+    'line_statement_prefix', 'line_comment_prefix',
+    'trim_blocks', 'lstrip_blocks', 'newline_sequence', 'keep_trailing_newline',
+    'optimized', 'is_async', 'enable_async',
+)
+
+# nodes taking their value from the context the template is rendered in
+_VARIABLE_NODES = tuple(
+    getattr(nodes, name) for name in (
+        'Name', 'ContextReference', 'DerivedContextReference', 'InternalName', 'ImportedName',
+    )
+    if hasattr(nodes, name)
+)
+
+_cache = None
+_signatures = {}
+
+
+def _function_signature(func):
+    """ return what the code compiled for a call of *func* depends on """
+    if func is None:
+        return None
+
+    known = _signatures.get(id(func))
+    if known is not None and known[0] is func:
+        return known[1]
+
+    passes = tuple(str(getattr(func, attr)) for attr in _PASS_ATTRIBUTES if getattr(func, attr, False))
+    target = getattr(func, '__func__', func)
+    while hasattr(target, '__wrapped__'):
+        target = target.__wrapped__
+    code = getattr(target, '__code__', None)
+    digest = hashlib.sha1(marshal.dumps(code)).hexdigest() if code is not None else None
+    signature = (passes, getattr(target, '__module__', None), getattr(target, '__name__', None), digest)
+
+    # the function is kept, so its id cannot be reused. Ansible wraps its
+    # filters anew for every task, so the functions are dropped once in a while.
+    if len(_signatures) >= MAX_SIGNATURES:
+        _signatures.clear()
+    _signatures[id(func)] = (func, signature)
+    return signature
+
+
+def _environment_key(env):
+    finalize = getattr(env, 'finalize', None)
+    autoescape = env.autoescape
+    return repr((
+        [getattr(env, setting, None) for setting in _ENVIRONMENT_SETTINGS],
+        sorted(env.extensions),
+        _function_signature(finalize) if finalize else None,
+        autoescape if isinstance(autoescape, bool) else _function_signature(autoescape),
+        env.code_generator_class.__module__, env.code_generator_class.__name__,
+    ))
+
+
+def _dependencies(template):
+    """ return the filters and tests used by the parsed *template* """
+    return sorted(set(
+        [('filter', node.name) for node in template.find_all(nodes.Filter)]
+        + [('test', node.name) for node in template.find_all(nodes.Test)]
+    ))
+
+
+def _has_constant_calls(template):
+    """ return whether the parsed *template* calls a filter or test with constant arguments only """
+    for node in template.find_all((nodes.Filter, nodes.Test)):
+        # a {% filter %} block is applied to its body at runtime
+        if node.node is not None and next(node.find_all(_VARIABLE_NODES), None) is None:
+            return True
+    return False
+
+
+def _dependency_signatures(env, dependencies):
+    return [
+        _function_signature((env.filters if kind == 'filter' else env.tests).get(name))
+        for kind, name in dependencies
+    ]
+
+
+class TemplateCache(object):
+    def __init__(self, directory):
+        self._directory = directory
+        self._memory = {}
+        # hits and misses, shared with the worker processes forked by ansible
+        self._stats = multiprocessing.Array('l', 2)
+
+    @classmethod
+    def open(cls):
+        """ return the cache or `None`, if it cannot be used (e.g. the process is not root) """
+        if not cache.can_write():
+            # entries are only readable by root
+            return None
+        directory = cache.get_dir(TEMPLATE_CACHE)
+        return cls(directory) if directory is not None else None
+
+    @property
+    def hits(self):
+        return self._stats[0]
+
+    @property
+    def misses(self):
+        return self._stats[1]
+
+    def reset_stats(self):
+        with self._stats.get_lock():
+            self._stats[0] = self._stats[1] = 0
+
+    def _count(self, index):
+        with self._stats.get_lock():
+            self._stats[index] += 1
+
+    @staticmethod
+    def key(env, source, name, filename, defer_init):
+        data = repr((
+            TEMPLATE_CACHE_VERSION, _PYTHON_MAGIC, jinja2.__version__, ansible.release.__version__,
+            _environment_key(env), name, filename, defer_init,
+        ))
+        if isinstance(source, six.text_type):
+            source = source.encode('utf-8')
+        return hashlib.sha256(data.encode('utf-8') + b'\0' + source).hexdigest()
+
+    def _slot(self, key):
+        return '{:04x}'.format(int(key[:8], 16) % SLOTS)
+
+    def _read(self, key):
+        data = cache.read(self._directory, self._slot(key))
+        if data is None or not data.startswith(_MAGIC):
+            return None
+
+        header_size = len(_MAGIC) + 64
+        digest, payload = data[len(_MAGIC):header_size], data[header_size:]
+        if digest != hashlib.sha256(payload).hexdigest().encode('ascii'):
+            return None
+        try:
+            entry_key, dependencies, signatures, code = marshal.loads(payload)
+        except (ValueError, EOFError, TypeError):
+            return None
+        # another template may use the slot by now
+        return (dependencies, signatures, code) if entry_key == key else None
+
+    def _write(self, key, entry):
+        try:
+            payload = marshal.dumps((key,) + entry)
+        except ValueError:
+            return
+        if len(payload) > MAX_ENTRY_SIZE:
+            return
+        digest = hashlib.sha256(payload).hexdigest().encode('ascii')
+        cache.write(self._directory, self._slot(key), _MAGIC + digest + payload, mode=0o600)
+
+    def _remember(self, key, entry):
+        if len(self._memory) >= MEMORY_ENTRIES:
+            self._memory.clear()
+        self._memory[key] = entry
+
+    def compile(self, env, source, name, filename, defer_init, compile_template):
+        """
+        Return the code of *source* compiled for the environment *env*,
+        calling *compile_template* with the parsed template on a miss.
+
+        """
+        key = self.key(env, source, name, filename, defer_init)
+        entry = self._memory.get(key)
+        if entry is None:
+            entry = self._read(key)
+        if entry is not None:
+            dependencies, signatures, code = entry
+            if _dependency_signatures(env, dependencies) == signatures:
+                self._remember(key, entry)
+                self._count(0)
+                return code
+
+        self._count(1)
+        template = env.parse(source, name, filename)
+        code = compile_template(template)
+        if _has_constant_calls(template):
+            # the results of the calls are part of the code
+            return code
+        dependencies = _dependencies(template)
+        entry = (dependencies, _dependency_signatures(env, dependencies), code)
+        self._remember(key, entry)
+        self._write(key, entry)
+        return code
+
+
+_compile_uncached = ansible.template.AnsibleEnvironment.compile
+
+
+def _compile(env, source, name=None, filename=None, raw=False, defer_init=False):
+    """ AnsibleEnvironment.compile, using the enabled cache """
+    if _cache is None or raw or not isinstance(source, six.string_types):
+        return _compile_uncached(env, source, name, filename, raw, defer_init)
+
+    return _cache.compile(
+        env, source, name, filename, defer_init,
+        lambda template: _compile_uncached(env, template, name, filename, raw, defer_init),
+    )
+
+
+def enable():
+    """ use the cache for all templates compiled by ansible from now on, returns the cache or `None` """
+    global _cache
+    if _cache is None:
+        _cache = TemplateCache.open()
+        if _cache is not None:
+            # ansible creates environments all over the place, but always
+            # using its own class.
+            ansible.template.AnsibleEnvironment.compile = _compile
+    return _cache
+
+
+def disable():
+    global _cache
+    _cache = None
+    ansible.template.AnsibleEnvironment.compile = _compile_uncached
+
+
+def get_cache():
+    return _cache
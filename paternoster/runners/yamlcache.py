@@ -0,0 +1,207 @@
+# a cache of the files parsed by ansible's DataLoader (playbooks, tasks, vars,
+# handlers, roles, ...), kept in /var/cache/paternoster between runs. See
+# CachingDataLoader in ansibleexecutor.py.
+#
+# Entries are only written by root (see cache.py) and only readable by root,
+# as the files they are made of might be. Each entry is keyed by the path,
+# device, inode, modification time and size of the file it was parsed from,
+# and carries a checksum of its content, which is verified before the entry is
+# used. Anything unexpected is treated as a miss, which simply means that the
+# file is parsed again.
+#
+# The parsed data is stored as JSON, with each node tagged by its type, so
+# ansible's YAML objects come back with their position in the file (used
+# for error messages). Files containing anything else, like vault encrypted
+# values or dates, are not cached.
+from __future__ import absolute_import
+
+import hashlib
+import json
+import os
+
+import ansible.release
+from ansible.parsing.yaml.objects import AnsibleMapping
+from ansible.parsing.yaml.objects import AnsibleSequence
+from ansible.parsing.yaml.objects import AnsibleUnicode
+from ansible.utils.unsafe_proxy import AnsibleUnsafeText
+import six
+
+from .. import cache
+
+YAML_CACHE = 'yaml'
+# bump the version, whenever the format of the entries changes.
+YAML_CACHE_VERSION = 1
+
+_UNICODE, _SEQUENCE, _LIST, _MAPPING, _DICT, _UNSAFE = range(6)
+_SCALARS = (type(None), bool, float) + six.integer_types
+
+
+class Uncacheable(ValueError):
+    pass
+
+
+def _encode(data, source):
+    """ return *data* (parsed from the file *source*) as a structure of JSON types """
+    active = set()
+
+    def check_source(obj):
+        # the position would be wrong, once restored
+        if obj._data_source not in (None, source):
+            raise Uncacheable('data from another source')
+
+    def encode(obj):
+        kind = type(obj)
+        if kind in _SCALARS or kind is six.text_type:
+            return obj
+        if kind is AnsibleUnicode:
+            check_source(obj)
+            return [_UNICODE, six.text_type(obj), obj._line_number, obj._column_number]
+        if kind is AnsibleUnsafeText:
+            return [_UNSAFE, six.text_type(obj)]
+
+        if id(obj) in active:
+            raise Uncacheable('recursive data')
+        active.add(id(obj))
+        try:
+            if kind is AnsibleSequence:
+                check_source(obj)
+                return [_SEQUENCE, obj._line_number, obj._column_number] + [encode(v) for v in obj]
+            if kind is list:
+                return [_LIST] + [encode(v) for v in obj]
+            if kind is AnsibleMapping:
+                check_source(obj)
+                encoded = [_MAPPING, obj._line_number, obj._column_number]
+            elif kind is dict:
+                encoded = [_DICT]
+            else:
+                raise Uncacheable('cannot cache {}'.format(kind.__name__))
+            for key, value in obj.items():
+                encoded.append(encode(key))
+                encoded.append(encode(value))
+            return encoded
+        finally:
+            active.discard(id(obj))
+
+    return encode(data)
+
+
+def _decode(data, source):
+    def decode(obj):
+        if type(obj) is not list:
+            return obj
+
+        kind = obj[0]
+        if kind == _UNICODE:
+            node = AnsibleUnicode(obj[1])
+            node._data_source, node._line_number, node._column_number = source, obj[2], obj[3]
+            return node
+        if kind == _UNSAFE:
+            return AnsibleUnsafeText(obj[1])
+        if kind == _SEQUENCE:
+            node = AnsibleSequence([decode(v) for v in obj[3:]])
+            node._data_source, node._line_number, node._column_number = source, obj[1], obj[2]
+            return node
+        if kind == _LIST:
+            return [decode(v) for v in obj[1:]]
+
+        if kind == _MAPPING:
+            node = AnsibleMapping()
+            node._data_source, node._line_number, node._column_number = source, obj[1], obj[2]
+            start = 3
+        elif kind == _DICT:
+            node = {}
+            start = 1
+        else:
+            raise ValueError('unknown node')
+        for i in range(start, len(obj), 2):
+            node[decode(obj[i])] = decode(obj[i + 1])
+        return node
+
+    return decode(data)
+
+
+def _key(path):
+    st = os.stat(path)
+    return [YAML_CACHE_VERSION, ansible.release.__version__, path, st.st_dev, st.st_ino, st.st_mtime, st.st_size]
+
+
+def _entry_name(path):
+    return hashlib.sha256(path.encode('utf-8')).hexdigest() + '.json'
+
+
+class YAMLCache(object):
+    """ the on-disk cache, counting the hits and misses since it was last reset """
+
+    def __init__(self, directory):
+        self._directory = directory
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def open(cls):
+        """ return the cache or `None`, if its directory cannot be trusted """
+        directory = cache.get_dir(YAML_CACHE)
+        return cls(directory) if directory is not None else None
+
+    def reset_stats(self):
+        self.hits = self.misses = 0
+
+    def load(self, path):
+        """
+        Return the key of the file *path* as it is now and the data parsed
+        from it before in its encoded form (see `decode`), or `None` on a
+        miss. The key is needed to store the data, once it has been parsed.
+
+        """
+        try:
+            key = _key(path)
+        except OSError:
+            self.misses += 1
+            return None, None
+
+        data = self._load(path, key)
+        if data is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return key, data
+
+    def _load(self, path, key):
+        raw = cache.read(self._directory, _entry_name(path))
+        if raw is None:
+            return None
+
+        # the first line holds the key and the checksum of the rest
+        header, _, payload = raw.partition(b'\n')
+        try:
+            header = json.loads(header.decode('utf-8'))
+            if header.get('key') != key or header.get('sha256') != hashlib.sha256(payload).hexdigest():
+                return None
+            return json.loads(payload.decode('utf-8'))
+        except (ValueError, AttributeError):
+            return None
+
+    @staticmethod
+    def decode(encoded, path):
+        """
+        Return a new copy of the data returned by `load` for *path*. Raises
+        ValueError, if the entry is not valid after all.
+
+        """
+        try:
+            return _decode(encoded, path)
+        except (TypeError, IndexError, KeyError) as e:
+            raise ValueError('invalid cache entry: {}'.format(e))
+
+    def store(self, path, key, data):
+        """ store *data* parsed from *path*, while it had the given *key* """
+        if key is None or data is None or not cache.can_write():
+            return False
+
+        try:
+            payload = json.dumps(_encode(data, path), separators=(',', ':')).encode('utf-8')
+        except (ValueError, TypeError):
+            return False
+
+        header = json.dumps({'key': key, 'sha256': hashlib.sha256(payload).hexdigest()}).encode('utf-8')
+        return cache.write(self._directory, _entry_name(path), header + b'\n' + payload, mode=0o600)
@@ -1,19 +1,112 @@
 # this code is executed when paternoster is used as
 # part of a shebang line, at the beginning of a script.
 from __future__ import absolute_import
+from __future__ import print_function
 
+import hashlib
+import json
 import os.path
 import sys
 
+import six
 import yaml
+import yaml.composer
+import yaml.constructor
+import yaml.events
+import yaml.resolver
 
 import paternoster.types
+from . import cache
+
+# the libyaml based loader is a lot faster, but not always available.
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# the extracted configuration is cached (see cache.py), so the playbook does
+# not have to be parsed twice for every run of a script (before and after
+# sudo). Bump the version, whenever the format of the cache entries changes.
+CONFIG_CACHE = 'config'
+CONFIG_CACHE_VERSION = 1
+
+# the settings among the vars of a play, which are passed to the AnsibleRunner
+# instead of Paternoster.
+RUNNER_OPTIONS = ('in_process_modules', 'inline_tasks', 'yaml_cache', 'template_cache', 'ansiballz_cache')
 
 
 def _load_playbook(path):
     with open(path) as f:
-        playbook = yaml.safe_load(f)
+        playbook = yaml.load(f, Loader=YAML_LOADER)
+
+    assert type(playbook) == list
+    return playbook
+
+
+class _EventLoader(yaml.composer.Composer, yaml.constructor.SafeConstructor, yaml.resolver.Resolver):
+    """ constructs a document from a list of already parsed events """
+
+    def __init__(self, events):
+        self._events = list(reversed(events))
+        yaml.composer.Composer.__init__(self)
+        yaml.constructor.SafeConstructor.__init__(self)
+        yaml.resolver.Resolver.__init__(self)
+
+    def check_event(self, *choices):
+        if not self._events:
+            return False
+        return not choices or isinstance(self._events[-1], choices)
+
+    def peek_event(self):
+        return self._events[-1]
+
+    def get_event(self):
+        return self._events.pop()
+
+
+def _first_item_events(loader):
+    """ return the events making up the first item of the top-level sequence, without parsing any further """
+    head = []
+    while not loader.check_event(yaml.events.SequenceStartEvent):
+        assert loader.check_event(yaml.events.StreamStartEvent, yaml.events.DocumentStartEvent)
+        head.append(loader.get_event())
+    head.append(loader.get_event())
+
+    item = []
+    depth = 0
+    while not item or depth > 0:
+        if not item and loader.check_event(yaml.events.SequenceEndEvent):
+            break
+        event = loader.get_event()
+        if isinstance(event, yaml.events.CollectionStartEvent):
+            depth += 1
+        elif isinstance(event, yaml.events.CollectionEndEvent):
+            depth -= 1
+        item.append(event)
+
+    tail = [
+        yaml.events.SequenceEndEvent(),
+        yaml.events.DocumentEndEvent(),
+        yaml.events.StreamEndEvent(),
+    ]
+    return head + item + tail
+
+
+def _load_playbook_head(path):
+    """
+    Load only the first play of the playbook at *path*. Parsing stops right
+    after it, which keeps the time needed independent of the size of the
+    remaining playbook.
+
+    Returns a list containing the first play, just like `_load_playbook`
+    would, minus all the other plays.
+
+    """
+    with open(path) as f:
+        loader = YAML_LOADER(f)
+        try:
+            events = _first_item_events(loader)
+        finally:
+            loader.dispose()
 
+    playbook = _EventLoader(events).get_single_data()
     assert type(playbook) == list
     return playbook
 
@@ -27,14 +120,91 @@ def _find_paternoster_config(playbook):
     return play['vars']
 
 
+def _cache_key(path):
+    st = os.stat(path)
+    return [CONFIG_CACHE_VERSION, path, st.st_dev, st.st_ino, st.st_mtime, st.st_size]
+
+
+def _load_cached_config(directory, name, key):
+    data = cache.read(directory, name)
+    if data is None:
+        return None
+
+    try:
+        entry = json.loads(data.decode('utf-8'))
+    except ValueError:
+        return None
+
+    if entry.get('key') != key:
+        return None
+    return _native_strings(entry.get('config'))
+
+
+def _native_strings(data):
+    """ return *data* read from JSON with the strings the YAML loader returns (python 2 only) """
+    if isinstance(data, dict):
+        return dict((_native_strings(k), _native_strings(v)) for k, v in data.items())
+    if isinstance(data, list):
+        return [_native_strings(v) for v in data]
+    if six.PY2 and isinstance(data, six.text_type):
+        # yaml only uses unicode for strings, which are not plain ASCII
+        try:
+            return data.encode('ascii')
+        except UnicodeEncodeError:
+            pass
+    return data
+
+
+def _store_cached_config(directory, name, key, config):
+    try:
+        data = json.dumps({'key': key, 'config': config})
+    except (TypeError, ValueError):
+        # e.g. dates, which can be part of YAML but not of JSON.
+        return
+    cache.write(directory, name, data.encode('utf-8'))
+
+
+def load_config(path):
+    path = os.path.abspath(path)
+    directory = cache.get_dir(CONFIG_CACHE)
+    if directory is None:
+        return _find_paternoster_config(_load_playbook_head(path))
+
+    key = _cache_key(path)
+    name = hashlib.sha256(path.encode('utf-8')).hexdigest() + '.json'
+
+    config = _load_cached_config(directory, name, key)
+    if config is None:
+        config = _find_paternoster_config(_load_playbook_head(path))
+        _store_cached_config(directory, name, key, config)
+    return config
+
+
+def create_paternoster(path, config, plays=None, **kwargs):
+    runner_parameters = {'playbook': path}
+    if plays is not None:
+        runner_parameters['plays'] = plays
+
+    kwargs.update(config)
+    for name in RUNNER_OPTIONS:
+        if name in kwargs:
+            runner_parameters[name] = kwargs.pop(name)
+    return paternoster.Paternoster(
+        runner_parameters=runner_parameters,
+        **kwargs
+    )
+
+
 def main():
     playbookpath = os.path.abspath(sys.argv[1])
-    playbook = _load_playbook(playbookpath)
-    config = _find_paternoster_config(playbook)
+    config = load_config(playbookpath)
 
     sys.argv = [playbookpath] + sys.argv[2:]
 
-    paternoster.Paternoster(
-        runner_parameters={'playbook': playbookpath},
-        **config
-    ).auto()
+    try:
+        script = create_paternoster(playbookpath, config)
+    except ValueError as e:
+        # e.g. unknown types, before any parameter is looked at
+        print('{}: {}'.format(playbookpath, e), file=sys.stderr)
+        sys.exit(3)
+    script.auto()
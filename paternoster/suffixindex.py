@@ -0,0 +1,246 @@
+# a precompiled copy of the public suffix list, which is used by
+# paternoster.types.domain instead of tldextract, if it exists. Short-lived
+# processes do not have to load and parse the whole list this way: the index
+# is memory-mapped, so all of them share a single copy in the page cache,
+# and a lookup only touches the few pages it needs.
+#
+# The index is a trie of the reversed labels of all suffix rules ("co.uk"
+# becomes "uk" -> "co"), stored in flat arrays:
+#
+#  header: magic, number of nodes, number of edges, size of the label pool
+#  nodes:  index of the first outgoing edge, number of edges, end-of-rule flag
+#  edges:  offset and length of the label in the pool, index of the child node
+#  labels: all distinct labels, concatenated
+#
+# The edges of every node are stored next to each other, sorted by their
+# label, so they can be searched using bisection. Labels are stored IDNA
+# encoded, just like domain() encodes the values it checks. Lookups follow
+# the same rules as tldextract, including wildcards ("*.ck") and exceptions
+# ("!www.ck"), and leave out the private domains, like tldextract does by
+# default.
+from __future__ import absolute_import
+from __future__ import print_function
+
+import argparse
+import io
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+from . import cache
+
+INDEX_CACHE = 'suffixes'
+INDEX_NAME = 'public_suffix_list.idx'
+
+_MAGIC = b'PSLIDX01'
+_HEADER = struct.Struct('<8sIII')
+_NODE = struct.Struct('<IIB')
+_EDGE = struct.Struct('<IHI')
+
+_PRIVATE_DOMAINS = '// ===BEGIN PRIVATE DOMAINS==='
+
+
+def parse_suffix_list(lines):
+    """ return the rules of the public (ICANN) section of a suffix list """
+    rules = []
+    for line in lines:
+        line = line.strip()
+        if line.startswith(_PRIVATE_DOMAINS):
+            break
+        if not line or line.startswith('//'):
+            continue
+        rules.append(line.split()[0])
+    return rules
+
+
+def _encode_label(label):
+    label = label.lower()
+    if label == '*':
+        return b'*'
+    if label.startswith('!'):
+        return b'!' + _encode_label(label[1:])
+    try:
+        return label.encode('idna')
+    except UnicodeError:
+        return label.encode('utf-8')
+
+
+class _Node(object):
+    def __init__(self):
+        self.children = {}
+        self.end = False
+
+
+def compile_rules(rules):
+    """ return the binary index for the suffix *rules* (e.g. "co.uk", "*.ck", "!www.ck") """
+    root = _Node()
+    for rule in rules:
+        node = root
+        for label in reversed(rule.split('.')):
+            node = node.children.setdefault(_encode_label(label), _Node())
+        node.end = True
+
+    nodes = []
+    edges = []
+    labels = {}
+    pool = []
+    pool_size = 0
+
+    # breadth-first, so the children of every node get consecutive indexes.
+    queue = [root]
+    for node in queue:
+        nodes.append(_NODE.pack(len(edges), len(node.children), node.end))
+        for label in sorted(node.children):
+            if label not in labels:
+                labels[label] = pool_size
+                pool.append(label)
+                pool_size += len(label)
+            edges.append(_EDGE.pack(labels[label], len(label), len(queue)))
+            queue.append(node.children[label])
+
+    header = _HEADER.pack(_MAGIC, len(nodes), len(edges), pool_size)
+    return b''.join([header] + nodes + edges + pool)
+
+
+def compile_file(path):
+    with io.open(path, encoding='utf-8') as f:
+        return compile_rules(parse_suffix_list(f))
+
+
+class SuffixIndex(object):
+    def __init__(self, data):
+        if len(data) < _HEADER.size:
+            raise ValueError('suffix index is truncated')
+
+        magic, node_count, edge_count, pool_size = _HEADER.unpack_from(data, 0)
+        if magic != _MAGIC:
+            raise ValueError('not a suffix index')
+
+        self._nodes = _HEADER.size
+        self._edges = self._nodes + node_count * _NODE.size
+        self._pool = self._edges + edge_count * _EDGE.size
+        if len(data) != self._pool + pool_size:
+            raise ValueError('suffix index is truncated')
+
+        self._data = data
+
+    @classmethod
+    def from_file(cls, f):
+        """ map the index stored in the (binary) file object *f* into memory """
+        return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def _child(self, node, label):
+        first, count, _ = _NODE.unpack_from(self._data, self._nodes + node * _NODE.size)
+
+        lo, hi = first, first + count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset, length, child = _EDGE.unpack_from(self._data, self._edges + mid * _EDGE.size)
+            start = self._pool + offset
+            edge_label = self._data[start:start + length]
+            if edge_label == label:
+                return child
+            elif edge_label < label:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def _is_end(self, node):
+        return _NODE.unpack_from(self._data, self._nodes + node * _NODE.size)[2]
+
+    def suffix_start(self, labels):
+        """ return the index of the first label of the public suffix in *labels* (a list of bytes) """
+        node = 0
+        suffix_idx = label_idx = len(labels)
+        for label in reversed(labels):
+            child = self._child(node, label)
+            if child is not None:
+                label_idx -= 1
+                node = child
+                if self._is_end(node):
+                    suffix_idx = label_idx
+                continue
+
+            if self._child(node, b'*') is not None:
+                if self._child(node, b'!' + label) is not None:
+                    return label_idx
+                return label_idx - 1
+            break
+
+        return suffix_idx
+
+    def split(self, name):
+        """
+        Return the label right in front of the public suffix of the (IDNA encoded)
+        domain *name* and the suffix itself. Just like tldextract, the suffix is
+        empty and the last label is returned, if no rule matches.
+
+        """
+        labels = name.lower().split('.')
+        start = self.suffix_start([label.encode('utf-8') for label in labels])
+        return (
+            labels[start - 1] if start > 0 else '',
+            '.'.join(labels[start:]),
+        )
+
+
+def load():
+    """ return the index installed by paternoster-compile-suffixes or `None`, if it is missing or invalid """
+    directory = cache.get_dir(INDEX_CACHE)
+    if directory is None:
+        return None
+
+    f = cache.open_entry(directory, INDEX_NAME)
+    if f is None:
+        return None
+
+    with f:
+        try:
+            return SuffixIndex.from_file(f)
+        except (ValueError, EnvironmentError):
+            return None
+
+
+def _write_file(path, data):
+    fd, tmppath = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmppath, 0o644)
+        os.rename(tmppath, path)
+    except EnvironmentError:
+        os.unlink(tmppath)
+        raise
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compile a public suffix list into the index used to validate domains.',
+    )
+    parser.add_argument(
+        'suffix_list',
+        help='the public suffix list to compile, e.g. a copy of https://publicsuffix.org/list/public_suffix_list.dat',
+    )
+    parser.add_argument(
+        '-o', '--output',
+        help='write the index to this file, instead of installing it for all scripts',
+    )
+    args = parser.parse_args()
+
+    try:
+        data = compile_file(args.suffix_list)
+        SuffixIndex(data)
+
+        if args.output:
+            _write_file(args.output, data)
+        else:
+            directory = cache.get_dir(INDEX_CACHE)
+            if directory is None or not cache.write(directory, INDEX_NAME, data):
+                print('the index can only be installed by root', file=sys.stderr)
+                sys.exit(1)
+    except (EnvironmentError, UnicodeError, ValueError) as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
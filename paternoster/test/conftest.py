@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmpdir, monkeypatch):
+    # the tests usually run as root, keep them from filling the real cache.
+    from .. import cache
+
+    path = tmpdir.join('cache')
+    monkeypatch.setattr(cache, 'CACHE_DIR', str(path))
+    return path
+
+
+@pytest.fixture(autouse=True)
+def type_registry(monkeypatch):
+    # validators are shared through the registry, including their caches.
+    from .. import typeregistry
+
+    registry = typeregistry.TypeRegistry()
+    monkeypatch.setattr(typeregistry, 'registry', registry)
+    return registry
+
+
+# modules, which patch ansible for the whole process once they are enabled
+# (e.g. by AnsibleRunner), see their disable functions.
+PATCHING_MODULES = (
+    'paternoster.runners.templatecache',
+    'paternoster.runners.ansiballzcache',
+    'paternoster.runners.inprocess',
+    'paternoster.runners.inlinestrategy',
+)
+
+
+@pytest.fixture(autouse=True)
+def runner_patches():
+    # undo them after each test, the caches would use the cache_dir of a
+    # test which is gone.
+    yield
+    import sys
+
+    for name in PATCHING_MODULES:
+        module = sys.modules.get(name)
+        if module is not None:
+            module.disable()
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+import base64
+import io
+import json
+import os
+import shutil
+import stat
+import zipfile
+from distutils.version import LooseVersion
+
+import ansible.constants
+import ansible.release
+import pytest
+
+ANSIBLE_VERSION = LooseVersion(ansible.release.__version__)
+SKIP_ANSIBLE_TESTS = ANSIBLE_VERSION < LooseVersion('2.10.0')
+
+pytestmark = pytest.mark.skipif(SKIP_ANSIBLE_TESTS, reason="the AnsiballZ cache requires ansible 2.10+")
+
+
+def _payload(name='ping'):
+    """ build the payload for ansible's module *name*, just like ansible does """
+    import ansible.modules
+    from ansible.executor import module_common
+
+    path = os.path.join(os.path.dirname(ansible.modules.__file__), name + '.py')
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, 'w') as zf:
+        module_common.recursive_finder(name, 'ansible.modules.' + name, data, zf)
+        module_common._add_module_to_zip(zf, 'ansible.modules.' + name, data)
+    return path, data, base64.b64encode(output.getvalue())
+
+
+def _zip(files):
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, 'w') as zf:
+        for name, data in files.items():
+            zf.writestr(name, data)
+    return base64.b64encode(output.getvalue())
+
+
+@pytest.fixture(scope='module')
+def payload():
+    return _payload()
+
+
+def test_cache(payload, cache_dir):
+    from ..runners.ansiballzcache import AnsiballZCache, ANSIBALLZ_CACHE
+
+    path, data, zipdata = payload
+    ansiballz_cache = AnsiballZCache.open()
+    key = ansiballz_cache.key(path, data, 'ZIP_STORED', '/usr/bin/python3')
+    assert ansiballz_cache.load(key) is None
+    assert ansiballz_cache.store(key, zipdata)
+    assert ansiballz_cache.load(key) == zipdata
+
+    # the payload only consists of code shipped with ansible
+    entry = cache_dir.join(ANSIBALLZ_CACHE, key)
+    assert stat.S_IMODE(os.stat(str(entry)).st_mode) == 0o644
+    header = json.loads(entry.read_binary().partition(b'\n')[0].decode('utf-8'))
+    assert 'module_utils/basic.py' in header['files']
+
+
+def test_key(payload):
+    from ..runners.ansiballzcache import AnsiballZCache
+
+    path, data, _ = payload
+    key = AnsiballZCache.key(path, data, 'ZIP_STORED', '/usr/bin/python3')
+    assert AnsiballZCache.key(path, data, 'ZIP_STORED', '/usr/bin/python3') == key
+    assert AnsiballZCache.key(path, data + b'\n', 'ZIP_STORED', '/usr/bin/python3') != key
+    assert AnsiballZCache.key(path, data, 'ZIP_DEFLATED', '/usr/bin/python3') != key
+    assert AnsiballZCache.key(path, data, 'ZIP_STORED', '/usr/bin/python2') != key
+
+
+def test_changed_module_utils(payload, monkeypatch):
+    from ..runners import ansiballzcache
+
+    path, data, zipdata = payload
+    ansiballz_cache = ansiballzcache.AnsiballZCache.open()
+    key = ansiballz_cache.key(path, data, 'ZIP_STORED', None)
+    ansiballz_cache.store(key, zipdata)
+
+    read_file = ansiballzcache._read_file
+    monkeypatch.setattr(
+        ansiballzcache, '_read_file',
+        lambda relpath: b'# changed' if relpath == 'module_utils/basic.py' else read_file(relpath),
+    )
+    assert ansiballz_cache.load(key) is None
+
+
+@pytest.mark.parametrize("files", [
+    {'ansible_collections/ns/coll/plugins/module_utils/x.py': b''},
+    {'ansible/module_utils/basic.py': b'# not the one shipped with ansible'},
+])
+def test_uncacheable(files):
+    from ..runners.ansiballzcache import AnsiballZCache
+
+    assert not AnsiballZCache.open().store('0' * 64, _zip(files))
+
+
+@pytest.mark.parametrize("corrupt", [
+    lambda data: data[:-1],
+    lambda data: data.replace(b'"sha256"', b'"sha"'),
+    lambda data: b'garbage',
+])
+def test_corrupted_entry(payload, cache_dir, corrupt):
+    from ..runners.ansiballzcache import AnsiballZCache, ANSIBALLZ_CACHE
+
+    path, data, zipdata = payload
+    ansiballz_cache = AnsiballZCache.open()
+    key = ansiballz_cache.key(path, data, 'ZIP_STORED', None)
+    ansiballz_cache.store(key, zipdata)
+
+    entry = cache_dir.join(ANSIBALLZ_CACHE, key)
+    entry.write_binary(corrupt(entry.read_binary()))
+    assert ansiballz_cache.load(key) is None
+
+
+def test_max_entries(cache_dir, monkeypatch):
+    from ..runners import ansiballzcache
+
+    monkeypatch.setattr(ansiballzcache, 'MAX_ENTRIES', 2)
+    ansiballz_cache = ansiballzcache.AnsiballZCache.open()
+    directory = cache_dir.join(ansiballzcache.ANSIBALLZ_CACHE)
+    zipdata = _zip({'ansible/modules/ping.py': b''})
+
+    for i, key in enumerate(['a', 'b']):
+        ansiballz_cache.store(key, zipdata)
+        os.utime(str(directory.join(key)), (1000 + i, 1000 + i))
+
+    # the least recently used entry goes first
+    assert ansiballz_cache.load('a') == zipdata
+    ansiballz_cache.store('c', zipdata)
+    assert sorted(directory.listdir(lambda p: not p.basename.startswith('.')), key=str) == [
+        directory.join('a'), directory.join('c'),
+    ]
+
+
+def test_not_root(payload, monkeypatch):
+    from .. import cache
+    from ..runners.ansiballzcache import AnsiballZCache
+
+    path, data, zipdata = payload
+    ansiballz_cache = AnsiballZCache.open()
+    monkeypatch.setattr(cache, 'can_write', lambda: False)
+    assert not ansiballz_cache.store(ansiballz_cache.key(path, data, 'ZIP_STORED', None), zipdata)
+
+
+def test_module_utils_next_to_playbook(tmpdir, monkeypatch):
+    from ansible.executor import module_common
+    from ..runners import ansiballzcache
+
+    assert ansiballzcache._only_ansible_module_utils()
+
+    get_paths = module_common.module_utils_loader._get_paths
+    monkeypatch.setattr(
+        module_common.module_utils_loader, '_get_paths',
+        lambda subdirs=True: [str(tmpdir)] + get_paths(subdirs=subdirs),
+    )
+    assert not ansiballzcache._only_ansible_module_utils()
+
+
+def test_runner_reports_stats(tmpdir, capsys, monkeypatch):
+    from ..runners.ansiblerunner import AnsibleRunner
+
+    playbook_path = tmpdir.join('playbook.yml')
+    playbook_path.write('- hosts: all\n  gather_facts: no\n  tasks:\n    - ping:\n    - ping:\n    - debug: msg=a\n')
+
+    monkeypatch.setattr(os, 'chdir', lambda *args, **kwargs: None)
+    assert AnsibleRunner(str(playbook_path), ansiballz_cache=True).run([], 2)
+    # ansible itself reuses the payload during a run
+    assert 'AnsiballZ cache: 0 payloads reused, 1 built' in capsys.readouterr()[0]
+
+    # as if it was another process, with a local temporary directory of its own
+    shutil.rmtree(os.path.join(ansible.constants.DEFAULT_LOCAL_TMP, 'ansiballz_cache'))
+    assert AnsibleRunner(str(playbook_path), ansiballz_cache=True).run([], 2)
+    assert 'AnsiballZ cache: 1 payloads reused, 0 built' in capsys.readouterr()[0]
+
+
+def test_runner_disabled(tmpdir, monkeypatch):
+    from ..runners import ansiballzcache
+    from ..runners.ansiblerunner import AnsibleRunner
+
+    playbook_path = tmpdir.join('playbook.yml')
+    playbook_path.write('- hosts: all\n  gather_facts: no\n  tasks:\n    - ping:\n')
+
+    monkeypatch.setattr(os, 'chdir', lambda *args, **kwargs: None)
+    # the cache is off by default
+    assert AnsibleRunner(str(playbook_path)).run([], 0)
+    assert ansiballzcache.get_cache() is None
+
+
+def test_script_option():
+    from .. import shebang
+    from .mockrunner import MockRunner
+
+    class Runner(MockRunner):
+        def __init__(self, playbook, ansiballz_cache=False):
+            super(Runner, self).__init__()
+            self.ansiballz_cache = ansiballz_cache
+
+    p = shebang.create_paternoster('/playbook.yml', {'ansiballz_cache': True}, runner_class=Runner)
+    assert p._runner.ansiballz_cache is True
+
+
+def test_seed_failed(tmpdir):
+    from ..runners.ansiballzcache import _seed
+
+    tmpdir.join('file').write('')
+    assert not _seed(str(tmpdir.join('file', 'ping-ZIP_STORED')), b'payload')
+
+    # the temporary file is removed again
+    tmpdir.join('dir', 'ping-ZIP_STORED').ensure(dir=True)
+    assert not _seed(str(tmpdir.join('dir', 'ping-ZIP_STORED')), b'payload')
+    assert tmpdir.join('dir').listdir() == [tmpdir.join('dir', 'ping-ZIP_STORED')]
+
+    assert _seed(str(tmpdir.join('new', 'ping-ZIP_STORED')), b'payload')
+    assert tmpdir.join('new', 'ping-ZIP_STORED').read_binary() == b'payload'
+
+
+def test_runner_seed_failed(tmpdir, capsys, monkeypatch):
+    from ..runners import ansiballzcache
+    from ..runners.ansiblerunner import AnsibleRunner
+
+    playbook_path = tmpdir.join('playbook.yml')
+    playbook_path.write('- hosts: all\n  gather_facts: no\n  tasks:\n    - ping:\n')
+
+    monkeypatch.setattr(os, 'chdir', lambda *args, **kwargs: None)
+    assert AnsibleRunner(str(playbook_path), ansiballz_cache=True).run([], 2)
+    capsys.readouterr()
+
+    # ansible builds the payload itself, if the cached one cannot be used
+    shutil.rmtree(os.path.join(ansible.constants.DEFAULT_LOCAL_TMP, 'ansiballz_cache'))
+    monkeypatch.setattr(ansiballzcache, '_seed', lambda path, zipdata: False)
+    assert AnsibleRunner(str(playbook_path), ansiballz_cache=True).run([], 2)
+    assert 'AnsiballZ cache: 0 payloads reused, 1 built' in capsys.readouterr()[0]
@@ -222,3 +222,99 @@ def test_msg_handling_hide_nonzero(capsys, monkeypatch):
 
     assert out == exp_stdout
     assert err == exp_stderr
+
+
+@pytest.mark.skipif(SKIP_ANSIBLE_TESTS, reason="ansible <2.4 requires python2")
+def test_paternoster_play_skipped(capsys, monkeypatch):
+    import os
+    from ..runners.ansiblerunner import AnsibleRunner
+
+    playbook_path = '/tmp/paternoster-test-playbook.yml'
+    playbook = """
+    - hosts: paternoster
+      vars:
+        parameters: []
+
+    - hosts: all
+      gather_facts: no
+      tasks:
+        - debug: msg=hi
+    """
+
+    with open(playbook_path, 'w') as f:
+        f.write(playbook)
+
+    monkeypatch.setattr(os, 'chdir', lambda *args, **kwargs: None)
+    assert AnsibleRunner(playbook_path).run([], 2)
+
+    out, err = capsys.readouterr()
+
+    assert 'PLAY [paternoster]' not in out
+    assert 'Could not match supplied host pattern' not in out + err
+    assert 'hi' in out
+
+
+@pytest.mark.skipif(SKIP_ANSIBLE_TESTS, reason="ansible <2.4 requires python2")
+def test_preloaded_plays(capsys, monkeypatch):
+    import os
+    from ..runners.ansiblerunner import AnsibleRunner
+
+    playbook_path = '/tmp/paternoster-test-playbook.yml'
+    playbook = """
+    - hosts: paternoster
+      vars:
+        parameters: []
+
+    - hosts: all
+      gather_facts: no
+      tasks:
+        - debug: msg={}
+    """
+
+    with open(playbook_path, 'w') as f:
+        f.write(playbook.format('preloaded'))
+    plays = AnsibleRunner.load_plays(playbook_path)
+    assert len(plays) == 1
+
+    # the file is not read again
+    with open(playbook_path, 'w') as f:
+        f.write(playbook.format('changed'))
+
+    monkeypatch.setattr(os, 'chdir', lambda *args, **kwargs: None)
+    assert AnsibleRunner(playbook_path, plays=plays).run([], False)
+    assert AnsibleRunner(playbook_path, plays=plays).run([], False)
+
+    out, err = capsys.readouterr()
+    assert out == 'preloaded\npreloaded\n'
+
+
+@pytest.mark.skipif(SKIP_ANSIBLE_TESTS, reason="ansible <2.4 requires python2")
+def test_repeated_runs(capsys, monkeypatch):
+    import os
+    from ..runners.ansiblerunner import AnsibleRunner
+
+    playbook_path = '/tmp/paternoster-test-playbook.yml'
+    playbook = """
+    - hosts: all
+      gather_facts: no
+      tasks:
+        - debug: msg="{} {{{{ param_name }}}}"
+    """
+
+    with open(playbook_path, 'w') as f:
+        f.write(playbook.format('first'))
+
+    monkeypatch.setattr(os, 'chdir', lambda *args, **kwargs: None)
+    runner = AnsibleRunner(playbook_path)
+    assert runner.run([('param_name', 'a')], False)
+    loader = runner._loader
+
+    # the playbook is parsed by the first run only
+    with open(playbook_path, 'w') as f:
+        f.write(playbook.format('changed'))
+
+    assert runner.run([('param_name', 'b')], False)
+    assert runner._loader is loader
+
+    out, err = capsys.readouterr()
+    assert out == 'first a\nfirst b\n'
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+
+PLAYBOOK = """- hosts: paternoster
+  vars:
+    become_user: {user}
+    parameters:
+      - name: domain
+        short: d
+        type: paternoster.types.domain
+
+- hosts: localhost
+  tasks: []
+"""
+
+
+@pytest.fixture
+def root(monkeypatch):
+    monkeypatch.setattr(os, 'geteuid', lambda: 0)
+
+
+@pytest.fixture
+def playbook(tmpdir):
+    path = tmpdir.join('playbook.yml')
+    path.write(PLAYBOOK.format(user='foo'))
+    return path
+
+
+def test_cache_roundtrip(root):
+    from .. import cache
+
+    directory = cache.get_dir('test')
+    assert cache.write(directory, 'entry', b'data')
+    assert cache.read(directory, 'entry') == b'data'
+    assert cache.read(directory, 'missing') is None
+
+
+def test_cache_not_written_by_users(monkeypatch, cache_dir):
+    from .. import cache
+
+    cache_dir.join('test').ensure(dir=True)
+    monkeypatch.setattr(os, 'geteuid', lambda: 1000)
+
+    directory = cache.get_dir('test')
+    assert not cache.write(directory, 'entry', b'data')
+    assert not os.path.exists(os.path.join(directory, 'entry'))
+
+
+def test_cache_write_failed(root, tmpdir, monkeypatch):
+    import errno
+    import tempfile
+    from .. import cache
+
+    def mkstemp(*args, **kwargs):
+        raise OSError(errno.ENOSPC, 'No space left on device')
+
+    # the directory may have gone away
+    assert not cache.write(str(tmpdir.join('missing')), 'entry', b'data')
+
+    directory = cache.get_dir('test')
+    monkeypatch.setattr(tempfile, 'mkstemp', mkstemp)
+    assert not cache.write(directory, 'entry', b'data')
+
+
+@pytest.mark.parametrize('target', ['dir', 'entry'])
+def test_cache_ignores_writable_entries(root, target):
+    from .. import cache
+
+    directory = cache.get_dir('test')
+    cache.write(directory, 'entry', b'data')
+    os.chmod(directory if target == 'dir' else os.path.join(directory, 'entry'), 0o777)
+
+    assert cache.get_dir('test') is None or cache.read(directory, 'entry') is None
+
+
+def test_config_cache(root, playbook, monkeypatch):
+    from .. import shebang
+
+    assert shebang.load_config(str(playbook))['become_user'] == 'foo'
+
+    def fail(path):
+        raise AssertionError('playbook parsed again')
+
+    monkeypatch.setattr(shebang, '_load_playbook_head', fail)
+    assert shebang.load_config(str(playbook))['become_user'] == 'foo'
+
+
+def test_config_cache_parameters(root, playbook):
+    from .. import shebang
+    from .mockrunner import MockRunner
+
+    class Runner(MockRunner):
+        def __init__(self, playbook):
+            super(Runner, self).__init__()
+
+    shebang.load_config(str(playbook))
+    config = shebang.load_config(str(playbook))
+    # the types are looked up by name, whether the config was cached or not
+    p = shebang.create_paternoster(str(playbook), config, runner_class=Runner)
+    p.parse_args(['-d', 'example.com'])
+    assert p._parsed_args.domain == 'example.com'
+    assert all(isinstance(value, str) for value in config['parameters'][0].values())
+
+
+def test_config_cache_invalidated(root, playbook):
+    from .. import shebang
+
+    assert shebang.load_config(str(playbook))['become_user'] == 'foo'
+    playbook.write(PLAYBOOK.format(user='foobar'))
+    assert shebang.load_config(str(playbook))['become_user'] == 'foobar'
+
+
+def test_config_cache_untrusted(monkeypatch, playbook, cache_dir):
+    from .. import shebang
+
+    cache_dir.ensure(dir=True).chmod(0o777)
+    cache_dir.join('config').ensure(dir=True).chmod(0o777)
+
+    calls = []
+    load_playbook = shebang._load_playbook_head
+    monkeypatch.setattr(shebang, '_load_playbook_head', lambda path: calls.append(path) or load_playbook(path))
+
+    shebang.load_config(str(playbook))
+    shebang.load_config(str(playbook))
+    assert len(calls) == 2
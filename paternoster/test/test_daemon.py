@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+
+import grp
+import os
+import pwd
+import signal
+import socket
+import sys
+import time
+
+import pytest
+
+SCRIPT = """#!/usr/bin/env paternoster
+- hosts: paternoster
+  vars:
+    become_user: {user}
+    check_user: {check_user}
+    parameters:
+      - name: name
+        type: paternoster.types.restricted_str
+        type_params:
+          allowed_chars: a-z
+
+- hosts: localhost
+  tasks: []
+"""
+
+
+class EchoRunner:
+    def __init__(self, playbook):
+        self._playbook = playbook
+
+    def run(self, variables, verbosity):
+        variables = dict(variables)
+        print('{sudo_user} {param_name}'.format(**variables))
+        print('running ' + variables['script_name'], file=sys.stderr)
+        return variables['param_name'] != 'fail'
+
+
+@pytest.fixture
+def daemon(tmpdir, monkeypatch):
+    from ..daemon import Daemon
+
+    user = pwd.getpwuid(os.geteuid()).pw_name
+    script = tmpdir.join('script')
+    script.write(SCRIPT.format(user=user, check_user=user))
+    other = tmpdir.join('other')
+    other.write(SCRIPT.format(user=user, check_user='nobody'))
+    socket_path = str(tmpdir.join('socket'))
+
+    d = Daemon(socket_path, [str(script), str(other)], runner_class=EchoRunner)
+    pid = os.fork()
+    if pid == 0:
+        try:
+            d.serve_forever()
+        finally:
+            os._exit(1)
+
+    for _ in range(100):
+        if os.path.exists(socket_path):
+            break
+        time.sleep(0.05)
+
+    yield (socket_path, str(script), str(other), user)
+
+    os.kill(pid, signal.SIGTERM)
+    os.waitpid(pid, 0)
+
+
+def submit(socket_path, script, argv, monkeypatch):
+    from ..client import submit
+
+    monkeypatch.setattr(sys, 'argv', [script])
+    return submit(socket_path, argv)
+
+
+def test_daemon_run(daemon, capsys, monkeypatch):
+    socket_path, script, _, user = daemon
+
+    assert submit(socket_path, script, ['--name', 'foo'], monkeypatch) == 0
+
+    out, err = capsys.readouterr()
+    assert out == '{} foo\n'.format(user)
+    assert err == 'running script\n'
+
+
+def test_daemon_run_failed(daemon, capsys, monkeypatch):
+    socket_path, script, _, _ = daemon
+
+    assert submit(socket_path, script, ['--name', 'fail'], monkeypatch) == 1
+
+
+def test_daemon_revalidates(daemon, capsys, monkeypatch):
+    socket_path, script, _, _ = daemon
+
+    assert submit(socket_path, script, ['--name', 'FOO'], monkeypatch) == 2
+
+    out, err = capsys.readouterr()
+    assert out == ''
+    assert 'invalid string value' in err
+
+
+def test_daemon_unknown_script(daemon, tmpdir, capsys, monkeypatch):
+    socket_path, _, _, _ = daemon
+
+    assert submit(socket_path, str(tmpdir.join('unknown')), ['--name', 'foo'], monkeypatch) == 1
+
+    out, err = capsys.readouterr()
+    assert 'is not served by this daemon' in err
+
+
+def test_daemon_check_user(daemon, capsys, monkeypatch):
+    socket_path, _, other, _ = daemon
+
+    assert submit(socket_path, other, ['--name', 'foo'], monkeypatch) == 1
+
+    out, err = capsys.readouterr()
+    assert 'can only be used by the user nobody' in err
+
+
+def test_daemon_not_running(tmpdir, monkeypatch):
+    assert submit(str(tmpdir.join('socket')), '/script', [], monkeypatch) is None
+
+
+def test_daemon_requires_become_user(tmpdir):
+    from ..daemon import Daemon
+
+    script = tmpdir.join('script')
+    script.write('- hosts: paternoster\n  vars:\n    parameters: []\n')
+
+    with pytest.raises(ValueError):
+        Daemon(str(tmpdir.join('socket')), [str(script)], runner_class=EchoRunner)
+
+
+def _handle(d, request):
+    """ pass *request* to the daemon *d* in-process, returns the status and stderr sent back """
+    from .. import client
+
+    ours, theirs = socket.socketpair()
+    client.send_message(ours, request)
+    d.handle(theirs)
+
+    err = b''
+    while True:
+        channel, data = client.recv_frame(ours)
+        if channel == client.EXIT:
+            ours.close()
+            return client._STATUS.unpack(data)[0], err.decode('utf-8')
+        err += data
+
+
+@pytest.fixture
+def script(tmpdir):
+    user = pwd.getpwuid(os.geteuid()).pw_name
+    path = tmpdir.join('script')
+    path.write(SCRIPT.format(user=user, check_user=user))
+    return str(path)
+
+
+def test_daemon_allow(tmpdir, script):
+    from ..daemon import Daemon
+
+    nobody = pwd.getpwnam('nobody')
+    group = grp.getgrgid(nobody.pw_gid)
+    socket_path = str(tmpdir.join('socket'))
+
+    d = Daemon(socket_path, [script], runner_class=EchoRunner)
+    assert d.is_allowed(0, 0)
+    assert not d.is_allowed(nobody.pw_uid, nobody.pw_gid)
+
+    d = Daemon(socket_path, [script], runner_class=EchoRunner, allow=['nobody'])
+    assert d.is_allowed(nobody.pw_uid, nobody.pw_gid)
+
+    d = Daemon(socket_path, [script], runner_class=EchoRunner, allow=['%' + group.gr_name])
+    assert d.is_allowed(nobody.pw_uid, nobody.pw_gid)
+    # the primary group of the user counts as well
+    assert d.is_allowed(nobody.pw_uid, 12345)
+
+
+@pytest.mark.parametrize("allow", [['no-such-user'], ['%no-such-group']])
+def test_daemon_allow_unknown(tmpdir, script, allow):
+    from ..daemon import Daemon
+
+    with pytest.raises(ValueError):
+        Daemon(str(tmpdir.join('socket')), [script], runner_class=EchoRunner, allow=allow)
+
+
+def test_daemon_not_allowed(tmpdir, script, monkeypatch):
+    from .. import daemon
+
+    nobody = pwd.getpwnam('nobody')
+    monkeypatch.setattr(daemon, '_peer_credentials', lambda conn: (nobody.pw_uid, nobody.pw_gid))
+    d = daemon.Daemon(str(tmpdir.join('socket')), [script], runner_class=EchoRunner)
+
+    def run(*args, **kwargs):
+        raise AssertionError('script run for a user, who is not allowed to')
+
+    monkeypatch.setattr(d, '_run', run)
+    status, err = _handle(d, {'script': script, 'argv': ['--name', 'foo']})
+    assert status == 1
+    assert 'not allowed' in err
+
+
+@pytest.mark.parametrize("request_data", [
+    [],
+    'x',
+    {'script': 1, 'argv': []},
+    {'argv': []},
+    {'script': '/script', 'argv': 'x'},
+    {'script': '/script', 'argv': [1]},
+])
+def test_daemon_invalid_request(tmpdir, script, request_data):
+    from ..daemon import Daemon
+
+    d = Daemon(str(tmpdir.join('socket')), [script], runner_class=EchoRunner)
+    assert _handle(d, request_data) == (1, 'invalid request\n')
+
+
+def test_daemon_not_allowed_before_reading(tmpdir, script, monkeypatch):
+    from .. import daemon
+
+    nobody = pwd.getpwnam('nobody')
+    monkeypatch.setattr(daemon, '_peer_credentials', lambda conn: (nobody.pw_uid, nobody.pw_gid))
+    d = daemon.Daemon(str(tmpdir.join('socket')), [script], runner_class=EchoRunner)
+
+    def recv_message(*args, **kwargs):
+        raise AssertionError('request read from a user, who is not allowed to run scripts')
+
+    monkeypatch.setattr(daemon.client, 'recv_message', recv_message)
+    ours, theirs = socket.socketpair()
+    d.handle(theirs)
+    assert daemon.client.recv_frame(ours)[0] == daemon.client.STDERR
+    ours.close()
+
+
+def test_daemon_idle_client(tmpdir, script, monkeypatch):
+    from .. import daemon
+
+    monkeypatch.setattr(daemon, 'REQUEST_TIMEOUT', 0.1)
+    d = daemon.Daemon(str(tmpdir.join('socket')), [script], runner_class=EchoRunner)
+
+    ours, theirs = socket.socketpair()
+    d.handle(theirs)
+    assert daemon.client.recv_frame(ours)[0] == daemon.client.STDERR
+    ours.close()
+
+
+def test_daemon_script_removed(tmpdir, script):
+    from ..daemon import Daemon
+
+    d = Daemon(str(tmpdir.join('socket')), [script], runner_class=EchoRunner)
+    os.unlink(script)
+    status, err = _handle(d, {'script': script, 'argv': ['--name', 'foo']})
+    assert status == 1
+    assert 'No such file or directory' in err
+
+
+def test_daemon_script_broken(tmpdir, script):
+    from ..daemon import Daemon
+
+    d = Daemon(str(tmpdir.join('socket')), [script], runner_class=EchoRunner)
+    with open(script, 'w') as f:
+        f.write('- hosts: localhost\n')
+    status, err = _handle(d, {'script': script, 'argv': ['--name', 'foo']})
+    assert status == 1
+    assert 'paternoster play could not be found' in err
+
+
+def test_daemon_not_reachable(tmpdir, monkeypatch):
+    # not only a missing socket, the script falls back to sudo on any error
+    tmpdir.join('file').write('')
+    assert submit(str(tmpdir.join('file')), '/script', [], monkeypatch) is None
+    assert submit(str(tmpdir.join('file', 'socket')), '/script', [], monkeypatch) is None
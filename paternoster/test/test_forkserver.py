@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+import os
+import signal
+import socket
+import sys
+
+import pytest
+
+
+def handler(conn):
+    conn.sendall(str(os.getpid()).encode('ascii'))
+
+
+@pytest.fixture
+def forkserver(tmpdir):
+    from ..forkserver import ForkServer
+
+    socket_path = str(tmpdir.join('socket'))
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socket_path)
+    listener.listen(5)
+
+    def start(**kwargs):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                ForkServer(listener, handler, **kwargs).serve_forever()
+            finally:
+                os._exit(1)
+        pids.append(pid)
+        return socket_path
+
+    pids = []
+    yield start
+
+    for pid in pids:
+        os.kill(pid, signal.SIGTERM)
+        os.waitpid(pid, 0)
+
+
+def request(socket_path):
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    conn.connect(socket_path)
+    try:
+        return int(conn.recv(32))
+    finally:
+        conn.close()
+
+
+def test_forkserver_reuses_workers(forkserver):
+    socket_path = forkserver(workers=1)
+
+    pids = set(request(socket_path) for _ in range(5))
+    assert len(pids) == 1
+    assert os.getpid() not in pids
+
+
+def test_forkserver_recycles_workers(forkserver):
+    socket_path = forkserver(workers=1, max_requests=2)
+
+    pids = [request(socket_path) for _ in range(6)]
+    assert len(set(pids)) == 3
+    assert pids[0] == pids[1]
+    assert pids[2] == pids[3]
+
+
+def test_forkserver_preload(monkeypatch):
+    from ..forkserver import ForkServer
+
+    monkeypatch.delitem(sys.modules, 'colorsys', raising=False)
+    ForkServer(None, handler, preload=['colorsys']).preload()
+    assert 'colorsys' in sys.modules
+
+
+@pytest.mark.parametrize("kwargs", [
+    {'workers': 0},
+    {'max_requests': 0},
+])
+def test_forkserver_ctor(kwargs):
+    from ..forkserver import ForkServer
+
+    with pytest.raises(ValueError):
+        ForkServer(None, handler, **kwargs)
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+
+import pytest
+
+TEST_FD = 99
+
+
+@pytest.fixture
+def script(tmpdir, monkeypatch):
+    from .. import handoff
+
+    path = tmpdir.join('script')
+    path.write('- hosts: paternoster\n')
+    # as started by become_user
+    monkeypatch.setattr(sys, 'argv', [str(path), handoff.HANDOFF_OPTION])
+    monkeypatch.setenv('SUDO_USER', 'foo')
+    monkeypatch.setattr(handoff, 'HANDOFF_FD', TEST_FD)
+    yield path
+    try:
+        os.close(TEST_FD)
+    except OSError:
+        pass
+
+
+def test_handoff(script):
+    from .. import handoff
+
+    argv = ['--name', u'fööbar', '--password', 'secret']
+    assert handoff.prepare(argv) == TEST_FD
+    assert handoff.receive() == argv
+    assert sys.argv == [str(script)]
+
+
+def test_handoff_missing(script):
+    from .. import handoff
+
+    with pytest.raises(ValueError):
+        handoff.receive()
+
+
+@pytest.mark.parametrize("sudo_user", [True, False])
+def test_handoff_not_requested(script, monkeypatch, sudo_user):
+    from .. import handoff
+
+    # e.g. root running the script with a file of its own on the descriptor
+    handoff.prepare(['--name', 'foo'])
+    if sudo_user:
+        monkeypatch.setattr(sys, 'argv', [str(script), '--name', 'bar'])
+    else:
+        monkeypatch.delenv('SUDO_USER')
+
+    argv = list(sys.argv)
+    assert handoff.receive() is None
+    assert sys.argv == argv
+    # the descriptor is left alone
+    assert os.lseek(TEST_FD, 0, os.SEEK_CUR) == 0
+    assert os.read(TEST_FD, 1)
+
+
+def test_handoff_corrupted(script):
+    from .. import handoff
+
+    handoff.prepare(['--name', 'foo'])
+    os.lseek(TEST_FD, -3, os.SEEK_END)
+    os.write(TEST_FD, b'bar')
+
+    with pytest.raises(ValueError):
+        handoff.receive()
+
+
+def test_handoff_other_script(script):
+    from .. import handoff
+
+    handoff.prepare(['--name', 'foo'])
+    script.write('- hosts: paternoster\n  vars: {}\n')
+
+    with pytest.raises(ValueError):
+        handoff.receive()
+
+
+def test_become_user_keep_fd(monkeypatch):
+    from ..root import become_user
+
+    calls = []
+    monkeypatch.setattr(os, 'execv', lambda *args: calls.append(args))
+    monkeypatch.setattr(sys, 'argv', ['/bin/script', '--name', 'foo'])
+
+    become_user('nobody', keep_fd=3)
+
+    assert calls == [(
+        '/usr/bin/sudo',
+        [
+            '/usr/bin/sudo', '-u', 'nobody', '-n', '-C', '4', '--', os.path.realpath('/bin/script'),
+            '--paternoster-handoff', '--name', 'foo',
+        ],
+    )]
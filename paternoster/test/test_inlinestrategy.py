@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+from distutils.version import LooseVersion
+
+import ansible.release
+import pytest
+
+ANSIBLE_VERSION = LooseVersion(ansible.release.__version__)
+SKIP_ANSIBLE_TESTS = ANSIBLE_VERSION < LooseVersion('2.10.0')
+
+pytestmark = pytest.mark.skipif(SKIP_ANSIBLE_TESTS, reason="tasks run inline with ansible 2.10+ only")
+
+PLAYBOOK = u"""
+- hosts: all
+  gather_facts: no
+  handlers:
+    - name: touched
+      file: path={dir}/handled state=touch
+  tasks:
+    - set_fact: word=inline
+    - file: path={dir}/file state=touch
+      notify: touched
+    - lineinfile: path={dir}/file line="{{{{ word }}}} {{{{ item }}}}"
+      loop: [a, b]
+    - command: cat {dir}/file
+      register: content
+    - debug: var=content.stdout_lines
+    - include_tasks: {dir}/included.yml
+    - fail: msg="{{{{ word }}}}"
+      ignore_errors: yes
+    - debug: msg="{{{{ undefined_variable }}}}"
+      ignore_errors: yes
+"""
+INCLUDED = u"""
+- debug: msg="included {{ word }}"
+"""
+# values changing from run to run
+VOLATILE_KEYS = ('start', 'end', 'delta', 'atime', 'mtime', 'ctime', 'inode', 'version', 'diff')
+EVENTS = (
+    'v2_runner_on_start', 'v2_runner_on_ok', 'v2_runner_on_failed', 'v2_runner_on_skipped',
+    'v2_runner_item_on_ok', 'v2_runner_item_on_failed', 'v2_playbook_on_include',
+    'v2_playbook_on_handler_task_start',
+)
+
+
+def _strip(data):
+    if isinstance(data, dict):
+        return dict((k, _strip(v)) for k, v in data.items() if k not in VOLATILE_KEYS)
+    if isinstance(data, list):
+        return [_strip(v) for v in data]
+    return data
+
+
+@pytest.fixture
+def events(monkeypatch):
+    """ records the events sent to the callback """
+    from ..runners.ansibleexecutor import MinimalAnsibleCallback
+
+    recorded = []
+
+    def record(event):
+        def callback(self, *args, **kwargs):
+            result = args[0]
+            if hasattr(result, '_result'):
+                data = json.dumps(_strip(result._result), sort_keys=True)
+                recorded.append((event, result._task_fields['action'], data))
+            else:
+                # the task itself or the host and the task
+                recorded.append((event, getattr(args[-1], 'action', None)))
+        return callback
+
+    for event in EVENTS:
+        monkeypatch.setattr(MinimalAnsibleCallback, event, record(event), raising=False)
+    monkeypatch.setattr(os, 'chdir', lambda *args, **kwargs: None)
+    return recorded
+
+
+@pytest.fixture
+def task_stats(monkeypatch):
+    """ records the stats shown after each run """
+    from ..runners import inlinestrategy
+
+    recorded = []
+    get_stats = inlinestrategy.get_stats
+
+    def record():
+        recorded.append(get_stats())
+        return recorded[-1]
+
+    monkeypatch.setattr(inlinestrategy, 'get_stats', record)
+    return recorded
+
+
+def _run(tmpdir, playbook=PLAYBOOK, **kwargs):
+    from ..runners.ansiblerunner import AnsibleRunner
+
+    for name in ('file', 'handled'):
+        if tmpdir.join(name).check():
+            tmpdir.join(name).remove()
+    tmpdir.join('included.yml').write_text(INCLUDED, 'utf-8')
+    playbook_path = tmpdir.join('playbook.yml')
+    playbook_path.write_text(playbook.format(dir=tmpdir), 'utf-8')
+    return AnsibleRunner(str(playbook_path), **kwargs).run([], 0)
+
+
+def test_same_events(tmpdir, events, task_stats):
+    assert _run(tmpdir)
+    forked = list(events)
+    assert task_stats == [None]
+    del events[:]
+
+    assert _run(tmpdir, inline_tasks=True)
+    assert events == forked
+    assert tmpdir.join('handled').check()
+    assert task_stats[-1] == (10, 0)
+
+
+def test_failed_task(tmpdir, events):
+    playbook = u'- hosts: all\n  gather_facts: no\n  tasks:\n    - fail: msg=inline\n    - ping:\n'
+    assert not _run(tmpdir, playbook, inline_tasks=True)
+    assert [event[:2] for event in events] == [('v2_runner_on_start', 'fail'), ('v2_runner_on_failed', 'fail')]
+
+
+def test_other_hosts(tmpdir, events, task_stats):
+    playbook = (
+        u'- hosts: all\n  gather_facts: no\n  tasks:\n'
+        u'    - add_host: name=other ansible_connection=local\n'
+        u'        ansible_python_interpreter={{{{ ansible_playbook_python }}}}\n'
+        u'- hosts: other\n  gather_facts: no\n  tasks:\n    - ping:\n'
+    )
+    assert _run(tmpdir, playbook, inline_tasks=True)
+    assert ('v2_runner_on_ok', 'ping') in [event[:2] for event in events]
+    assert task_stats == [(1, 1)]
+
+
+def test_in_process_modules(tmpdir, events, monkeypatch):
+    from ..runners import inprocess
+
+    module_stats = []
+    get_stats = inprocess.get_stats
+    monkeypatch.setattr(inprocess, 'get_stats', lambda: module_stats.append(get_stats()))
+
+    # the modules must not change the process running the playbook
+    playbook = u'- hosts: all\n  gather_facts: no\n  tasks:\n    - ping:\n    - stat: path=/\n'
+    assert _run(tmpdir, playbook, inline_tasks=True, in_process_modules=True)
+    assert module_stats == [(0, 2)]
+
+    assert _run(tmpdir, playbook, in_process_modules=True)
+    assert module_stats[-1] == (2, 0)
+
+
+def test_runner_reports_stats(tmpdir, events, capsys):
+    from ..runners import inlinestrategy
+
+    from ..runners.ansiblerunner import AnsibleRunner
+
+    playbook_path = tmpdir.join('playbook.yml')
+    playbook_path.write('- hosts: all\n  gather_facts: no\n  tasks:\n    - ping:\n')
+    assert AnsibleRunner(str(playbook_path), inline_tasks=True).run([], 2)
+    assert 'tasks: 1 run inline, 0 in a worker process' in capsys.readouterr()[0]
+
+    assert AnsibleRunner(str(playbook_path)).run([], 2)
+    assert not inlinestrategy.is_enabled()
+    assert 'run inline' not in capsys.readouterr()[0]
+
+
+def test_other_strategies(tmpdir, events, task_stats):
+    playbook = u'- hosts: all\n  gather_facts: no\n  strategy: free\n  tasks:\n    - ping:\n'
+    assert _run(tmpdir, playbook, inline_tasks=True)
+    assert task_stats == [(0, 0)]
+    assert ('v2_runner_on_ok', 'ping') in [event[:2] for event in events]
+
+
+def test_script_option():
+    from .. import shebang
+    from .mockrunner import MockRunner
+
+    class Runner(MockRunner):
+        def __init__(self, playbook, inline_tasks=False):
+            super(Runner, self).__init__()
+            self.inline_tasks = inline_tasks
+
+    p = shebang.create_paternoster('/playbook.yml', {'inline_tasks': True}, runner_class=Runner)
+    assert p._runner.inline_tasks is True
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+from distutils.version import LooseVersion
+
+import ansible.release
+import pytest
+
+ANSIBLE_VERSION = LooseVersion(ansible.release.__version__)
+SKIP_ANSIBLE_TESTS = ANSIBLE_VERSION < LooseVersion('2.10.0')
+
+pytestmark = pytest.mark.skipif(SKIP_ANSIBLE_TESTS, reason="modules run in-process with ansible 2.10+ only")
+
+PLAYBOOK = u"""
+- hosts: all
+  gather_facts: no
+  tasks:
+    - file: path={dir}/file state=touch mode=0640
+    - stat: path={dir}/file
+    - lineinfile: path={dir}/file line="line {{{{ item }}}}"
+      loop: [a, b]
+    - command: cat {dir}/file
+    - shell: echo "$HOME" && false
+      ignore_errors: yes
+    - file: path=/proc/paternoster/nothing state=directory
+      ignore_errors: yes
+    - ping:
+      no_log: yes
+"""
+# values changing from run to run
+VOLATILE_KEYS = ('start', 'end', 'delta', 'atime', 'mtime', 'ctime', 'inode', 'version', 'diff')
+
+
+def _strip(data):
+    if isinstance(data, dict):
+        return dict((k, _strip(v)) for k, v in data.items() if k not in VOLATILE_KEYS)
+    if isinstance(data, list):
+        return [_strip(v) for v in data]
+    return data
+
+
+@pytest.fixture
+def results(monkeypatch):
+    """ records the results passed to the callback """
+    from ..runners.ansibleexecutor import MinimalAnsibleCallback
+
+    recorded = []
+
+    def record(event):
+        def callback(self, result, *args, **kwargs):
+            recorded.append((event, result._task_fields['action'], json.dumps(_strip(result._result), sort_keys=True)))
+        return callback
+
+    for event in ('v2_runner_on_ok', 'v2_runner_on_failed', 'v2_runner_item_on_ok'):
+        monkeypatch.setattr(MinimalAnsibleCallback, event, record(event))
+    monkeypatch.setattr(os, 'chdir', lambda *args, **kwargs: None)
+    return recorded
+
+
+@pytest.fixture
+def module_stats(monkeypatch):
+    """ records the stats shown after each run """
+    from ..runners import inprocess
+
+    recorded = []
+    get_stats = inprocess.get_stats
+
+    def record():
+        recorded.append(get_stats())
+        return recorded[-1]
+
+    monkeypatch.setattr(inprocess, 'get_stats', record)
+    return recorded
+
+
+def _run(tmpdir, playbook=PLAYBOOK, **kwargs):
+    from ..runners.ansiblerunner import AnsibleRunner
+
+    if tmpdir.join('file').check():
+        tmpdir.join('file').remove()
+    playbook_path = tmpdir.join('playbook.yml')
+    playbook_path.write_text(playbook.format(dir=tmpdir), 'utf-8')
+    return AnsibleRunner(str(playbook_path), **kwargs).run([], 0)
+
+
+def test_same_results(tmpdir, results, module_stats):
+    assert _run(tmpdir)
+    spawned = list(results)
+    del results[:]
+
+    assert _run(tmpdir, in_process_modules=True)
+    assert results == spawned
+    assert module_stats[-1] == (8, 0)
+
+
+def test_no_temporary_files(tmpdir, results, monkeypatch):
+    import tempfile
+
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmpdir.mkdir('tmp')))
+    assert _run(tmpdir, in_process_modules=['file', 'stat'])
+    assert tmpdir.join('tmp').listdir() == []
+
+
+@pytest.mark.parametrize("task", [
+    u'command: "true"\n      environment: {{A: b}}',
+    u'command: "true"\n      async: 10\n      poll: 1',
+    u'copy: content=a dest={dir}/file',
+])
+def test_spawned(tmpdir, results, module_stats, task):
+    playbook = u'- hosts: all\n  gather_facts: no\n  tasks:\n    - ' + task + '\n'
+    assert _run(tmpdir, playbook, in_process_modules=['command'])
+    assert module_stats[-1][0] == 0
+
+
+def test_shadowed_module(tmpdir, results, module_stats):
+    from ansible.plugins.loader import module_loader
+
+    playbook = u'- hosts: all\n  gather_facts: no\n  tasks:\n    - ping:\n'
+    assert _run(tmpdir, playbook, in_process_modules=['ping'])
+    assert module_stats[-1] == (1, 0)
+
+    # ansible looks for modules next to the playbook, too
+    tmpdir.mkdir('library').join('ping.py').write('#!/usr/bin/python\nprint(\'{"ping": "shadowed"}\')\n')
+    extra_dirs = list(module_loader._extra_dirs)
+    try:
+        assert _run(tmpdir, playbook, in_process_modules=['ping'])
+    finally:
+        module_loader._extra_dirs[:] = extra_dirs
+        module_loader._clear_caches()
+    assert '"shadowed"' in results[-1][2]
+    assert module_stats[-1] == (0, 1)
+
+
+@pytest.mark.parametrize("name", ['nothing', '../ping', 'setup.nothing', 'debug'])
+def test_unknown_module(tmpdir, results, name):
+    with pytest.raises(ValueError):
+        _run(tmpdir, in_process_modules=[name])
+
+
+def test_runner_reports_stats(tmpdir, results, capsys):
+    from ..runners.ansiblerunner import AnsibleRunner
+
+    playbook_path = tmpdir.join('playbook.yml')
+    playbook_path.write('- hosts: all\n  gather_facts: no\n  tasks:\n    - ping:\n    - setup:\n')
+    assert AnsibleRunner(str(playbook_path), in_process_modules=True).run([], 2)
+    assert 'modules: 1 run in-process, 1 in a process of their own' in capsys.readouterr()[0]
+
+    assert AnsibleRunner(str(playbook_path)).run([], 2)
+    assert 'run in-process' not in capsys.readouterr()[0]
+
+
+def test_script_option(tmpdir):
+    from .. import shebang
+    from .mockrunner import MockRunner
+
+    class Runner(MockRunner):
+        def __init__(self, playbook, in_process_modules=False):
+            super(Runner, self).__init__()
+            self.in_process_modules = in_process_modules
+
+    p = shebang.create_paternoster('/playbook.yml', {'in_process_modules': ['ping']}, runner_class=Runner)
+    assert p._runner.in_process_modules == ['ping']
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+import re
+
+import pytest
+
+from ..linearregex import LinearRegex
+
+
+@pytest.mark.parametrize("pattern,values", [
+    ('abc', ['abc', 'ab', 'abcd', '']),
+    ('a|b|', ['a', 'b', '', 'ab']),
+    ('[a-z][a-z0-9-]*', ['a', 'a-1', '1a', 'a_', 'A']),
+    ('[^a-z]+', ['ABC', 'aBC', '']),
+    ('[]a]+', [']a]', 'b']),
+    ('(ab|c)+d?', ['ab', 'cabd', 'abd', 'd', 'ac']),
+    ('(?:x|y){2,3}', ['x', 'xy', 'xyx', 'xyxy']),
+    ('(?P<name>a){2}', ['a', 'aa', 'aaa']),
+    ('a{,2}b{2,}', ['b', 'bb', 'abb', 'aabbb', 'aaabb']),
+    ('a{}', ['a{}', 'a']),
+    ('a{x}', ['a{x}', 'ax']),
+    ('a*?b+?', ['b', 'aab', 'a']),
+    (r'\d+\.\d+', ['1.5', '1x5', '١.٢']),
+    (r'\w+\s\W', ['ab !', 'äb !', 'ab a']),
+    (r'\x41ä\t', [u'Aä\t', 'Aa\t']),
+    ('.+', ['abc', 'a\nb']),
+    ('(a*)*b', ['b', 'aaab', 'aaa']),
+    (u'[äöü]+', [u'äöü', 'aou']),
+])
+def test_linear_regex_like_re(pattern, values):
+    linear = LinearRegex(pattern)
+    python = re.compile(r'\A(?:' + pattern + r')\Z')
+
+    for value in values:
+        assert linear.match(value) == bool(python.match(value)), value
+
+
+@pytest.mark.parametrize("pattern", [
+    r'(a)\1',
+    '(?=a)a',
+    '(?!a)b',
+    '(?<=a)b',
+    '(?i)a',
+    'a^b',
+    'a$b',
+    r'a\bb',
+    r'\Aa',
+    'a*+',
+    'a**',
+    '*a',
+    'a|+',
+    '(a',
+    'a)',
+    '[a-',
+    'a{3,2}',
+    'a{1001}',
+    '(a{1000}){1000}',
+    r'\q',
+])
+def test_linear_regex_unsupported(pattern):
+    with pytest.raises(ValueError):
+        LinearRegex(pattern)
+
+
+def test_linear_regex_dfa_cache_bounded(monkeypatch):
+    from .. import linearregex
+
+    monkeypatch.setattr(linearregex, 'MAX_DFA_STATES', 4)
+    # needs a state for every combination of the last four characters
+    pattern = '(a|b)*a(a|b)(a|b)(a|b)'
+    regex = LinearRegex(pattern)
+    python = re.compile(r'\A(?:' + pattern + r')\Z')
+
+    for value in ['abaab', 'aaaaa', 'abbbb', 'bbabb', 'babababa', 'bbbbabbb'] * 3:
+        assert regex.match(value) == bool(python.match(value))
+        assert len(regex._dfa) <= 4
+
+
+def _count_steps(pattern, value):
+    """ match *value* against a new LinearRegex, returns the result, the states visited per step and their total """
+    regex = LinearRegex(pattern)
+    steps = []
+    step = regex._step
+
+    def record(state, char):
+        steps.append(len(state.nfa_states))
+        return step(state, char)
+
+    regex._step = record
+    return regex.match(value), steps, len(regex._states)
+
+
+def test_linear_regex_steps(monkeypatch):
+    from .. import linearregex
+
+    # takes exponential time using python's re
+    for last in 'bc':
+        # transitions are computed once and reused for every character
+        matched, short, _ = _count_steps('(a+)+b', 'a' * 5000 + last)
+        assert matched == (last == 'b')
+        matched, long, _ = _count_steps('(a+)+b', 'a' * 20000 + last)
+        assert matched == (last == 'b')
+        assert short == long
+
+    # even without reusing them, each character is one step, which visits
+    # every state of the NFA at most once.
+    monkeypatch.setattr(linearregex, 'MAX_DFA_STATES', 0)
+    for n in (5000, 20000):
+        matched, steps, states = _count_steps('(a+)+b', 'a' * n + 'c')
+        assert not matched
+        assert len(steps) == n + 1
+        assert max(steps) <= states
@@ -230,16 +230,19 @@ if six.PY2:
 def test_type_mandatory(param, valid):
     p = {'name': 'namespace', 'short': 'e'}
     p.update(param)
-    s = Paternoster(
-        runner_parameters={'playbook': ''},
-        parameters=[p],
-    )
 
+    def create():
+        return Paternoster(
+            runner_parameters={'playbook': ''},
+            parameters=[p],
+        )
+
+    # the parameters are checked, once the script is loaded
     if not valid:
         with pytest.raises(ValueError):
-            s.parse_args([])
+            create()
     else:
-        s.parse_args([])
+        create().parse_args([])
 
 
 @pytest.mark.parametrize("param,valid", filter(lambda x: x is not None, [
@@ -250,16 +253,18 @@ def test_type_mandatory(param, valid):
 def test_positional(param, valid):
     p = {'name': 'namespace', 'short': 'e'}
     p.update(param)
-    s = Paternoster(
-        runner_parameters={'playbook': ''},
-        parameters=[p],
-    )
+
+    def create():
+        return Paternoster(
+            runner_parameters={'playbook': ''},
+            parameters=[p],
+        )
 
     if not valid:
         with pytest.raises(TypeError):
-            s.parse_args(['aaa'])
+            create()
     else:
-        s.parse_args(['aaa'])
+        create().parse_args(['aaa'])
 
 
 @pytest.mark.parametrize("required,argv,valid", [
@@ -405,3 +410,327 @@ def test_arg_parameters_missing():
         runner_class=MockRunner,
     )
     assert s._parameters == []
+
+
+def test_parameter_spec_scaling():
+    import argparse
+
+    class Namespace(argparse.Namespace):
+        """ counts the arguments looked up """
+        def __getattribute__(self, name):
+            if not name.startswith('__'):
+                reads.append(name)
+            return super(Namespace, self).__getattribute__(name)
+
+    def count_reads(count):
+        # every even parameter is given, which satisfies all the groups below.
+        parameters = [
+            {
+                'name': 'param{}'.format(i),
+                'type': types.restricted_str('a-z'),
+                'dest': 'dest{}'.format(i),
+                'depends_on': 'param0',
+            }
+            for i in range(count)
+        ]
+        del parameters[0]['depends_on']
+        s = Paternoster(
+            runner_parameters={},
+            parameters=parameters,
+            mutually_exclusive=[['param{}'.format(i), 'param{}'.format(i + 2)] for i in range(1, count - 2, 2)],
+            required_one_of=[['param{}'.format(i), 'param{}'.format(i + 1)] for i in range(0, count - 1, 2)],
+            runner_class=MockRunner,
+        )
+        parser = s._build_argparser()
+        argv = []
+        for i in range(0, count, 2):
+            argv += ['--param{}'.format(i), 'a']
+        args = parser.parse_args(argv, namespace=Namespace())
+
+        del reads[:]
+        s._check_args(parser, args)
+        return len(reads)
+
+    reads = []
+    # each argument is looked up once, no matter how many rules refer to it.
+    assert count_reads(50) == 50
+    assert count_reads(500) == 500
+
+
+def test_constraints_all_violations(capsys):
+    s = Paternoster(
+        runner_parameters={},
+        parameters=[
+            {'name': 'mailserver', 'short': 'm', 'action': 'store_true'},
+            {'name': 'webserver', 'short': 'w', 'action': 'store_true'},
+            {'name': 'namespace', 'short': 'e', 'type': types.restricted_str('a'), 'depends_on': 'mailserver'},
+            {'name': 'ftp', 'action': 'store_true'},
+            {'name': 'ssh', 'action': 'store_true'},
+        ],
+        mutually_exclusive=[['w', 'e']],
+        required_one_of=[['ftp', 'ssh']],
+        runner_class=MockRunner,
+    )
+
+    with pytest.raises(SystemExit):
+        s.parse_args(['-w', '-e', 'a'])
+
+    out, err = capsys.readouterr()
+    assert (
+        'argument --namespace requires --mailserver to be present. '
+        'arguments --webserver, --namespace are mutually exclusive. '
+        'at least one of --ftp, --ssh is needed.\n'
+    ) in err
+
+
+@pytest.mark.parametrize("parameters,mutually_exclusive,required_one_of,message", [
+    # dependency cycles
+    ([{'name': 'a', 'depends_on': 'a'}], [], [], 'cyclic dependency: --a -> --a'),
+    (
+        [{'name': 'a', 'depends_on': 'b'}, {'name': 'b', 'depends_on': 'c'}, {'name': 'c', 'depends_on': 'a'}],
+        [], [], 'cyclic dependency: --a -> --b -> --c -> --a',
+    ),
+    # unknown parameters
+    ([{'name': 'a', 'depends_on': 'b'}], [], [], 'unknown parameter b in depends_on of --a'),
+    ([{'name': 'a'}], [['a', 'b']], [], 'unknown parameter b in mutually_exclusive'),
+    ([{'name': 'a'}], [], [['b']], 'unknown parameter b in required_one_of'),
+    # unsatisfiable
+    ([{'name': 'a'}], [], [[]], 'required_one_of contains an empty group'),
+    (
+        [{'name': 'a', 'required': True}, {'name': 'b', 'required': True}], [['a', 'b']], [],
+        'arguments --a, --b are mutually exclusive, but all of them are required',
+    ),
+    (
+        [{'name': 'a'}, {'name': 'b'}], [['a', 'b']], [['a'], ['b']],
+        'arguments --a, --b are mutually exclusive, but all of them are required',
+    ),
+    (
+        [{'name': 'a'}, {'name': 'b', 'depends_on': 'c'}, {'name': 'c', 'depends_on': 'a'}], [['a', 'b']], [],
+        'argument --b can never be given, because --a, --b are mutually exclusive',
+    ),
+    (
+        [{'name': 'a', 'required': True}, {'name': 'b'}], [['a', 'b']], [],
+        'argument --b can never be given, because --a, --b are mutually exclusive',
+    ),
+])
+def test_constraints_definition(parameters, mutually_exclusive, required_one_of, message):
+    for param in parameters:
+        param['type'] = types.restricted_str('a')
+
+    with pytest.raises(ValueError) as excinfo:
+        Paternoster(
+            runner_parameters={},
+            parameters=parameters,
+            mutually_exclusive=mutually_exclusive,
+            required_one_of=required_one_of,
+            runner_class=MockRunner,
+        )
+    assert str(excinfo.value) == message
+
+
+@pytest.mark.parametrize("cache,expected", [
+    (None, None),
+    (True, types.DEFAULT_CACHE_SIZE),
+    (16, 16),
+])
+def test_type_params_cache(cache, expected):
+    type_params = {'wildcard': True}
+    if cache is not None:
+        type_params['cache'] = cache
+    s = Paternoster(
+        runner_parameters={},
+        parameters=[
+            {
+                'name': 'domain', 'short': 'd',
+                'type': 'paternoster.types.domain', 'type_params': type_params,
+            },
+        ],
+        runner_class=MockRunner,
+    )
+
+    validator = s._build_argparser()._option_string_actions['--domain'].type
+    assert validator._wildcard
+    # the type_params of the script are left alone
+    assert 'cache' in type_params or cache is None
+    if expected is None:
+        assert validator.cache_info() is None
+    else:
+        s.parse_args(['-d', '*.uberspace.de'])
+        s.parse_args(['-d', '*.uberspace.de'])
+        assert validator.cache_info() == (1, 1, expected, 1)
+
+
+def _multiple_script(**param):
+    return Paternoster(
+        runner_parameters={},
+        parameters=[
+            dict({'name': 'domain', 'short': 'd', 'type': types.domain(), 'multiple': True}, **param),
+        ],
+        runner_class=MockRunner,
+    )
+
+
+def test_multiple_flags():
+    s = _multiple_script()
+
+    s.parse_args(['-d', 'uberspace.de', '--domain', 'example.com'])
+    s.execute()
+
+    assert dict(s._runner.args[0])['param_domain'] == ['uberspace.de', 'example.com']
+    s.parse_args([])
+    assert s._parsed_args.domain == []
+
+
+def test_multiple_from_file(tmpdir, monkeypatch):
+    monkeypatch.delenv('SUDO_USER', raising=False)
+    domains = tmpdir.join('domains')
+    domains.write('uberspace.de\n\n  example.com  \n')
+    s = _multiple_script()
+
+    s.parse_args(['-d', 'foo.de', '--domain-from', str(domains)])
+    assert s._parsed_args.domain == ['foo.de', 'uberspace.de', 'example.com']
+
+    # the values are passed on, the file is not read again
+    domains.remove()
+    argv = s._argv
+    s.parse_args(argv)
+    assert s._parsed_args.domain == ['foo.de', 'uberspace.de', 'example.com']
+    assert not hasattr(s._parsed_args, '_stream_domain')
+
+
+def test_multiple_from_stdin(monkeypatch):
+    import io
+    import sys
+
+    monkeypatch.setattr(sys, 'stdin', io.StringIO(u'uberspace.de\nexample.com\n'))
+    s = _multiple_script()
+    s._sudo_user = 'luto'
+
+    s.parse_args(['--domain-from', '-'])
+    assert s._parsed_args.domain == ['uberspace.de', 'example.com']
+
+
+@pytest.mark.parametrize("sudo_user,env", [
+    ('luto', {}),
+    (None, {'SUDO_USER': 'luto'}),
+])
+def test_multiple_from_file_privileged(tmpdir, monkeypatch, capsys, sudo_user, env):
+    domains = tmpdir.join('domains')
+    domains.write('uberspace.de\n')
+    monkeypatch.delenv('SUDO_USER', raising=False)
+    for k, v in env.items():
+        monkeypatch.setenv(k, v)
+    s = _multiple_script()
+    s._sudo_user = sudo_user
+
+    with pytest.raises(SystemExit):
+        s.parse_args(['--domain-from', str(domains)])
+
+    out, err = capsys.readouterr()
+    assert "argument --domain-from: only '-' (stdin) can be used" in err
+
+
+def test_multiple_invalid_line(monkeypatch, capsys):
+    import io
+    import sys
+
+    monkeypatch.setattr(sys, 'stdin', io.StringIO(u'uberspace.de\n\nfoo\n'))
+    s = _multiple_script()
+
+    with pytest.raises(SystemExit):
+        s.parse_args(['--domain-from', '-'])
+
+    out, err = capsys.readouterr()
+    assert 'argument --domain-from: line 3: domain has too few components' in err
+
+
+def test_multiple_max_count(monkeypatch, capsys):
+    import sys
+
+    class Lines(object):
+        """ fails, if more lines are read than needed """
+        def __iter__(self):
+            for i in range(3):
+                yield u'example{}.com\n'.format(i)
+            raise AssertionError('read past max_count')
+
+    s = _multiple_script(max_count=2)
+
+    with pytest.raises(SystemExit):
+        s.parse_args(['-d', 'a.com', '-d', 'b.com', '-d', 'c.com'])
+    assert 'argument --domain: at most 2 values are allowed' in capsys.readouterr()[1]
+
+    monkeypatch.setattr(sys, 'stdin', Lines())
+    with pytest.raises(SystemExit):
+        s.parse_args(['-d', 'a.com', '--domain-from', '-'])
+    assert 'argument --domain-from: at most 2 values are allowed' in capsys.readouterr()[1]
+
+
+def test_multiple_required(monkeypatch, capsys):
+    import io
+    import sys
+
+    s = _multiple_script(required=True)
+
+    with pytest.raises(SystemExit):
+        s.parse_args([])
+    assert 'argument --domain is required' in capsys.readouterr()[1]
+
+    monkeypatch.setattr(sys, 'stdin', io.StringIO(u'uberspace.de\n'))
+    s.parse_args(['--domain-from', '-'])
+    assert s._parsed_args.domain == ['uberspace.de']
+
+
+@pytest.mark.parametrize("param", [
+    {'positional': True},
+    {'prompt': True},
+    {'max_count': 0},
+    {'max_count': 'a'},
+])
+def test_multiple_definition(param):
+    with pytest.raises(ValueError):
+        _multiple_script(**param)
+
+
+@pytest.mark.parametrize("record,argv", [
+    ({}, []),
+    ({'name': 'foo'}, ['--name=foo']),
+    ({'name': 'foo', 'force': True, 'count': 3}, ['--count=3', '--force', '--name=foo']),
+    ({'force': False, 'name': None}, []),
+    ({'tag': ['a', 'b']}, ['--tag=a', '--tag=b']),
+    ({'first': '-a', 'second': 'b', 'verbose': 2}, ['--verbose', '--verbose', '--', '-a', 'b']),
+    ({'second': 'b', 'first': 'a'}, ['--', 'a', 'b']),
+])
+def test_record_argv(record, argv):
+    from ..parameters import ParameterSpec
+
+    spec = ParameterSpec([
+        {'name': 'first', 'positional': True, 'type': types.restricted_str('a-z-')},
+        {'name': 'name', 'short': 'n', 'type': types.restricted_str('a-z')},
+        {'name': 'force', 'action': 'store_true'},
+        {'name': 'count', 'type': int},
+        {'name': 'tag', 'type': types.restricted_str('a-z'), 'multiple': True},
+        {'name': 'second', 'positional': True, 'type': types.restricted_str('a-z')},
+    ])
+
+    assert spec.record_argv(record) == argv
+
+
+@pytest.mark.parametrize("record", [
+    ['--name', 'foo'],
+    {'n': 'foo'},
+    {'tag-from': '/etc/shadow'},
+    {'help': True},
+    {'name': {'a': 'b'}},
+    {'tag': [['a']]},
+])
+def test_record_argv_invalid(record):
+    from ..parameters import ParameterSpec
+
+    spec = ParameterSpec([
+        {'name': 'name', 'short': 'n', 'type': types.restricted_str('a-z')},
+        {'name': 'tag', 'type': types.restricted_str('a-z'), 'multiple': True},
+    ])
+
+    with pytest.raises(ValueError):
+        spec.record_argv(record)
@@ -20,3 +20,250 @@ def test_auto_returncode(status, rc):
         p.auto()
 
     assert excinfo.value.code == rc
+
+
+def test_parse_args_does_not_import_ansible():
+    import subprocess
+    import sys
+
+    code = '\n'.join([
+        'import sys',
+        'from paternoster import Paternoster',
+        'from paternoster import types',
+        'p = Paternoster(',
+        '    runner_parameters={"playbook": "/playbook.yml"},',
+        '    parameters=[{"name": "name", "type": types.restricted_str("a-z")}],',
+        ')',
+        'p.parse_args(["--name", "foo"])',
+        'print(sorted(m for m in sys.modules if m.split(".")[0] == "ansible"))',
+    ])
+
+    out = subprocess.check_output([sys.executable, '-c', code])
+    assert out.strip() == b'[]'
+
+
+class ExecCalled(Exception):
+    pass
+
+
+@pytest.mark.parametrize("validate_early,argv,exp_exec", [
+    (True, ['--name', 'foo'], True),
+    (True, ['--name', 'FOO'], False),
+    (True, ['--unknown'], False),
+    (False, ['--name', 'FOO'], True),
+    (False, ['--unknown'], True),
+])
+def test_validate_early(validate_early, argv, exp_exec, monkeypatch):
+    import os
+    import sys
+    from ..paternoster import Paternoster
+    from .. import types
+
+    def execv(*args, **kwargs):
+        raise ExecCalled()
+
+    monkeypatch.setattr(os, 'execv', execv)
+    monkeypatch.setattr(sys, 'argv', ['script'] + argv)
+
+    p = Paternoster(
+        runner_parameters={},
+        parameters=[{'name': 'name', 'type': types.restricted_str('a-z')}],
+        become_user='nobody',
+        validate_early=validate_early,
+        runner_class=MockRunner,
+    )
+
+    if exp_exec:
+        with pytest.raises(ExecCalled):
+            p.auto()
+    else:
+        with pytest.raises(SystemExit):
+            p.auto()
+
+
+def test_validate_early_defers_prompts(monkeypatch):
+    import os
+    import sys
+    from ..paternoster import Paternoster
+    from .. import types
+
+    def execv(*args, **kwargs):
+        raise ExecCalled()
+
+    def prompt(*args, **kwargs):
+        raise AssertionError('prompted before becoming the target user')
+
+    monkeypatch.setattr(os, 'execv', execv)
+    monkeypatch.setattr(sys, 'argv', ['script'])
+    monkeypatch.setattr(Paternoster, 'prompt', prompt)
+
+    p = Paternoster(
+        runner_parameters={},
+        parameters=[
+            {'name': 'name', 'type': types.restricted_str('a-z'), 'prompt': True},
+            {'name': 'other', 'type': types.restricted_str('a-z')},
+        ],
+        required_one_of=[['name', 'other']],
+        become_user='nobody',
+        validate_early=True,
+        runner_class=MockRunner,
+    )
+
+    with pytest.raises(ExecCalled):
+        p.auto()
+
+
+@pytest.mark.parametrize("argv,exp_exec", [
+    (['--domain-from', '/nonexistent'], True),
+    (['--domain-from', '/nonexistent', '--other', 'foo'], True),
+    (['--other', 'foo'], False),
+    ([], False),
+])
+def test_validate_early_streams(argv, exp_exec, monkeypatch):
+    import os
+    import sys
+    from ..paternoster import Paternoster
+    from .. import types
+
+    def execv(*args, **kwargs):
+        raise ExecCalled()
+
+    monkeypatch.setattr(os, 'execv', execv)
+    monkeypatch.setattr(sys, 'argv', ['script'] + argv)
+
+    p = Paternoster(
+        runner_parameters={},
+        parameters=[
+            {'name': 'domain', 'type': types.domain(), 'multiple': True},
+            {'name': 'other', 'type': types.restricted_str('a-z'), 'depends_on': 'domain'},
+        ],
+        required_one_of=[['domain', 'other']],
+        become_user='nobody',
+        validate_early=True,
+        runner_class=MockRunner,
+    )
+
+    # the file is read once the script runs as become_user
+    if exp_exec:
+        with pytest.raises(ExecCalled):
+            p.auto()
+    else:
+        with pytest.raises(SystemExit):
+            p.auto()
+
+
+def test_runner_variables_records():
+    from ..paternoster import Paternoster
+    from .. import types
+
+    p = Paternoster(
+        runner_parameters={},
+        parameters=[
+            {'name': 'url', 'type': types.uri()},
+        ],
+        runner_class=MockRunner,
+    )
+    p.parse_args(['--url', 'https://uberspace.de/bla'])
+    p.execute()
+
+    variables = dict(p._runner.args[0])
+    assert variables['param_url'] == {
+        'scheme': 'https',
+        'domain': 'uberspace.de',
+        'path': '/bla',
+        'full': 'https://uberspace.de/bla',
+    }
+
+
+class BatchRunner:
+    """ records the variables of every run and fails for the name 'fail' """
+    def __init__(self):
+        self.runs = []
+
+    def run(self, variables, verbosity):
+        variables = dict(variables)
+        self.runs.append(variables)
+        return variables['param_name'] != 'fail'
+
+
+def _batch_paternoster():
+    from ..paternoster import Paternoster
+    from .. import types
+
+    return Paternoster(
+        runner_parameters={},
+        parameters=[
+            {'name': 'name', 'type': types.restricted_str('a-z'), 'required': True},
+            {'name': 'force', 'action': 'store_true'},
+            {'name': 'tag', 'type': types.restricted_str('a-z'), 'multiple': True},
+        ],
+        runner_class=BatchRunner,
+    )
+
+
+def test_run_batch(tmpdir, capsys, monkeypatch):
+    import json
+
+    monkeypatch.delenv('SUDO_USER', raising=False)
+    batch = tmpdir.join('batch.jsonl')
+    batch.write('\n'.join([
+        '{"name": "foo"}',
+        '{"name": "bar", "force": true, "tag": ["a", "b"]}',
+        '{"name": "FOO"}',
+        '{"nme": "foo"}',
+        'not json',
+        '',
+        '{"name": "fail", "force": false}',
+    ]) + '\n')
+
+    p = _batch_paternoster()
+    assert p.run_batch(str(batch)) == 1
+
+    out, err = capsys.readouterr()
+    lines = [json.loads(line) for line in out.splitlines()]
+    assert [(s['record'], s['status']) for s in lines[:-1]] == [
+        (1, 'ok'), (2, 'ok'), (3, 'invalid'), (4, 'invalid'), (5, 'invalid'), (7, 'failed'),
+    ]
+    assert 'invalid' in lines[2]['error'] and 'FOO' in lines[2]['error']
+    assert lines[3]['error'] == 'unknown parameter: nme'
+    assert lines[-1] == {'records': 6, 'ok': 2, 'failed': 1, 'invalid': 3}
+    assert err == ''
+
+    assert [r['param_name'] for r in p._runner.runs] == ['foo', 'bar', 'fail']
+    assert p._runner.runs[0]['param_force'] is False
+    assert p._runner.runs[1]['param_force'] is True
+    assert p._runner.runs[1]['param_tag'] == ['a', 'b']
+
+
+def test_auto_batch(tmpdir, monkeypatch):
+    import sys
+
+    batch = tmpdir.join('batch.jsonl')
+    batch.write('{"name": "foo"}\n{"name": "bar"}\n')
+    monkeypatch.delenv('SUDO_USER', raising=False)
+    monkeypatch.setattr(sys, 'argv', ['script', '--batch', str(batch)])
+
+    p = _batch_paternoster()
+    with pytest.raises(SystemExit) as excinfo:
+        p.auto()
+
+    assert excinfo.value.code == 0
+    assert len(p._runner.runs) == 2
+
+
+def test_run_batch_privileged(tmpdir, capsys, monkeypatch):
+    import io
+    import sys
+
+    batch = tmpdir.join('batch.jsonl')
+    batch.write('{"name": "foo"}\n')
+
+    p = _batch_paternoster()
+    p._sudo_user = 'someone'
+    assert p.run_batch(str(batch)) == 3
+    assert p._runner.runs == []
+    assert 'stdin' in capsys.readouterr().err
+
+    monkeypatch.setattr(sys, 'stdin', io.StringIO(u'{"name": "foo"}\n'))
+    assert p.run_batch('-') == 0
+    assert p._runner.runs[0]['sudo_user'] == 'someone'
@@ -375,10 +375,8 @@ class TestIntegrationParams(PaternosterHelper, InputBuffer):
         para02 = self.get_param(
             name='password', prompt=True, required=True,
         )
-        p = self.get_paternoster(para01, para02)
-        self.buffer('secret\n')
         with pytest.raises(SystemExit) as excinfo:
-            p.parse_args(argv=['--username', 'testor'])
+            self.get_paternoster(para01, para02)
         assert str(excinfo.value) == '2'
         out, err = capsys.readouterr()
         assert err.endswith("'--password' is required and can't be combined with prompt\n")
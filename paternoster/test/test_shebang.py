@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import pytest
+import yaml
+
+PATERNOSTER_PLAY = """- hosts: paternoster
+  vars: &vars
+    become_user: foo
+    parameters:
+      - name: name
+        type: paternoster.types.restricted_str
+        type_params: {allowed_chars: a-z}
+"""
+
+TRAILING_PLAY = """
+- hosts: localhost
+  vars: *vars
+  tasks:
+    - debug: msg="{{ param_name }} is {{ item }}"
+      with_items: [1, 2, 3]
+"""
+
+
+@pytest.mark.parametrize('loader', ['SafeLoader', 'CSafeLoader'])
+@pytest.mark.parametrize('content', [
+    PATERNOSTER_PLAY,
+    PATERNOSTER_PLAY + TRAILING_PLAY * 3,
+    '---\n' + PATERNOSTER_PLAY + '...\n',
+    '- just a string\n- hosts: paternoster\n',
+    '[]',
+])
+def test_load_playbook_head(tmpdir, monkeypatch, content, loader):
+    from .. import shebang
+    from ..shebang import _load_playbook_head
+
+    if not hasattr(yaml, loader):
+        pytest.skip('{} is not available'.format(loader))
+    monkeypatch.setattr(shebang, 'YAML_LOADER', getattr(yaml, loader))
+
+    path = tmpdir.join('playbook.yml')
+    path.write(content)
+
+    assert _load_playbook_head(str(path)) == yaml.safe_load(content)[:1]
+
+
+@pytest.mark.parametrize('content', [
+    '',
+    'hosts: paternoster\n',
+    'paternoster\n',
+])
+def test_load_playbook_head_invalid(tmpdir, content):
+    from ..shebang import _load_playbook_head
+
+    path = tmpdir.join('playbook.yml')
+    path.write(content)
+
+    with pytest.raises(AssertionError):
+        _load_playbook_head(str(path))
+
+
+def test_load_playbook_head_events(tmpdir, monkeypatch):
+    from .. import shebang
+    from ..shebang import _load_playbook_head
+
+    events = []
+
+    class Loader(shebang.YAML_LOADER):
+        def get_event(self):
+            events.append(None)
+            return super(Loader, self).get_event()
+
+    monkeypatch.setattr(shebang, 'YAML_LOADER', Loader)
+
+    def count_events(trailing_plays):
+        path = tmpdir.join('playbook-{}.yml'.format(trailing_plays))
+        path.write(PATERNOSTER_PLAY + TRAILING_PLAY * trailing_plays)
+        del events[:]
+        _load_playbook_head(str(path))
+        return len(events)
+
+    # parsing stops after the first play, however many follow.
+    assert count_events(10000) == count_events(10) == count_events(1)
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+import io
+import os
+import sys
+
+import pytest
+
+SUFFIX_LIST = u"""// a small suffix list
+uk
+co.uk
+*.ck
+!www.ck
+рф
+
+// ===BEGIN PRIVATE DOMAINS===
+blogspot.co.uk
+"""
+
+
+@pytest.fixture
+def index():
+    from ..suffixindex import SuffixIndex, compile_rules, parse_suffix_list
+
+    return SuffixIndex(compile_rules(parse_suffix_list(SUFFIX_LIST.splitlines())))
+
+
+@pytest.mark.parametrize("name,expected", [
+    ('example.co.uk', ('example', 'co.uk')),
+    ('www.example.co.uk', ('example', 'co.uk')),
+    ('example.uk', ('example', 'uk')),
+    ('co.uk', ('', 'co.uk')),
+    ('EXAMPLE.Co.UK', ('example', 'co.uk')),
+    ('foo.blogspot.co.uk', ('blogspot', 'co.uk')),
+    ('example.foo.ck', ('example', 'foo.ck')),
+    ('www.ck', ('www', 'ck')),
+    ('example.com', ('com', '')),
+    ('example.xn--p1ai', ('example', 'xn--p1ai')),
+    ('', ('', '')),
+])
+def test_suffix_index(index, name, expected):
+    assert index.split(name) == expected
+
+
+@pytest.mark.parametrize("data", [
+    b'',
+    b'PSLIDX01',
+    b'NOTANIDX' + b'\0' * 12,
+])
+def test_suffix_index_invalid(data):
+    from ..suffixindex import SuffixIndex
+
+    with pytest.raises(ValueError):
+        SuffixIndex(data)
+
+
+def test_suffix_index_like_tldextract(tmpdir):
+    import tldextract
+    from ..suffixindex import SuffixIndex, compile_file
+
+    snapshot = os.path.join(os.path.dirname(tldextract.__file__), '.tld_set_snapshot')
+    if not os.path.isfile(snapshot) or not io.open(snapshot, encoding='utf-8').read(2) == '//':
+        pytest.skip('this version of tldextract does not bundle a plain suffix list')
+
+    index = SuffixIndex(compile_file(snapshot))
+    extract = tldextract.TLDExtract(suffix_list_urls=['file://' + snapshot], cache_dir=None)
+
+    for name in [
+        'example.com', 'www.example.co.uk', 'co.uk', 'uk', 'example.deee', 'foo.bar.kawasaki.jp',
+        'city.kawasaki.jp', 'www.city.kawasaki.jp', 'www.ck', 'foo.bar.ck', 'foo.blogspot.com',
+        'example.xn--p1ai', u'b\xfccher.de'.encode('idna').decode('ascii'), 'a.b.c.d.e.f.de',
+    ]:
+        extracted = extract(name)
+        assert index.split(name) == (extracted.domain, extracted.suffix), name
+
+
+def test_domain_uses_index(monkeypatch, index):
+    from .. import types
+
+    monkeypatch.setattr(types, '_suffix_index', index)
+
+    assert types.domain()('example.co.uk') == 'example.co.uk'
+    assert types.domain()(u'bücher.рф') == 'xn--bcher-kva.xn--p1ai'
+    with pytest.raises(ValueError):
+        types.domain()('example.com')
+
+
+def test_load(tmpdir, monkeypatch, cache_dir):
+    from .. import suffixindex
+
+    suffix_list = tmpdir.join('public_suffix_list.dat')
+    suffix_list.write_text(SUFFIX_LIST, 'utf-8')
+
+    assert suffixindex.load() is None
+
+    monkeypatch.setattr(sys, 'argv', ['paternoster-compile-suffixes', str(suffix_list)])
+    suffixindex.main()
+
+    assert suffixindex.load().split('example.co.uk') == ('example', 'co.uk')
+
+    # anything, which could have been modified by other users, is ignored
+    path = cache_dir.join(suffixindex.INDEX_CACHE, suffixindex.INDEX_NAME)
+    path.chmod(0o666)
+    assert suffixindex.load() is None
+
+    path.write(b'garbage', 'wb')
+    path.chmod(0o644)
+    assert suffixindex.load() is None
+
+
+def test_compile_output(tmpdir, monkeypatch):
+    from .. import suffixindex
+
+    suffix_list = tmpdir.join('public_suffix_list.dat')
+    suffix_list.write_text(SUFFIX_LIST, 'utf-8')
+    output = tmpdir.join('index')
+
+    monkeypatch.setattr(os, 'geteuid', lambda: 1000)
+    monkeypatch.setattr(sys, 'argv', ['paternoster-compile-suffixes', '-o', str(output), str(suffix_list)])
+    suffixindex.main()
+
+    assert suffixindex.SuffixIndex(output.read(mode='rb')).split('example.uk') == ('example', 'uk')
+
+    monkeypatch.setattr(sys, 'argv', ['paternoster-compile-suffixes', str(suffix_list)])
+    with pytest.raises(SystemExit):
+        suffixindex.main()
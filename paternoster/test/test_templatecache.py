@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+import os
+import stat
+import sys
+from distutils.version import LooseVersion
+
+import ansible.release
+import jinja2
+import pytest
+
+ANSIBLE_VERSION = LooseVersion(ansible.release.__version__)
+SKIP_ANSIBLE_TESTS = (sys.version_info >= (3, 0) and ANSIBLE_VERSION < LooseVersion('2.4.0'))
+
+pytestmark = pytest.mark.skipif(SKIP_ANSIBLE_TESTS, reason="ansible <2.4 requires python2")
+
+TEMPLATE = u'{% for i in items %}{{ i | int + 1 }}{% if i is odd %}!{% endif %} {% endfor %}'
+
+
+def _environment(**kwargs):
+    from ansible.template import AnsibleEnvironment
+    return AnsibleEnvironment(**kwargs)
+
+
+def _render(env, source=TEMPLATE, **variables):
+    return env.from_string(source).render(items=[1, 2, 3], **variables)
+
+
+@pytest.fixture
+def enabled():
+    from ..runners import templatecache
+    return templatecache.enable()
+
+
+def _restart(monkeypatch):
+    """ start over with a new process, as far as the template cache is concerned """
+    from ..runners import templatecache
+
+    templatecache.disable()
+    monkeypatch.setattr(templatecache, '_signatures', {})
+    return templatecache.enable()
+
+
+def test_cache(enabled, monkeypatch):
+    env = _environment()
+    assert _render(env) == u'2! 3 4! '
+    assert _render(env) == u'2! 3 4! '
+    # the second one is kept in memory
+    assert (enabled.hits, enabled.misses) == (1, 1)
+
+    warm = _restart(monkeypatch)
+
+    def compile_uncached(*args, **kwargs):
+        raise AssertionError('compiled again')
+
+    from ..runners import templatecache
+    monkeypatch.setattr(templatecache, '_compile_uncached', compile_uncached)
+    assert _render(_environment()) == u'2! 3 4! '
+    assert (warm.hits, warm.misses) == (1, 0)
+
+
+def test_entry_files(enabled, cache_dir):
+    from ..runners import templatecache
+
+    _render(_environment())
+    directory = cache_dir.join(templatecache.TEMPLATE_CACHE)
+    entries = directory.listdir()
+    assert len(entries) == 1
+    # templates may contain secrets, just like the files they come from
+    assert stat.S_IMODE(os.stat(str(entries[0])).st_mode) == 0o600
+
+
+def test_environment_settings(enabled, monkeypatch):
+    assert _render(_environment(), u'{{ 1 }}[[ 2 ]]') == u'1[[ 2 ]]'
+
+    warm = _restart(monkeypatch)
+    env = _environment(variable_start_string='[[', variable_end_string=']]')
+    assert _render(env, u'{{ 1 }}[[ 2 ]]') == u'{{ 1 }}2'
+    assert (warm.hits, warm.misses) == (0, 1)
+
+
+def test_changed_filter(enabled, monkeypatch):
+    source = u'{{ items | first | string | shout }}'
+
+    def shout(value):
+        return value.upper()
+
+    env = _environment()
+    env.filters['shout'] = shout
+    assert _render(env, source) == u'1'
+
+    @jinja2.pass_context if hasattr(jinja2, 'pass_context') else jinja2.contextfilter
+    def shout(context, value):  # noqa: F811
+        return value.upper() + u'!'
+
+    # the filter is called differently now.
+    warm = _restart(monkeypatch)
+    env = _environment()
+    env.filters['shout'] = shout
+    assert _render(env, source) == u'1!'
+    assert (warm.hits, warm.misses) == (0, 1)
+
+
+@pytest.mark.parametrize("source", [
+    u'{{ "a" | counter }}',
+    u'{% set a = 1 | counter %}{{ a }}',
+    u'{% if 1 is counter %}{% endif %}{{ 2 | counter }}',
+])
+def test_constant_filter_call(enabled, monkeypatch, cache_dir, source):
+    from ..runners import templatecache
+
+    calls = []
+
+    def counter(value):
+        calls.append(value)
+        return len(calls)
+
+    def render():
+        env = _environment()
+        env.filters['counter'] = env.tests['counter'] = counter
+        return _render(env, source)
+
+    # Jinja2 calls the filter while compiling, the result (e.g. of strftime)
+    # must not be reused in later runs.
+    first = render()
+    warm = _restart(monkeypatch)
+    assert render() != first
+    assert (warm.hits, warm.misses) == (0, 1)
+    assert not cache_dir.join(templatecache.TEMPLATE_CACHE).check() or \
+        cache_dir.join(templatecache.TEMPLATE_CACHE).listdir() == []
+
+
+def test_missing_filter(enabled, monkeypatch):
+    from jinja2 import TemplateSyntaxError
+
+    env = _environment()
+    env.filters['shout'] = lambda value: value.upper()
+    assert _render(env, u'{{ "a" | shout }}') == u'A'
+
+    _restart(monkeypatch)
+    with pytest.raises(TemplateSyntaxError):
+        _render(_environment(), u'{{ "a" | shout }}')
+
+
+def test_slots(enabled, monkeypatch):
+    from ..runners import templatecache
+
+    monkeypatch.setattr(templatecache, 'SLOTS', 1)
+    _render(_environment(), u'{{ 1 }}')
+    _render(_environment(), u'{{ 2 }}')
+
+    # the second template took the slot of the first one
+    warm = _restart(monkeypatch)
+    _render(_environment(), u'{{ 2 }}')
+    _render(_environment(), u'{{ 1 }}')
+    assert (warm.hits, warm.misses) == (1, 1)
+
+
+def test_max_entry_size(enabled, monkeypatch, cache_dir):
+    from ..runners import templatecache
+
+    monkeypatch.setattr(templatecache, 'MAX_ENTRY_SIZE', 100)
+    _render(_environment())
+    assert cache_dir.join(templatecache.TEMPLATE_CACHE).listdir() == []
+
+
+@pytest.mark.parametrize("corrupt", [
+    lambda data: data[:-1],
+    lambda data: data[:-1] + b'x',
+    lambda data: b'garbage',
+])
+def test_corrupted_entry(enabled, monkeypatch, cache_dir, corrupt):
+    from ..runners import templatecache
+
+    _render(_environment())
+    entry, = cache_dir.join(templatecache.TEMPLATE_CACHE).listdir()
+    entry.write_binary(corrupt(entry.read_binary()))
+
+    warm = _restart(monkeypatch)
+    assert _render(_environment()) == u'2! 3 4! '
+    assert (warm.hits, warm.misses) == (0, 1)
+
+
+def test_not_root(monkeypatch):
+    from .. import cache
+    from ..runners import templatecache
+
+    monkeypatch.setattr(cache, 'can_write', lambda: False)
+    assert templatecache.enable() is None
+    assert ansible.template.AnsibleEnvironment.compile is templatecache._compile_uncached
+
+
+def test_worker_stats(enabled):
+    pid = os.fork()
+    if pid == 0:
+        try:
+            _render(_environment())
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+
+    # in the parent process as well as in the forked one
+    _render(_environment())
+    assert (enabled.hits, enabled.misses) == (1, 1)
+
+
+def test_runner_reports_stats(capsys, monkeypatch):
+    from ..runners.ansiblerunner import AnsibleRunner
+
+    playbook_path = '/tmp/paternoster-test-templatecache.yml'
+    with open(playbook_path, 'w') as f:
+        f.write('- hosts: all\n  gather_facts: no\n  tasks:\n    - debug: msg="{{ 1 + 1 }}"\n')
+
+    monkeypatch.setattr(os, 'chdir', lambda *args, **kwargs: None)
+    assert AnsibleRunner(playbook_path, template_cache=True).run([], 2)
+    assert 'template cache: 0 compilations skipped, ' in capsys.readouterr()[0]
+
+    _restart(monkeypatch)
+    assert AnsibleRunner(playbook_path, template_cache=True).run([], 2)
+    out = capsys.readouterr()[0]
+    assert 'template cache: 0 compilations skipped' not in out
+    assert ', 0 templates compiled' in out
+
+
+def test_runner_disabled(monkeypatch):
+    from ..runners import templatecache
+    from ..runners.ansiblerunner import AnsibleRunner
+
+    playbook_path = '/tmp/paternoster-test-templatecache.yml'
+    with open(playbook_path, 'w') as f:
+        f.write('- hosts: all\n  gather_facts: no\n  tasks:\n    - debug: msg="{{ 1 + 1 }}"\n')
+
+    monkeypatch.setattr(os, 'chdir', lambda *args, **kwargs: None)
+    # the cache is off by default
+    assert AnsibleRunner(playbook_path).run([], 0)
+    assert templatecache.get_cache() is None
+
+
+def test_script_option():
+    from .. import shebang
+    from .mockrunner import MockRunner
+
+    class Runner(MockRunner):
+        def __init__(self, playbook, template_cache=False):
+            super(Runner, self).__init__()
+            self.template_cache = template_cache
+
+    p = shebang.create_paternoster('/playbook.yml', {'template_cache': True}, runner_class=Runner)
+    assert p._runner.template_cache is True
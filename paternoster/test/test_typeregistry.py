@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from .. import types
+from ..typeregistry import TypeRegistry
+
+
+class FakeEntryPoint(object):
+    def __init__(self, factory):
+        self.factory = factory
+        self.loaded = 0
+
+    def load(self):
+        self.loaded += 1
+        if isinstance(self.factory, Exception):
+            raise self.factory
+        return self.factory
+
+
+@pytest.fixture
+def entry_points(monkeypatch):
+    """ replaces the installed entry points, records every lookup """
+    from .. import typeregistry
+
+    available = {}
+    lookups = []
+
+    def find(name):
+        lookups.append(name)
+        return available.get(name)
+
+    monkeypatch.setattr(typeregistry, '_find_entry_point', find)
+    return available, lookups
+
+
+@pytest.mark.parametrize("name,params,expected", [
+    ('int', {}, int),
+    ('int', {'ignored': 1}, int),
+    ('str', {}, str),
+])
+def test_builtin_types(name, params, expected):
+    assert TypeRegistry().get(name, params) is expected
+
+
+@pytest.mark.parametrize("name,params,expected", [
+    ('paternoster.types.domain', {}, types.domain),
+    ('paternoster.types.uri', {'optional_scheme': False}, types.uri),
+    ('paternoster.types.restricted_str', {'allowed_chars': 'a-z'}, types.restricted_str),
+    ('paternoster.types.restricted_int', {'minimum': 1}, types.restricted_int),
+])
+def test_paternoster_types(name, params, expected, entry_points):
+    validator = TypeRegistry().get(name, params)
+
+    assert type(validator) is expected
+    # paternoster's own types never look at entry points
+    assert entry_points[1] == []
+
+
+@pytest.mark.parametrize("name", [
+    'paternoster.types.Record',
+    'paternoster.types.set_suffix_list',
+    'paternoster.types.nothing',
+    'float',
+    'example.nothing',
+])
+def test_unknown_types(name, entry_points):
+    with pytest.raises(ValueError) as excinfo:
+        TypeRegistry().get(name)
+    assert str(excinfo.value) == 'unknown type ' + name
+
+
+def test_invalid_type_params():
+    with pytest.raises(ValueError) as excinfo:
+        TypeRegistry().get('paternoster.types.domain', {'nonsense': True})
+    assert 'invalid type_params for paternoster.types.domain' in str(excinfo.value)
+
+
+def test_validators_are_shared():
+    registry = TypeRegistry()
+
+    validator = registry.get('paternoster.types.restricted_str', {'allowed_chars': 'a-z'})
+    assert registry.get('paternoster.types.restricted_str', {'allowed_chars': 'a-z'}) is validator
+    assert registry.get('paternoster.types.restricted_str', {'allowed_chars': 'a-f'}) is not validator
+    assert registry.get('paternoster.types.restricted_str', {'allowed_chars': 'a-z', 'cache': True}) is not validator
+
+    registry.clear()
+    assert registry.get('paternoster.types.restricted_str', {'allowed_chars': 'a-z'}) is not validator
+
+
+def test_unhashable_type_params():
+    registry = TypeRegistry()
+
+    calls = []
+
+    def factory(**params):
+        calls.append(params)
+        return types.restricted_str('a-z')
+
+    registry.register('example.str', factory)
+    params = {'nested': {'items': [1, 2]}, 'other': [{'a': 1}]}
+    assert registry.get('example.str', params) is registry.get('example.str', params)
+    assert registry.get('example.str', {'set': {1, 2}}) is not registry.get('example.str', {'set': {1, 2}})
+    assert len(calls) == 3
+
+
+def test_cache_type_param():
+    registry = TypeRegistry()
+
+    validator = registry.get('paternoster.types.domain', {'cache': 10})
+    assert validator.cache_info().maxsize == 10
+    validator = registry.get('paternoster.types.domain', {'cache': True})
+    assert validator.cache_info().maxsize == types.DEFAULT_CACHE_SIZE
+    assert registry.get('paternoster.types.domain', {}).cache_info() is None
+
+
+def test_cache_type_param_unsupported(entry_points):
+    available, _ = entry_points
+    available['example.plain'] = FakeEntryPoint(lambda: (lambda value: value))
+
+    registry = TypeRegistry()
+    assert registry.get('example.plain')('a') == 'a'
+    with pytest.raises(ValueError) as excinfo:
+        registry.get('example.plain', {'cache': True})
+    assert str(excinfo.value) == 'type example.plain does not support the cache type_param'
+
+
+def test_entry_points(entry_points):
+    available, lookups = entry_points
+    available['example.lower'] = entry_point = FakeEntryPoint(types.restricted_str)
+    registry = TypeRegistry()
+
+    assert lookups == []
+    a = registry.get('example.lower', {'allowed_chars': 'a-z'})
+    b = registry.get('example.lower', {'allowed_chars': 'a-f'})
+
+    assert type(a) is types.restricted_str and a is not b
+    assert lookups == ['example.lower']
+    assert entry_point.loaded == 1
+
+
+def test_find_entry_point():
+    from ..typeregistry import _find_entry_point
+
+    assert _find_entry_point('example.nothing') is None
+
+
+def test_entry_point_broken(entry_points):
+    available, lookups = entry_points
+    available['example.broken'] = FakeEntryPoint(ImportError('No module named example'))
+
+    with pytest.raises(ValueError) as excinfo:
+        TypeRegistry().get('example.broken')
+    assert str(excinfo.value) == 'type example.broken could not be loaded: No module named example'
+
+
+def test_script_load_reports_unknown_types(entry_points):
+    from ..paternoster import Paternoster
+    from .mockrunner import MockRunner
+
+    with pytest.raises(ValueError) as excinfo:
+        Paternoster(
+            runner_parameters={},
+            parameters=[
+                {'name': 'name', 'type': 'paternoster.types.restricted_str', 'type_params': {'allowed_chars': 'a-z'}},
+                {'name': 'other', 'type': 'example.nothing'},
+            ],
+            runner_class=MockRunner,
+        )
+    assert str(excinfo.value) == 'unknown type example.nothing'
+
+
+def test_parameters_share_validators():
+    from ..paternoster import Paternoster
+    from .mockrunner import MockRunner
+
+    def script():
+        return Paternoster(
+            runner_parameters={},
+            parameters=[
+                {'name': 'a', 'type': 'paternoster.types.domain', 'type_params': {'wildcard': True}},
+                {'name': 'b', 'type': 'paternoster.types.domain', 'type_params': {'wildcard': True}},
+            ],
+            runner_class=MockRunner,
+        )
+
+    def validators(p):
+        actions = p._build_argparser()._option_string_actions
+        return actions['--a'].type, actions['--b'].type
+
+    a, b = validators(script())
+    assert a is b
+    assert validators(script()) == (a, b)
@@ -68,6 +68,82 @@ def test_type_domain_maxlen():
         assert 'domain too long' in str(exc.value)
 
 
+def test_tld_extractor_shared():
+    from .. import types
+
+    assert types.get_tld_extractor() is types.get_tld_extractor()
+
+
+def test_tld_extractor_threads(monkeypatch):
+    import threading
+    from .. import types
+
+    created = []
+    create = types._create_tld_extractor
+
+    def count(suffix_list):
+        created.append(suffix_list)
+        return create(suffix_list)
+
+    monkeypatch.setattr(types, '_tld_extractor', None)
+    monkeypatch.setattr(types, '_create_tld_extractor', count)
+
+    extractors = []
+    threads = [
+        threading.Thread(target=lambda: extractors.append(types.get_tld_extractor()))
+        for _ in range(10)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(created) == 1
+    assert all(e is extractors[0] for e in extractors)
+
+
+def test_tld_extractor_suffix_list(tmpdir):
+    from .. import types
+
+    suffix_list = tmpdir.join('public_suffix_list.dat')
+    suffix_list.write('// a private suffix list\ninternal\n')
+
+    try:
+        types.set_suffix_list(str(suffix_list))
+        assert types.domain()('example.internal') == 'example.internal'
+        with pytest.raises(ValueError):
+            types.domain()('example.com')
+    finally:
+        types.set_suffix_list(None)
+
+    assert types.domain()('example.com') == 'example.com'
+
+    with pytest.raises(ValueError):
+        types.set_suffix_list(str(tmpdir.join('missing')))
+
+
+def test_tld_extractor_created_once(monkeypatch):
+    from .. import types
+
+    created = []
+    create = types._create_tld_extractor
+
+    def count(suffix_list):
+        created.append(suffix_list)
+        return create(suffix_list)
+
+    monkeypatch.setattr(types, '_tld_extractor', None)
+    monkeypatch.setattr(types, '_create_tld_extractor', count)
+
+    # loading the suffix list takes milliseconds, a check microseconds. It
+    # is loaded once for all checks, no matter which validator does them.
+    for i in range(100):
+        assert types.domain()('www{}.example.co.uk'.format(i)) == 'www{}.example.co.uk'.format(i)
+        assert types.uri()('https://example{}.com/'.format(i)).domain == 'example{}.com'.format(i)
+    types.domain().validate_many(['example.com', 'example.org'])
+    assert created == [None]
+
+
 @pytest.mark.parametrize("value,wildcard,expected", [
     ("uberspace.de", False, "uberspace.de"),
     ("ubERspaCE.dE", False, "uberspace.de"),
@@ -128,6 +204,8 @@ def test_type_uri(value, expected):
         assert 'domain' in actual
         assert 'path' in actual
 
+        # the result itself is immutable
+        actual = dict(actual)
         for k, v in expected.items():
             assert actual.pop(k, None) == v, k
 
@@ -286,3 +364,336 @@ def test_range_int_ctor_types_max():
 
     with pytest.raises(ValueError):
         restricted_int(maximum="bar")
+
+
+@pytest.mark.parametrize("check,values,expected", [
+    ('domain', ['uberspace.de', 'foo@bar.de', 'foo'], [
+        ('uberspace.de', None), (None, 'email'), (None, 'too_few_components'),
+    ]),
+    ('uri', ['https://uberspace.de/a', 'http://bla', '//foo.de/a"b'], [
+        ('https://uberspace.de/a', None), (None, 'too_few_components'), (None, 'invalid_path'),
+    ]),
+    ('restricted_str', ['abc', '', 'a-c'], [('abc', None), (None, 'too_short'), (None, 'invalid_char')]),
+    ('restricted_int', ['5', 'x', '11'], [(5, None), (None, 'invalid'), (None, 'too_big')]),
+])
+def test_validate_many(check, values, expected):
+    from .. import types
+
+    args = {
+        'restricted_str': {'allowed_chars': 'a-z'},
+        'restricted_int': {'maximum': 10},
+    }.get(check, {})
+    validator = getattr(types, check)(**args)
+
+    results = validator.validate_many(iter(values))
+
+    for (value, error), (expected_value, expected_code), original in zip(results, expected, values):
+        if expected_code is None:
+            assert error is None
+            assert value == validator(original)
+            if check == 'uri':
+                value = value['full']
+            assert value == expected_value
+        else:
+            assert value is None
+            assert isinstance(error, types.ValidationError)
+            assert error.code == expected_code
+            with pytest.raises(ValueError) as excinfo:
+                validator(original)
+            assert str(excinfo.value) == str(error)
+
+
+def test_validate_many_uri_required():
+    from ..types import uri
+
+    check = uri(optional_scheme=False)
+
+    results = check.validate_many(['https://uberspace.de', 'uberspace.de', 'uberspace.de'])
+
+    assert [error.code if error else None for _, error in results] == [None, 'missing', 'missing']
+
+
+@pytest.mark.parametrize("check,args,values", [
+    ('restricted_str', {'allowed_chars': 'a-z'}, ['abc', 'a-c', '', 'x' * 300]),
+    ('domain', {}, ['www.example.co.uk', 'example', 'foo@example.com', 'example.invalid']),
+    ('uri', {}, ['https://www.example.co.uk/a', 'example.invalid/b', '/c']),
+])
+def test_validate_many_work(check, args, values, monkeypatch):
+    from .. import types
+
+    validator = getattr(types, check)(**args)
+    values = values * 250
+
+    def loop():
+        results = []
+        for val in values:
+            try:
+                results.append((validator(val), None))
+            except ValueError as e:
+                results.append((None, e.code))
+        return results
+
+    splitters = []
+    get_splitter = types._get_splitter
+    monkeypatch.setattr(types, '_get_splitter', lambda: splitters.append(None) or get_splitter())
+
+    expected = loop()
+    looked_up = len(splitters)
+    del splitters[:]
+
+    # the same results, with the suffix list looked up once for the whole
+    # batch instead of for every value.
+    assert [(value, error and error.code) for value, error in validator.validate_many(values)] == expected
+    assert len(splitters) == (1 if looked_up else 0)
+
+
+def test_records_immutable():
+    from ..types import uri
+
+    result = uri()('https://uberspace.de/bla')
+
+    assert result.domain == result['domain'] == 'uberspace.de'
+    assert not hasattr(result, '__dict__')
+    with pytest.raises(AttributeError):
+        result.domain = 'example.com'
+    with pytest.raises(KeyError):
+        result['foo']
+
+    # read like the dicts returned previously
+    assert 'domain' in result and 'foo' not in result
+    assert result.get('path') == '/bla' and result.get('foo', 1) == 1
+    assert list(result) == result.keys() == ['scheme', 'domain', 'path', 'full']
+    assert dict(result.items()) == dict(result) == result.as_dict()
+
+    value, error = uri().validate_many(['/bla'])[0]
+    assert value.full == '/bla'
+    assert error is None
+
+
+def test_validator_patterns_compiled():
+    import re
+    from ..types import Validator
+
+    class digits(Validator):
+        DIGITS_REGEX = r'\A[0-9]+\Z'
+
+    class hex_digits(digits):
+        DIGITS_REGEX = r'\A[0-9a-f]+\Z'
+
+    assert isinstance(digits.DIGITS_PATTERN, type(re.compile('')))
+    assert not digits.DIGITS_PATTERN.match('a')
+    assert hex_digits.DIGITS_PATTERN.match('a')
+
+
+def test_uri_result_allocations():
+    tracemalloc = pytest.importorskip('tracemalloc')
+    from ..types import uri
+
+    check = uri()
+    values = ['https://uberspace.de/bla/{}'.format(i) for i in range(1000)]
+    check(values[0])
+
+    def allocated(func):
+        tracemalloc.start()
+        try:
+            before = tracemalloc.take_snapshot()
+            results = func()  # noqa: F841 (kept alive for the second snapshot)
+            after = tracemalloc.take_snapshot()
+        finally:
+            tracemalloc.stop()
+        stats = after.compare_to(before, 'filename')
+        return sum(s.count_diff for s in stats), sum(s.size_diff for s in stats)
+
+    records = allocated(lambda: [check(val) for val in values])
+    dicts = allocated(lambda: [check(val).as_dict() for val in values])
+
+    assert records[0] < dicts[0]
+    assert records[1] < dicts[1]
+
+
+def test_validator_patterns_not_looked_up(monkeypatch):
+    import re
+    from .. import types
+
+    checks = [
+        (types.uri(), 'https://uberspace.de/bla'),
+        (types.domain(), 'uberspace.de'),
+        (types.restricted_str(allowed_chars='a-z'), 'abc'),
+        (types.restricted_str(allowed_chars='a-z'), 'a-c'),
+        (types.restricted_str(regex='^[a-z]+$'), 'abc'),
+    ]
+    for check, value in checks:
+        check.validate_many([value])
+
+    def forbidden(*args, **kwargs):
+        raise AssertionError('pattern compiled (or looked up in the cache of re) during a check')
+
+    # all patterns are compiled ahead of time, a check does not even go
+    # through the cache of re.
+    for name in ('compile', 'match', 'search', 'fullmatch'):
+        monkeypatch.setattr(re, name, forbidden, raising=False)
+    for check, value in checks:
+        try:
+            check(value)
+        except ValueError:
+            pass
+        check.validate_many([value])
+
+
+@pytest.mark.parametrize("regex,value,valid", [
+    ("^[a-z][a-z0-9]+$", "abc1", True),
+    ("^[a-z][a-z0-9]+$", "1abc", False),
+    ("^[a-z]+$", "abc\n", False),
+    ("^(a+)+b$", "a" * 200 + "c", False),
+    ("^a|b$", "ab", False),
+])
+def test_type_restricted_str_linear(regex, value, valid):
+    from ..types import restricted_str
+
+    check = restricted_str(regex=regex, maxlen=None, linear=True)
+
+    if valid:
+        assert check(value) == value
+    else:
+        with pytest.raises(ValueError):
+            check(value)
+
+
+def test_type_restricted_str_linear_unsupported():
+    from ..types import restricted_str
+
+    with pytest.raises(ValueError) as excinfo:
+        restricted_str(regex=r"^(a)\1$", linear=True)
+    assert 'backreferences' in str(excinfo.value)
+
+
+def test_type_restricted_str_linear_maxlen(monkeypatch):
+    from ..types import restricted_str
+
+    check = restricted_str(regex="^a+$", maxlen=10, linear=True)
+
+    def match(value):
+        raise AssertionError('matched a value, which is too long')
+    monkeypatch.setattr(check._regex, 'match', match)
+
+    value, error = check.validate_many(['a' * 11])[0]
+    assert error.code == 'too_long'
+
+
+@pytest.mark.parametrize("allowed_chars", [
+    'a-z',
+    'a-z0-9_-',
+    '-a-c',
+    u'a-zäöüß',
+    r'\-\.\x41\u00e4 \t',
+    r'\w',
+    r'a\d',
+    '^a-z',
+    u'\u0000-\uffff',
+])
+def test_type_restricted_str_same_as_regex(allowed_chars):
+    import re
+    from ..types import InvalidCharacterError, restricted_str
+
+    check = restricted_str(allowed_chars=allowed_chars, minlen=0)
+    regex = re.compile(r'\A[{}]+\Z'.format(allowed_chars))
+    char_regex = re.compile(r'[{}]'.format(allowed_chars))
+
+    for value in ['', 'abc', 'a-c', 'A.', u'äb', '\t ', 'x_9', 'a]b', 'b' * 30, 'b' * 30 + '!', 'abc\n']:
+        error = check.validate_many([value])[0].error
+        assert (error is None) == bool(regex.match(value)), value
+        if isinstance(error, InvalidCharacterError):
+            # the first character, which is not in the class
+            assert not char_regex.match(error.char)
+            assert all(char_regex.match(c) for c in value[:error.index])
+
+
+@pytest.mark.parametrize("value,char,index", [
+    ('ab-c', '-', 2),
+    ('Abc', 'A', 0),
+    ('abc\n', '\n', 3),
+    ('a' * 30 + '!', '!', 30),
+])
+def test_type_restricted_str_invalid_char(value, char, index):
+    from ..types import InvalidCharacterError, restricted_str
+
+    check = restricted_str(allowed_chars='a-z')
+
+    with pytest.raises(InvalidCharacterError) as excinfo:
+        check(value)
+
+    assert excinfo.value.code == 'invalid_char'
+    assert excinfo.value.char == char
+    assert excinfo.value.index == index
+    assert 'position {}'.format(index + 1) in str(excinfo.value)
+
+
+def test_validator_cache():
+    from ..types import ValidationError, restricted_str
+
+    check = restricted_str(allowed_chars='a-z').enable_cache(2)
+    calls = []
+    validate = check._validate
+    check._validate = lambda val: calls.append(val) or validate(val)
+
+    assert check('abc') == 'abc'
+    assert check('abc') == 'abc'
+    for _ in range(2):
+        with pytest.raises(ValidationError) as excinfo:
+            check('a-c')
+        assert excinfo.value.code == 'invalid_char'
+    assert calls == ['abc', 'a-c']
+    assert check.cache_info() == (2, 2, 2, 2)
+
+    # the least recently used value is evicted first
+    check('abc')
+    check('xyz')
+    check('abc')
+    assert calls == ['abc', 'a-c', 'xyz']
+
+    assert [r.value for r in check.validate_many(['xyz', 'a-c', 'xyz'])] == ['xyz', None, 'xyz']
+    assert calls == ['abc', 'a-c', 'xyz', 'a-c']
+
+    check.cache_clear()
+    assert check.cache_info() == (0, 0, 2, 0)
+    check('abc')
+    assert calls[-1] == 'abc'
+
+
+def test_validator_cache_disabled():
+    from ..types import restricted_int
+
+    check = restricted_int()
+
+    assert check.cache_info() is None
+    check.cache_clear()
+    assert check('5') == 5
+
+
+def test_validator_cache_opt_out():
+    from ..types import Validator
+
+    class exists(Validator):
+        cacheable = False
+
+    with pytest.raises(ValueError):
+        exists().enable_cache()
+
+
+def test_validator_cache_suffix_list(tmpdir):
+    from .. import types
+
+    suffix_list = tmpdir.join('public_suffix_list.dat')
+    suffix_list.write('com\n')
+    check = types.domain().enable_cache()
+
+    try:
+        assert check('example.de') == 'example.de'
+        types.set_suffix_list(str(suffix_list))
+        with pytest.raises(ValueError):
+            check('example.de')
+        assert check.validate_many(['example.com'])[0].value == 'example.com'
+    finally:
+        types.set_suffix_list(None)
+
+    assert check('example.de') == 'example.de'
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+import os
+import stat
+import sys
+from distutils.version import LooseVersion
+
+import ansible.release
+import pytest
+
+ANSIBLE_VERSION = LooseVersion(ansible.release.__version__)
+SKIP_ANSIBLE_TESTS = (sys.version_info >= (3, 0) and ANSIBLE_VERSION < LooseVersion('2.4.0'))
+
+pytestmark = pytest.mark.skipif(SKIP_ANSIBLE_TESTS, reason="ansible <2.4 requires python2")
+
+PLAYBOOK = u"""
+- hosts: all
+  gather_facts: no
+  vars:
+    number: 1
+    float: 2.5
+    flag: yes
+    nothing: null
+    unsafe: !unsafe '{{ not templated }}'
+    nested: {a: [1, {b: c}], ümlaut: x}
+  tasks:
+    - debug: msg="{{ number }}"
+"""
+
+
+def _positions(data):
+    """ return all nodes of *data* with their types and positions """
+    nodes = []
+
+    def walk(obj):
+        nodes.append((type(obj), getattr(obj, 'ansible_pos', None)))
+        if isinstance(obj, dict):
+            for k, v in obj.items():
+                walk(k)
+                walk(v)
+        elif isinstance(obj, list):
+            for v in obj:
+                walk(v)
+
+    walk(data)
+    return nodes
+
+
+@pytest.fixture
+def playbook(tmpdir):
+    path = tmpdir.join('playbook.yml')
+    path.write_text(PLAYBOOK, 'utf-8')
+    return str(path)
+
+
+def test_encode_roundtrip(playbook):
+    from ansible.parsing.dataloader import DataLoader
+    from ..runners.yamlcache import _decode, _encode
+
+    data = DataLoader().load_from_file(playbook)
+    restored = _decode(_encode(data, playbook), playbook)
+
+    assert restored == data
+    assert _positions(restored) == _positions(data)
+
+
+def test_encode_json_data():
+    from ..runners.yamlcache import _decode, _encode
+
+    data = {'a': [1, None, {'b': u'c'}], 'd': 1.5}
+    restored = _decode(_encode(data, '/data.json'), '/data.json')
+    assert restored == data
+    assert _positions(restored) == _positions(data)
+
+
+@pytest.mark.parametrize("content", [
+    u'date: 2020-01-01\n',
+    u'binary: !!binary aGVsbG8=\n',
+])
+def test_encode_uncacheable(tmpdir, content):
+    from ansible.parsing.dataloader import DataLoader
+    from ..runners.yamlcache import Uncacheable, _encode
+
+    path = tmpdir.join('vars.yml')
+    path.write_text(content, 'utf-8')
+
+    with pytest.raises(Uncacheable):
+        _encode(DataLoader().load_from_file(str(path)), str(path))
+
+
+def test_encode_recursive():
+    from ..runners.yamlcache import Uncacheable, _encode
+
+    data = []
+    data.append(data)
+    with pytest.raises(Uncacheable):
+        _encode(data, '/data.yml')
+
+
+def test_cache(playbook, cache_dir):
+    from .. import cache
+    from ..runners.yamlcache import YAMLCache, YAML_CACHE, _entry_name
+
+    yaml_cache = YAMLCache.open()
+    key, data = yaml_cache.load(playbook)
+    assert data is None
+    assert yaml_cache.store(playbook, key, [{u'hosts': u'all'}])
+    key, encoded = yaml_cache.load(playbook)
+    assert yaml_cache.decode(encoded, playbook) == [{u"hosts": u"all"}]
+    assert (yaml_cache.hits, yaml_cache.misses) == (1, 1)
+
+    # the parsed files might only be readable by root
+    entry = os.path.join(cache.get_dir(YAML_CACHE), _entry_name(playbook))
+    assert stat.S_IMODE(os.stat(entry).st_mode) == 0o600
+
+    yaml_cache.reset_stats()
+    assert (yaml_cache.hits, yaml_cache.misses) == (0, 0)
+
+
+def test_cache_changed_file(playbook):
+    from ..runners.yamlcache import YAMLCache
+
+    yaml_cache = YAMLCache.open()
+    key, _ = yaml_cache.load(playbook)
+    yaml_cache.store(playbook, key, [1])
+
+    with open(playbook, 'a') as f:
+        f.write('\n')
+    assert yaml_cache.load(playbook)[1] is None
+
+
+@pytest.mark.parametrize("corrupt", [
+    lambda data: data[:-1],
+    lambda data: data.replace(b'\n[2,1]', b'\n[2,2]'),
+    lambda data: data.replace(b'"sha256"', b'"sha"'),
+    lambda data: b'garbage',
+])
+def test_cache_corrupted(playbook, corrupt):
+    from .. import cache
+    from ..runners.yamlcache import YAMLCache, YAML_CACHE, _entry_name
+
+    yaml_cache = YAMLCache.open()
+    key, _ = yaml_cache.load(playbook)
+    yaml_cache.store(playbook, key, [1])
+
+    entry = os.path.join(cache.get_dir(YAML_CACHE), _entry_name(playbook))
+    with open(entry, 'rb') as f:
+        data = f.read()
+    with open(entry, 'wb') as f:
+        f.write(corrupt(data))
+
+    assert yaml_cache.load(playbook)[1] is None
+
+
+def test_cache_untrusted(playbook, cache_dir):
+    from .. import cache
+    from ..runners.yamlcache import YAMLCache, YAML_CACHE
+
+    os.chmod(cache.get_dir(YAML_CACHE), 0o777)
+    assert YAMLCache.open() is None
+
+
+def test_cache_not_root(playbook, monkeypatch):
+    from .. import cache
+    from ..runners.yamlcache import YAMLCache
+
+    yaml_cache = YAMLCache.open()
+    monkeypatch.setattr(cache, 'can_write', lambda: False)
+    key, _ = yaml_cache.load(playbook)
+    assert not yaml_cache.store(playbook, key, [1])
+
+
+def test_loader_skips_parsing(playbook, monkeypatch):
+    from ansible.parsing.dataloader import DataLoader
+    from ..runners.ansibleexecutor import CachingDataLoader
+
+    cold = CachingDataLoader()
+    data = cold.load_from_file(playbook)
+    assert (cold.yaml_cache.hits, cold.yaml_cache.misses) == (0, 1)
+
+    def load(*args, **kwargs):
+        raise AssertionError('parsed again')
+
+    monkeypatch.setattr(DataLoader, 'load', load)
+    warm = CachingDataLoader()
+    assert warm.load_from_file(playbook) == data
+    # the in-memory cache of the loader is used for repeated loads
+    assert warm.load_from_file(playbook) == data
+    assert (warm.yaml_cache.hits, warm.yaml_cache.misses) == (1, 0)
+
+
+def test_loader_old_ansible(playbook, monkeypatch):
+    from ansible.parsing.dataloader import DataLoader
+    from ..runners.ansibleexecutor import CachingDataLoader
+
+    # the signature of DataLoader.load_from_file up to ansible 2.7
+    def load_from_file(self, file_name, cache=True, unsafe=False):
+        self._FILE_CACHE[self.path_dwim(file_name)] = [{'hosts': 'all'}]
+        return [{'hosts': 'all'}]
+
+    monkeypatch.setattr(DataLoader, 'load_from_file', load_from_file)
+    assert CachingDataLoader().load_from_file(playbook, cache=False) == [{'hosts': 'all'}]
+    assert CachingDataLoader().load_from_file(playbook) == [{'hosts': 'all'}]
+    assert CachingDataLoader().load_from_file(playbook) == [{'hosts': 'all'}]
+
+
+def test_loader_vault(tmpdir):
+    from ansible.parsing.vault import VaultSecret
+    from ..runners.ansibleexecutor import CachingDataLoader
+
+    secret = [('default', VaultSecret(b'secret'))]
+    loader = CachingDataLoader()
+    loader.set_vault_secrets(secret)
+    encrypted = loader._vault.encrypt(b'password: secret\n', secret[0][1])
+
+    path = tmpdir.join('vault.yml')
+    path.write_binary(encrypted)
+
+    assert loader.load_from_file(str(path)) == {'password': 'secret'}
+
+    loader = CachingDataLoader()
+    loader.set_vault_secrets(secret)
+    loader.load_from_file(str(path))
+    assert (loader.yaml_cache.hits, loader.yaml_cache.misses) == (0, 1)
+
+
+def test_runner_reports_stats(capsys, monkeypatch):
+    from ..runners.ansiblerunner import AnsibleRunner
+
+    playbook_path = '/tmp/paternoster-test-yamlcache.yml'
+    with open(playbook_path, 'w') as f:
+        f.write('- hosts: all\n  gather_facts: no\n  tasks:\n    - debug: msg=a\n')
+
+    monkeypatch.setattr(os, 'chdir', lambda *args, **kwargs: None)
+    assert AnsibleRunner(playbook_path, yaml_cache=True).run([], 2)
+    assert 'parsed YAML cache: 0 hits, 1 misses' in capsys.readouterr()[0]
+
+    assert AnsibleRunner(playbook_path, yaml_cache=True).run([], 2)
+    assert 'parsed YAML cache: 1 hits, 0 misses' in capsys.readouterr()[0]
+
+    # the cache is off by default
+    assert AnsibleRunner(playbook_path).run([], 2)
+    assert 'parsed YAML cache' not in capsys.readouterr()[0]
+
+
+def test_script_option():
+    from .. import shebang
+    from .mockrunner import MockRunner
+
+    class Runner(MockRunner):
+        def __init__(self, playbook, yaml_cache=False):
+            super(Runner, self).__init__()
+            self.yaml_cache = yaml_cache
+
+    p = shebang.create_paternoster('/playbook.yml', {'yaml_cache': True}, runner_class=Runner)
+    assert p._runner.yaml_cache is True
+
+
+@pytest.mark.parametrize("encoded", [
+    [9, 1],
+    [0, u'a'],
+    [3, 1, 1, u'key'],
+    [4, [2], 1],
+])
+def test_decode_invalid(encoded):
+    from ..runners.yamlcache import YAMLCache
+
+    with pytest.raises(ValueError):
+        YAMLCache.decode(encoded, '/data.yml')
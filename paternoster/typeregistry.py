@@ -0,0 +1,156 @@
+# resolves the type names used by scripts ("int", "paternoster.types.domain",
+# ...) to the functions argparse uses to convert and validate values.
+#
+# Each validator is created once for every distinct name and type_params and
+# then shared by all parameters using it, including its cache. This matters
+# most for paternoster-daemon, which loads many scripts and reloads them once
+# they change.
+#
+# Other packages can provide their own types through the entry point group
+# "paternoster.types". The name of the entry point is the name used by
+# scripts, e.g. in the setup.py of the package:
+#
+#   entry_points={
+#       'paternoster.types': ['example.username = example.types:username'],
+#   }
+#
+# Entry points are only searched for names, which are not known otherwise,
+# and only the one a script refers to is imported.
+from __future__ import absolute_import
+
+import threading
+
+from . import types
+
+ENTRY_POINT_GROUP = 'paternoster.types'
+TYPES_PREFIX = 'paternoster.types.'
+
+# these were always supported, type_params do not apply to them.
+BUILTIN_TYPES = {
+    'int': int,
+    'str': str,
+}
+
+
+def _find_entry_point(name):
+    """ return the entry point providing the type *name* or `None` """
+    try:
+        from importlib import metadata
+    except ImportError:
+        metadata = None
+
+    if metadata is not None:
+        entry_points = metadata.entry_points()
+        if hasattr(entry_points, 'select'):
+            found = entry_points.select(group=ENTRY_POINT_GROUP, name=name)
+        else:
+            found = [ep for ep in entry_points.get(ENTRY_POINT_GROUP, ()) if ep.name == name]
+    else:
+        import pkg_resources
+        found = pkg_resources.iter_entry_points(ENTRY_POINT_GROUP, name)
+
+    for entry_point in found:
+        return entry_point
+    return None
+
+
+def _freeze(value):
+    """ return a hashable version of *value* (e.g. type_params read from YAML) """
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class TypeRegistry(object):
+    def __init__(self):
+        self._types = dict(BUILTIN_TYPES)
+        self._validators = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, factory):
+        """ make *factory* (e.g. a Validator subclass) available to scripts as the type *name* """
+        with self._lock:
+            self._types[name] = factory
+
+    def _find(self, name):
+        if name.startswith(TYPES_PREFIX):
+            attr = name[len(TYPES_PREFIX):]
+            return getattr(types, attr) if attr in types.__all__ else None
+
+        entry_point = _find_entry_point(name)
+        if entry_point is None:
+            return None
+        try:
+            return entry_point.load()
+        except Exception as e:
+            raise ValueError('type {} could not be loaded: {}'.format(name, e))
+
+    def resolve(self, name):
+        """ return the factory of the type *name*, raises ValueError if it is unknown """
+        with self._lock:
+            factory = self._types.get(name)
+        if factory is not None:
+            return factory
+
+        factory = self._find(name)
+        if factory is None:
+            raise ValueError('unknown type ' + name)
+        self.register(name, factory)
+        return factory
+
+    def get(self, name, params=None):
+        """
+        Return the validator for the type *name*, created using *params* (the
+        type_params of a parameter). `cache` enables the cache of the
+        validator, `true` stands for the default size.
+
+        """
+        params = dict(params or {})
+        try:
+            key = (name, _freeze(params))
+            hash(key)
+        except TypeError:
+            # e.g. a set given by a python script, just don't share it
+            key = None
+
+        with self._lock:
+            validator = self._validators.get(key) if key is not None else None
+        if validator is not None:
+            return validator
+
+        factory = self.resolve(name)
+        if name in BUILTIN_TYPES:
+            return factory
+
+        cache_size = params.pop('cache', None)
+        try:
+            validator = factory(**params)
+        except TypeError as e:
+            raise ValueError('invalid type_params for {}: {}'.format(name, e))
+
+        if cache_size and not callable(getattr(validator, 'enable_cache', None)):
+            # e.g. a plain function registered through an entry point
+            raise ValueError('type {} does not support the cache type_param'.format(name))
+        if cache_size is True:
+            validator.enable_cache()
+        elif cache_size:
+            validator.enable_cache(cache_size)
+
+        if key is not None:
+            with self._lock:
+                validator = self._validators.setdefault(key, validator)
+        return validator
+
+    def clear(self):
+        """ forget all validators created so far """
+        with self._lock:
+            self._validators.clear()
+
+
+registry = TypeRegistry()
+
+
+def register_type(name, factory):
+    registry.register(name, factory)
@@ -1,11 +1,373 @@
 # -*- encoding: utf8 -*-
+import collections
+import functools
+import operator
+import os.path
 import re
+import threading
 
+import six
 import six.moves.urllib as urllib
 import tldextract
 
+from .. import linearregex
+from .. import suffixindex
 
-class domain:
+# loading the public suffix list takes a lot longer than validating a domain,
+# so all domains are checked using a single extractor. It is created once it
+# is needed first, see get_tld_extractor. A precompiled index (see
+# suffixindex.py) is used instead, if it has been installed.
+_tld_lock = threading.Lock()
+_tld_extractor = None
+_suffix_list = None
+_NOT_LOADED = object()
+_suffix_index = _NOT_LOADED
+# changed along with the suffix list, so cached domains are checked again.
+_suffix_generation = 0
+
+
+def set_suffix_list(path):
+    """
+    Use the public suffix list in the file *path* instead of the one cached
+    by tldextract (see `tldextract --update`) or bundled with it. `None`
+    switches back to the default.
+
+    """
+    global _suffix_list, _tld_extractor, _suffix_generation
+
+    if path is not None:
+        path = os.path.abspath(path)
+        if not os.path.isfile(path):
+            raise ValueError('suffix list {} does not exist'.format(path))
+
+    with _tld_lock:
+        _suffix_list = path
+        _tld_extractor = None
+        _suffix_generation += 1
+
+
+def _create_tld_extractor(suffix_list):
+    if suffix_list is None:
+        return tldextract.TLDExtract(suffix_list_urls=[])
+
+    url = 'file://' + suffix_list
+    try:
+        # tldextract 3+
+        return tldextract.TLDExtract(suffix_list_urls=[url], cache_dir=None, fallback_to_snapshot=False)
+    except TypeError:
+        return tldextract.TLDExtract(suffix_list_urls=[url], cache_file=False, fallback_to_snapshot=False)
+
+
+def get_tld_extractor():
+    """ return the process-wide TLDExtract instance, loading the suffix list on the first call """
+    global _tld_extractor
+
+    extractor = _tld_extractor
+    if extractor is None:
+        with _tld_lock:
+            if _tld_extractor is None:
+                extractor = _create_tld_extractor(_suffix_list)
+                # tldextract loads the list on its first use, which is not
+                # thread-safe. Do it while holding the lock.
+                extractor('example.com')
+                _tld_extractor = extractor
+            extractor = _tld_extractor
+    return extractor
+
+
+def get_suffix_index():
+    """ return the installed suffix index or `None`, if there is none """
+    global _suffix_index
+
+    index = _suffix_index
+    if index is _NOT_LOADED:
+        with _tld_lock:
+            if _suffix_index is _NOT_LOADED:
+                _suffix_index = suffixindex.load()
+            index = _suffix_index
+    return index
+
+
+def _get_splitter():
+    """ return a function splitting a domain like _split_domain, bound to the current suffix list """
+    index = get_suffix_index() if _suffix_list is None else None
+    if index is not None:
+        return index.split
+
+    extractor = get_tld_extractor()
+
+    def split(val):
+        extracted = extractor(val)
+        return extracted.domain, extracted.suffix
+    return split
+
+
+def _split_domain(val):
+    """ return the label right in front of the public suffix of *val* and the suffix itself """
+    return _get_splitter()(val)
+
+
+def preload_suffixes():
+    """ load the public suffix list (or its index) ahead of time, e.g. before forking """
+    _split_domain('example.com')
+
+
+class ValidationError(ValueError):
+    """ raised for invalid values, *code* names the reason independently of the message """
+
+    def __init__(self, code, message):
+        super(ValidationError, self).__init__(message)
+        self.code = code
+
+
+class InvalidCharacterError(ValidationError):
+    """ raised by restricted_str(allowed_chars=...), *char* is the first invalid character, found at *index* """
+    code = 'invalid_char'
+
+    # created without running any python code, the message is only built if
+    # it is shown.
+    __init__ = ValueError.__init__
+    char = property(lambda self: self.args[0])
+    index = property(lambda self: self.args[1])
+
+    def __str__(self):
+        return u'invalid character {!r} at position {}'.format(self.char, self.index + 1)
+
+
+class Record(object):
+    """
+    Base class of the immutable results returned by the validators. The
+    fields are named by `__slots__`, so records do not need an instance dict.
+
+    """
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            _set_field(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('{} is immutable'.format(type(self).__name__))
+
+    def __delattr__(self, name):
+        raise AttributeError('{} is immutable'.format(type(self).__name__))
+
+    # read-only mapping of the field names to their values, for
+    # compatibility with the dicts returned previously
+    def __getitem__(self, name):
+        if name not in self.__slots__:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def __contains__(self, name):
+        return name in self.__slots__
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    def get(self, name, default=None):
+        return getattr(self, name) if name in self.__slots__ else default
+
+    def keys(self):
+        return list(self.__slots__)
+
+    def items(self):
+        return [(name, getattr(self, name)) for name in self.__slots__]
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__
+        )
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(tuple(getattr(self, name) for name in self.__slots__))
+
+    def __repr__(self):
+        return '{}({})'.format(
+            type(self).__name__,
+            ', '.join('{}={!r}'.format(name, getattr(self, name)) for name in self.__slots__),
+        )
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+_set_field = object.__setattr__
+
+
+class Result(tuple):
+    """
+    The outcome of validating a single value, see `Validator.validate_many`.
+    Built from a (value, error) tuple in a single step, as there is one for
+    each value of a batch.
+
+    """
+    __slots__ = ()
+
+    value = property(operator.itemgetter(0))
+    error = property(operator.itemgetter(1))
+
+    def __repr__(self):
+        return 'Result(value={!r}, error={!r})'.format(*self)
+
+
+class URIResult(Record):
+    """ the components of a URI, see `uri` """
+    __slots__ = ('scheme', 'domain', 'path', 'full')
+
+    def __init__(self, scheme, domain, path, full):
+        _set_field(self, 'scheme', scheme)
+        _set_field(self, 'domain', domain)
+        _set_field(self, 'path', path)
+        _set_field(self, 'full', full)
+
+
+DEFAULT_CACHE_SIZE = 128
+
+CacheInfo = collections.namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+
+class ValidatorCache(object):
+    """
+    A bounded LRU cache of the results of a validator, keyed by the value.
+    Rejections are cached just like valid values. All cached results are
+    dropped, once the *token* passed to `get` changes.
+
+    """
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE):
+        if maxsize < 1:
+            raise ValueError('the cache size must be at least 1')
+
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._token = None
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def get(self, val, validate, token=None):
+        """ return the cached result for *val*, calling *validate* on a miss """
+        with self._lock:
+            if token != self._token:
+                self._entries.clear()
+                self._token = token
+            try:
+                result = self._entries.pop(val, None)
+            except TypeError:
+                # unhashable values are simply not cached
+                return validate(val)
+            if result is not None:
+                # re-inserting marks the entry as the most recently used one
+                self._entries[val] = result
+                self.hits += 1
+                return result
+            self.misses += 1
+
+        result = validate(val)
+        with self._lock:
+            if token == self._token:
+                self._entries[val] = result
+                if len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return result
+
+
+class _ValidatorMeta(type):
+    """ compiles all `*_REGEX` attributes of a class into `*_PATTERN` ones, once it is defined """
+
+    def __init__(cls, name, bases, attrs):
+        super(_ValidatorMeta, cls).__init__(name, bases, attrs)
+        for attr, value in list(attrs.items()):
+            if attr.endswith('_REGEX'):
+                setattr(cls, attr[:-len('_REGEX')] + '_PATTERN', re.compile(value))
+
+
+class Validator(six.with_metaclass(_ValidatorMeta, object)):
+    """
+    Base class of all types. Subclasses implement `_validate`, which returns
+    a tuple of the converted value and `None`, or of `None` and the
+    ValidationError describing why the value is invalid, instead of raising it.
+
+    Regular expressions are given as `<NAME>_REGEX` class attributes and used
+    through the `<NAME>_PATTERN` attributes, which hold the compiled version.
+
+    """
+
+    # validators, whose results do not only depend on the value itself (e.g.
+    # on files), must not be cached.
+    cacheable = True
+    _cache = None
+
+    def _validate(self, val):
+        raise NotImplementedError
+
+    def _batch_validator(self):
+        """ return the function validate_many uses for each value """
+        return self._validate
+
+    def _cache_token(self):
+        """ return a token for the external state results depend on, see ValidatorCache """
+        return None
+
+    def enable_cache(self, maxsize=DEFAULT_CACHE_SIZE):
+        """ cache the results for up to *maxsize* distinct values, returns the validator itself """
+        if not self.cacheable:
+            raise ValueError('the results of {} cannot be cached'.format(type(self).__name__))
+        self._cache = ValidatorCache(maxsize)
+        return self
+
+    def cache_info(self):
+        """ return the hits, misses, maximum and current size of the cache, or `None` if it is disabled """
+        return self._cache.info() if self._cache is not None else None
+
+    def cache_clear(self):
+        if self._cache is not None:
+            self._cache.clear()
+
+    def __call__(self, val):
+        if self._cache is None:
+            value, error = self._validate(val)
+        else:
+            value, error = self._cache.get(val, self._validate, self._cache_token())
+
+        if error is not None:
+            # errors may be raised repeatedly, if they are cached
+            error.__traceback__ = None
+            raise error
+        return value
+
+    def validate_many(self, values):
+        """
+        Validate all *values* at once, returning a `Result` for each of them.
+        Invalid values do not raise an exception, the error is part of the
+        result instead.
+
+        """
+        validate = self._batch_validator()
+        cache = self._cache
+        if cache is not None:
+            token = self._cache_token()
+            return [Result(cache.get(val, validate, token)) for val in values]
+        return [Result(validate(val)) for val in values]
+
+
+class domain(Validator):
     __name__ = 'domain'
 
     DOMAIN_REGEX = r'\A(([a-zA-Z0-9]|[a-zA-Z0-9][a-zA-Z0-9\-]*[a-zA-Z0-9])\.)*([A-Za-z0-9]|[A-Za-z0-9][A-Za-z0-9\-]*[A-Za-z0-9])\Z'  # noqa
@@ -14,12 +376,16 @@ class domain:
         self._wildcard = wildcard
         self.maxlen = maxlen
 
-    def __call__(self, val):
-        val = val.encode('idna').decode('ascii')
+    def _validate(self, val, split=None):
+        try:
+            val = val.encode('idna').decode('ascii')
+        except UnicodeError as e:
+            return None, ValidationError('invalid_encoding', str(e))
         domain = val
 
         if '@' in domain:
-            raise ValueError(
+            return None, ValidationError(
+                'email',
                 "this looks like an email-adress, "
                 "try only supplying the part after the @"
             )
@@ -30,26 +396,31 @@ class domain:
         if self._wildcard and val.startswith('*.'):
             val = val[2:]
 
-        extracted = tldextract.TLDExtract(suffix_list_urls=[])(val)
+        if len(val) > self.maxlen or max(map(len, val.split('.'))) > 63:
+            return None, ValidationError('too_long', 'domain too long')
+        if '.' not in val:
+            return None, ValidationError('too_few_components', 'domain has too few components')
+        if not self.DOMAIN_PATTERN.match(val):
+            return None, ValidationError('invalid', 'invalid domain')
+
+        registered, suffix = (split or _split_domain)(val)
+        if not suffix:
+            return None, ValidationError('invalid_suffix', 'invalid domain suffix')
+        if not registered:
+            return None, ValidationError('invalid', 'invalid domain')
 
-        if (
-            any(map(lambda p: len(p) > 63, val.split('.')))
-            or len(val) > self.maxlen
-        ):
-            raise ValueError('domain too long')
-        if val.count('.') < 1:
-            raise ValueError('domain has too few components')
-        if not re.match(self.DOMAIN_REGEX, val):
-            raise ValueError('invalid domain')
-        if not extracted.suffix:
-            raise ValueError('invalid domain suffix')
-        if not extracted.domain:
-            raise ValueError('invalid domain')
+        return domain.lower(), None
 
-        return domain.lower()
+    def _batch_validator(self):
+        # look up the suffix list (or index) once for the whole batch.
+        return functools.partial(self._validate, split=_get_splitter())
 
+    def _cache_token(self):
+        return _suffix_generation
 
-class uri:
+
+class uri(Validator):
+    """ returns the components of the URI as an `URIResult` """
     __name__ = 'URI'
 
     SCHEME_REGEX = r'\A[a-z][a-z0-9+.-]*\Z'
@@ -59,68 +430,76 @@ class uri:
     PATH_MAX_LEN = 512
 
     def __init__(self, optional_scheme=True, optional_domain=True, domain_options={}):
-        self._required = filter(bool, [
-            'scheme' if not optional_scheme else None,
-            'domain' if not optional_domain else None,
-        ])
+        self._require_scheme = not optional_scheme
+        self._require_domain = not optional_domain
         self._domaincheck = domain(domain_options)
 
-    def __call__(self, val):
+    def _validate(self, val, split=None):
         parsed = urllib.parse.urlsplit(val)
-
-        result = {
-            'scheme': parsed.scheme,
-            'domain': parsed.netloc,
-            'path': parsed.path,
-        }
+        scheme = parsed.scheme
+        domain = parsed.netloc
+        path = parsed.path
 
         # correctly parse scheme-less URIs like "google.com/foobar"
-        if not result['domain']:
-            maybedomain, _, maybepath = result['path'].partition('/')
+        if not domain:
+            maybedomain, _, maybepath = path.partition('/')
 
             if '.' in maybedomain:
-                result['domain'] = maybedomain
-                result['path'] = maybepath
+                domain = maybedomain
+                path = maybepath
 
         # === check scheme
-        if result['scheme']:
-            if len(result['scheme']) > self.SCHEME_MAX_LEN:
-                raise ValueError('scheme too long')
-            elif not re.match(self.SCHEME_REGEX, result['scheme']):
-                raise ValueError('invalid scheme')
+        if scheme:
+            if len(scheme) > self.SCHEME_MAX_LEN:
+                return None, ValidationError('scheme_too_long', 'scheme too long')
+            elif not self.SCHEME_PATTERN.match(scheme):
+                return None, ValidationError('invalid_scheme', 'invalid scheme')
 
-            result['scheme'] = result['scheme'].lower()
+            scheme = scheme.lower()
 
         # === check domain
-        if result['domain']:
-            result['domain'] = self._domaincheck(result['domain'])
+        if domain:
+            domain, error = self._domaincheck._validate(domain, split)
+            if error is not None:
+                return None, error
 
         # === check path
-        result['path'] = '/' + result['path'].strip('/')
-        if len(result['path']) > self.PATH_MAX_LEN:
-            raise ValueError('path too long')
-        elif not re.match(self.PATH_REGEX, result['path']):
-            raise ValueError('invalid path')
+        path = '/' + path.strip('/')
+        if len(path) > self.PATH_MAX_LEN:
+            return None, ValidationError('path_too_long', 'path too long')
+        elif not self.PATH_PATTERN.match(path):
+            return None, ValidationError('invalid_path', 'invalid path')
+
+        missing = []
+        if self._require_scheme and not scheme:
+            missing.append('scheme')
+        if self._require_domain and not domain:
+            missing.append('domain')
+        if missing:
+            return None, ValidationError('missing', 'missing ' + ', '.join(missing))
 
         # normalize falsy values
-        result = {k: v if v else '' for k, v in result.items()}
-
-        missing = [k for k in self._required if not result[k]]
-        if missing:
-            raise ValueError('missing ' + ', '.join(missing))
+        scheme = scheme or ''
+        domain = domain or ''
 
-        if result['scheme']:
-            result['full'] = u'{scheme}://{domain}{path}'.format(**result)
+        if scheme:
+            full = u'{}://{}{}'.format(scheme, domain, path)
         else:
-            result['full'] = u'{domain}{path}'.format(**result)
+            full = u'{}{}'.format(domain, path)
 
-        return result
+        return URIResult(scheme, domain, path, full), None
+
+    def _batch_validator(self):
+        return functools.partial(self._validate, split=_get_splitter())
+
+    def _cache_token(self):
+        return _suffix_generation
 
 
-class restricted_str:
+class restricted_str(Validator):
     __name__ = 'string'
 
-    def __init__(self, allowed_chars=None, regex=None, minlen=1, maxlen=255):
+    def __init__(self, allowed_chars=None, regex=None, minlen=1, maxlen=255, linear=False):
         if minlen is not None and maxlen is not None and minlen > maxlen:
             raise ValueError('minlen must be smaller than maxlen')
         if not allowed_chars and not regex:
@@ -128,32 +507,61 @@ class restricted_str:
         if allowed_chars and regex:
             raise ValueError('allowed_chars or regex are mutally exclusive')
 
+        self._prefix_regex = None
         if allowed_chars:
             # construct a regex matching a arbitrary number of characters within
             # the given set.
             self._regex = re.compile(r'\A[{}]+\Z'.format(allowed_chars))
+            # the longest valid prefix ends at the first invalid character.
+            self._prefix_regex = re.compile(r'[{}]*'.format(allowed_chars))
         elif regex:
             if not regex.startswith('^') or not regex.endswith('$'):
                 raise ValueError('regex must be anchored')
 
-            # replace $ at the end with \Z, so we can't match "a\n" for "^a$"
-            regex = r'\A' + regex[1:-1] + r'\Z'
-            self._regex = re.compile(regex)
+            if linear:
+                # only ever matches the whole value, in linear time.
+                self._regex = linearregex.LinearRegex(regex[1:-1])
+            else:
+                # replace $ at the end with \Z, so we can't match "a\n" for "^a$"
+                regex = r'\A' + regex[1:-1] + r'\Z'
+                self._regex = re.compile(regex)
 
         self._minlen = minlen
         self._maxlen = maxlen
+        # the bounds used by __call__, without the checks for None
+        self._lengths = (minlen or 0, maxlen if maxlen is not None else float('inf'))
 
     def __call__(self, val):
+        # values of the right length are checked right away, without
+        # building a result. Everything else (including the cache) is left
+        # to Validator.
+        if self._cache is None and self._lengths[0] <= len(val) <= self._lengths[1]:
+            if self._regex.match(val):
+                return val
+            raise self._invalid(val)
+        return super(restricted_str, self).__call__(val)
+
+    def _validate(self, val):
         if self._maxlen is not None and len(val) > self._maxlen:
-            raise ValueError('string is too long (must be <= {})'.format(self._maxlen))
+            return None, ValidationError('too_long', 'string is too long (must be <= {})'.format(self._maxlen))
         if self._minlen is not None and len(val) < self._minlen:
-            raise ValueError('string is too short (must be >= {})'.format(self._minlen))
-        if not self._regex.match(val):
-            raise ValueError('invalid value')
-        return val
+            return None, ValidationError('too_short', 'string is too short (must be >= {})'.format(self._minlen))
 
+        if self._regex.match(val):
+            return val, None
+        return None, self._invalid(val)
 
-class restricted_int:
+    def _invalid(self, val):
+        """ return the error for *val*, which does not match """
+        if self._prefix_regex is not None:
+            # find the offending character, only needed for invalid values.
+            index = self._prefix_regex.match(val).end()
+            if index < len(val):
+                return InvalidCharacterError(val[index], index)
+        return ValidationError('invalid', 'invalid value')
+
+
+class restricted_int(Validator):
     __name__ = 'integer'
 
     def __init__(self, minimum=None, maximum=None):
@@ -175,18 +583,18 @@ class restricted_int:
         self._minimum = minimum
         self._maximum = maximum
 
-    def __call__(self, val):
+    def _validate(self, val):
         try:
             val = int(val)
-        except TypeError:
-            raise ValueError('invalid integer')
+        except (ValueError, TypeError):
+            return None, ValidationError('invalid', 'invalid integer')
 
         if self._minimum is not None and val < self._minimum:
-            raise ValueError('value too small (must be >= {})'.format(self._minimum))
+            return None, ValidationError('too_small', 'value too small (must be >= {})'.format(self._minimum))
         if self._maximum is not None and val > self._maximum:
-            raise ValueError('value too big (must be <= {})'.format(self._maximum))
+            return None, ValidationError('too_big', 'value too big (must be <= {})'.format(self._maximum))
 
-        return val
+        return val, None
 
 
 __all__ = [
@@ -21,7 +21,11 @@ setup(name='paternoster',
           'paternoster.types',
       ],
       entry_points={
-          'console_scripts': ['paternoster=paternoster.shebang:main'],
+          'console_scripts': [
+              'paternoster=paternoster.shebang:main',
+              'paternoster-daemon=paternoster.daemon:main',
+              'paternoster-compile-suffixes=paternoster.suffixindex:main',
+          ],
       },
       install_requires=[
           'tldextract>=2.0.1',